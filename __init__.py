@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Ponto de entrada do pacote.
+
+As classes da biblioteca são resolvidas sob demanda, no primeiro acesso ao
+atributo correspondente, de forma que um processo que só usa o S3 não carrega
+o psycopg2 ou o smtplib. Ex.:
+
+    import aws_python
+    s3 = aws_python.AWSS3()
+'''
+
+import importlib
+import sys
+import types
+
+
+# Nome exportado -> módulo onde ele é definido
+_lazyAttributes = {
+    'AsyncKinesis': 'asynckinesis',
+    'AWSCloudWatch': 'aws_cloudwatch',
+    'AWSDynamoDB': 'aws_dynamodb',
+    'AWSEC2': 'aws_ec2',
+    'AWSElasticsearch': 'aws_elasticsearch',
+    'AWSElb': 'aws_elb',
+    'AWSEmr': 'aws_emr',
+    'AWSIam': 'aws_iam',
+    'AWSKinesis': 'aws_kinesis',
+    'AWSKinesisFirehose': 'aws_kinesis_firehose',
+    'AWSLambda': 'aws_lambda',
+    'AWSOpsWorks': 'aws_opsworks',
+    'AWSRDS': 'aws_rds',
+    'AWSRedshift': 'aws_redshift',
+    'AWSRoute53': 'aws_route53',
+    'AWSS3': 'aws_s3',
+    'AWSSns': 'aws_sns',
+    'AWSSQS': 'aws_sqs',
+    'ClientRegistry': 'clientregistry',
+    'Configuration': 'configuration',
+    'Mail': 'mail',
+    'TimeoutException': 'timeoutexception',
+    'Utils': 'utils'
+}
+
+__all__ = sorted(_lazyAttributes.keys())
+
+
+class _LazyModule(types.ModuleType):
+    '''
+    Módulo do pacote com resolução tardia dos atributos exportados.
+    '''
+
+    def __getattr__(self, name):
+        moduleName = _lazyAttributes.get(name)
+        if moduleName is None:
+            raise AttributeError("module '%s' has no attribute '%s'" % (self.__name__, name))
+
+        module = importlib.import_module('.' + moduleName, self.__name__)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys()) | set(_lazyAttributes.keys()))
+
+
+_package = _LazyModule(__name__, __doc__)
+_package.__dict__.update(globals())
+# Mantém referência ao módulo original: no Python 2 os globais de um módulo
+# descartado são anulados, o que quebraria o __getattr__ acima.
+_package._originalModule = sys.modules[__name__]
+sys.modules[__name__] = _package
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Interface asyncio para o Kinesis.
+
+Requer Python 3.6+ (async/await e geradores assíncronos); o restante da
+biblioteca continua compatível com Python 2. Ex.:
+
+    kinesis = AsyncKinesis()
+    await kinesis.putRecord(b'...', 'chave')
+    async for record in kinesis.consume('meu-stream'):
+        ...
+    await kinesis.close()
+'''
+
+from aws_kinesis import AWSKinesis
+from clientregistry import ClientRegistry
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import functools
+import logging
+
+
+class AsyncKinesis:
+    '''
+    Adaptador asyncio de acesso ao Kinesis.
+
+    As chamadas ao cliente boto3 (bloqueantes) são executadas em um pool de
+    threads dimensionado pelo pool de conexões HTTP do ClientRegistry, de
+    forma que o event loop nunca fica bloqueado e várias requisições trafegam
+    em paralelo sobre as mesmas conexões.
+
+    putRecord() usa um KinesisProducer por stream: milhares de chamadas
+    concorrentes são agrupadas em requisições PutRecords, com reenvio dos
+    registros que falharem, e cada uma aguarda somente o seu resultado.
+    '''
+
+    def __init__(self, kinesis=None, maxConcurrency=None, **producerArgs):
+        '''
+        Construtor
+
+        :param kinesis: Instância de AWSKinesis; se omitida, é criada com a
+                        configuração da aplicação
+        :param maxConcurrency: Número máximo de requisições simultâneas; por padrão,
+                               o número de conexões por cliente do ClientRegistry
+        :param producerArgs: Parâmetros dos produtores usados em putRecord (ver
+                             KinesisProducer: lingerTime, aggregate, etc)
+        '''
+        if kinesis is None:
+            kinesis = AWSKinesis()
+        if maxConcurrency is None:
+            maxConcurrency = ClientRegistry.maxPoolConnections
+
+        self.kinesis = kinesis
+        self.executor = ThreadPoolExecutor(max_workers=maxConcurrency)
+        self.producerArgs = producerArgs
+        self.maxPendingPuts = producerArgs.get('maxBufferedRecords', 100000)
+        self.producers = {}
+        self.pendingPuts = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+
+    async def _call(self, method, *args, **kwargs):
+        '''
+        Executa um método bloqueante no pool de threads.
+        '''
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(method, *args, **kwargs))
+
+    def _getProducer(self, streamName):
+        producer = self.producers.get(streamName)
+        if producer is None:
+            producer = self.producers[streamName] = self.kinesis.createProducer(
+                streamName, **self.producerArgs)
+        return producer
+
+    async def putRecord(self, data, partitionKey=None, explicitHashKey=None, streamName=None):
+        '''
+        Insere um registro no Kinesis, agrupado em lote com os demais registros
+        pendentes.
+
+        :param data: Conteúdo do registro (bytes ou texto, codificado em UTF-8)
+        :param partitionKey: Partition key; se omitida, é gerada aleatoriamente
+        :param explicitHashKey: Hash key explícita, para escolher o shard de destino
+        :param streamName: Nome do stream de destino
+
+        :return: {'ShardId', 'SequenceNumber'} do registro inserido
+        '''
+        # O semáforo limita os registros pendentes ao tamanho do buffer dos
+        # produtores, para que put() nunca bloqueie o event loop
+        if self.pendingPuts is None:
+            self.pendingPuts = asyncio.Semaphore(self.maxPendingPuts)
+
+        await self.pendingPuts.acquire()
+        try:
+            future = self._getProducer(streamName).put(data, partitionKey, explicitHashKey)
+        except BaseException:
+            self.pendingPuts.release()
+            raise
+
+        # A vaga só é liberada quando o registro sai do produtor, mesmo que o
+        # chamador desista antes
+        wrapped = asyncio.wrap_future(future)
+        wrapped.add_done_callback(self._releasePendingPut)
+        # shield: o cancelamento do chamador (ex.: asyncio.wait_for) não pode
+        # cancelar o Future do produtor compartilhado
+        return await asyncio.shield(wrapped)
+
+    def _releasePendingPut(self, wrapped):
+        self.pendingPuts.release()
+        if not wrapped.cancelled():
+            # Marca a exceção como lida quando o chamador já desistiu
+            wrapped.exception()
+
+    async def putRecords(self, records, streamName=None):
+        '''
+        Insere registros em lote (até 500) no Kinesis (ver AWSKinesis.putRecords).
+        '''
+        return await self._call(self.kinesis.putRecords, records, streamName)
+
+    async def getShardList(self, streamName=None, getOnlyOpenedShards=True):
+        '''
+        Retorna lista de shards do stream (ver AWSKinesis.getShardList).
+        '''
+        return await self._call(self.kinesis.getShardList, streamName, getOnlyOpenedShards)
+
+    async def getShardIterator(self, shardId, iteratorType='TRIM_HORIZON', sequenceNumber=None,
+                               streamName=None):
+        '''
+        Recupera um iterador de leitura de um shard (ver AWSKinesis.getShardIterator).
+        '''
+        return await self._call(self.kinesis.getShardIterator, shardId, iteratorType,
+                                sequenceNumber, streamName)
+
+    async def getRecords(self, shardIterator, limit=None):
+        '''
+        Lê registros de um shard (ver AWSKinesis.getRecords).
+        '''
+        return await self._call(self.kinesis.getRecords, shardIterator, limit)
+
+    async def consume(self, streamName=None, iteratorType='LATEST', shardIds=None,
+                      batchSize=1000, pollInterval=1.0, deaggregate=True, queueSize=10000):
+        '''
+        Gerador assíncrono dos registros de um stream, lidos de todos os shards
+        em paralelo. Cada registro recebe a chave ShardId com o shard de origem.
+
+        Sem shardIds, os shards filhos (gerados por split ou merge) são
+        descobertos e lidos desde o início assim que os pais terminam.
+
+        :param streamName: Nome do stream
+        :param iteratorType: Posição inicial dos shards existentes (LATEST ou TRIM_HORIZON)
+        :param shardIds: Lista de shards a ler; se omitida, lê o stream inteiro
+        :param batchSize: Número máximo de registros por GetRecords
+        :param pollInterval: Espera entre leituras de um shard sem registros novos, em segundos
+        :param deaggregate: Desagrega registros no formato do KPL
+        :param queueSize: Número máximo de registros lidos e ainda não consumidos
+        '''
+        queue = asyncio.Queue(maxsize=queueSize)
+        readers = {}
+        finished = set()
+        initialShards = None
+
+        async def readShard(shardId, shardIteratorType):
+            try:
+                lastSequenceNumber = None
+                shardIterator = await self.getShardIterator(shardId, shardIteratorType,
+                                                            streamName=streamName)
+                while shardIterator is not None:
+                    try:
+                        response = await self.getRecords(shardIterator, batchSize)
+                    except Exception as e:
+                        logging.warning('Falha na leitura do shard %s: %s', shardId, e)
+                        await asyncio.sleep(pollInterval)
+                        # O iterador pode ter expirado: retoma após o último registro lido
+                        if lastSequenceNumber is None:
+                            shardIterator = await self.getShardIterator(
+                                shardId, shardIteratorType, streamName=streamName)
+                        else:
+                            shardIterator = await self.getShardIterator(
+                                shardId, 'AFTER_SEQUENCE_NUMBER', lastSequenceNumber, streamName)
+                        continue
+
+                    records = response.get('Records', [])
+                    if records:
+                        lastSequenceNumber = records[-1]['SequenceNumber']
+                        if deaggregate:
+                            records = self.kinesis.deaggregateRecords(records)
+                        for record in records:
+                            record['ShardId'] = shardId
+                            await queue.put((shardId, record))
+
+                    shardIterator = response.get('NextShardIterator')
+                    if shardIterator is not None and (not records or
+                                                      not response.get('MillisBehindLatest')):
+                        await asyncio.sleep(pollInterval)
+                await queue.put((shardId, None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put((shardId, e))
+
+        async def startReadyShards(shardList=None):
+            if shardList is None:
+                shardList = await self.getShardList(streamName, getOnlyOpenedShards=False)
+            if shardIds is not None:
+                shardList = [shardInfo for shardInfo in shardList
+                             if shardInfo['ShardId'] in shardIds]
+            knownShards = set(shardInfo['ShardId'] for shardInfo in shardList)
+            for shardInfo in shardList:
+                shardId = shardInfo['ShardId']
+                if shardId in readers or shardId in finished:
+                    continue
+                parents = [shardInfo.get('ParentShardId'), shardInfo.get('AdjacentParentShardId')]
+                if all(parent is None or parent not in knownShards or parent in finished
+                       for parent in parents):
+                    shardIteratorType = iteratorType if shardId in initialShards else 'TRIM_HORIZON'
+                    readers[shardId] = asyncio.ensure_future(readShard(shardId, shardIteratorType))
+
+        try:
+            shardList = await self.getShardList(streamName, getOnlyOpenedShards=False)
+            initialShards = set(shardInfo['ShardId'] for shardInfo in shardList)
+            await startReadyShards(shardList)
+            while readers:
+                shardId, item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                if item is None:
+                    # Shard fechado e lido até o fim: libera a leitura dos filhos
+                    readers.pop(shardId, None)
+                    finished.add(shardId)
+                    await startReadyShards()
+                    continue
+                yield item
+        finally:
+            for task in readers.values():
+                task.cancel()
+
+    async def close(self):
+        '''
+        Envia os registros pendentes, encerra os produtores e o pool de threads.
+        '''
+        for producer in list(self.producers.values()):
+            await self._call(producer.close)
+        self.producers = {}
+        self.executor.shutdown(wait=True)
@@ -6,5 +6,4 @@ from datetime import datetime
 from datetime import timedelta
 
 import base64
-import boto3
 import time
\ No newline at end of file
@@ -1,25 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from clientregistry import ClientRegistry
 from configuration import Configuration
 from datetime import datetime
 from datetime import timedelta
 
 import base64
-import boto3
 import time
 
 class AWSEC2:
-	'''
-	Classe para gerenciamento de instâncias do EC2
+    '''
+    Classe para gerenciamento de instâncias do EC2
 
-	EC2 = Elastic Cloud Compute
-	'''
-	client = None
-	config = None
+    EC2 = Elastic Cloud Compute
+    '''
+    client = None
+    config = None
 
-	def __init__(self, awsAccessKey=None, awsSecretAccessKey=None, awsRegion=None):
-		'''
+    def __init__(self, awsAccessKey=None, awsSecretAccessKey=None, awsRegion=None):
+        '''
         Construtor
 
         :param awsAccessKey: Chave pública do usuário para acesso na AWS
@@ -47,10 +47,7 @@ class AWSEC2:
         else:
             region = awsRegion
 
-        self.client = boto3.client('ec2',
-                                   aws_access_key_id=accessKey,
-                                   aws_secret_access_key=secretAccessKey,
-                                   region_name=region)
+        self.client = ClientRegistry.getClient('ec2', accessKey, secretAccessKey, region)
 
     def startInstance(self, instanceCount, instanceConfig):
     	pass
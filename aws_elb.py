@@ -6,7 +6,6 @@ from datetime import datetime
 from datetime import timedelta
 
 import base64
-import boto3
 import time
 
 class AWSElb:
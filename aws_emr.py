@@ -1,12 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from clientregistry import ClientRegistry
 from configuration import Configuration
 from datetime import datetime
 from datetime import timedelta
 
 import base64
-import boto3
 import time
 
 
@@ -48,10 +48,7 @@ class AWSEmr:
         else:
             region = awsRegion
 
-        self.client = boto3.client('emr',
-                                   aws_access_key_id=accessKey,
-                                   aws_secret_access_key=secretAccessKey,
-                                   region_name=region)
+        self.client = ClientRegistry.getClient('emr', accessKey, secretAccessKey, region)
 
     def getClusterListFromCurrentDate(self, getFullData=True):
     	'''
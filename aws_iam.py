@@ -1,20 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from clientregistry import ClientRegistry
 from configuration import Configuration
 from datetime import datetime
 from datetime import timedelta
 
 import base64
-import boto3
 import time
 
 class AWSIam:
-	client = None
-	config = None
+    client = None
+    config = None
 
-	def __init__(self):
-		'''
+    def __init__(self, awsAccessKey=None, awsSecretAccessKey=None, awsRegion=None):
+        '''
         Construtor
 
         :param awsAccessKey: Chave pública do usuário para acesso na AWS
@@ -42,10 +42,7 @@ class AWSIam:
         else:
             region = awsRegion
 
-        self.client = boto3.client('iam',
-                                   aws_access_key_id=accessKey,
-                                   aws_secret_access_key=secretAccessKey,
-                                   region_name=region)
+        self.client = ClientRegistry.getClient('iam', accessKey, secretAccessKey, region)
 
     def createUpdateUser(self, clientId, userData):
     	pass
@@ -1,8 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from clientregistry import ClientRegistry
 from configuration import Configuration
-from boto import kinesis
+from kinesisconsumer import KinesisConsumer
+from kinesismetrics import KinesisMetrics
+from kinesismetrics import KinesisMetricsExporter
+from kinesismetrics import getErrorCode
+from kinesismetrics import logSnapshot
+from kinesisaggregation import KinesisAggregator
+from kinesisaggregation import deaggregate
+from kinesispartitioner import KinesisPartitioner
+from kinesispartitioner import MODE_BALANCED
+from kinesispartitioner import MODE_HASH
+from kinesisproducer import KinesisProducer
+from kinesisresharder import KinesisReshardPlanner
+from timeoutexception import TimeoutException
+import time
 import uuid
 import logging
 
@@ -11,30 +25,46 @@ class AWSKinesis:
     Adaptador de acesso ao Kinesis
     '''
 
-    # Objeto de conexão com o Kinesis
-    conn = None
+    # Cliente boto3 do Kinesis
+    client = None
     # Instância da configuração da aplicação
     config = None
+    # Particionadores ativos, por nome de stream (ver enablePartitioner)
+    partitioners = None
+    # Métricas de escrita por stream e por shard (ver KinesisMetrics)
+    metrics = None
+    # Exportador periódico das métricas, quando ativo
+    metricsExporter = None
 
-    def __init__(self, aws_region=None, access_key=None, secret_access_key=None):
+    def __init__(self, aws_region=None, access_key=None, secret_access_key=None,
+                 endpoint_url=None):
         '''
         Construtor
 
         :param aws_region: Nome da região global com a qual será feita a conexão
         :param access_key: Chave pública de acesso do usuário
         :param secret_access_key: Chave secreta de acesso do usuário
+        :param endpoint_url: Endpoint alternativo do Kinesis (ex.: um Kinesis local
+                             para testes); se omitido, usa aws.kinesis.endpoint_url
+                             da configuração, quando definido
         '''
         configWrapper = Configuration()
         self.config = configWrapper.getConfigurationFromFile()
-        
+        self.partitioners = {}
+        self.metrics = KinesisMetrics()
+
+        if endpoint_url is None or not endpoint_url:
+            endpoint_url = self.config['aws']['kinesis'].get('endpoint_url') or None
+
         if access_key is not None and secret_access_key is not None and aws_region is not None:
-            self.conn = kinesis.connect_to_region(aws_region,
-                                                  aws_access_key_id=access_key,
-                                                  aws_secret_access_key=secret_access_key)
+            self.client = ClientRegistry.getClient('kinesis', access_key, secret_access_key,
+                                                   aws_region, endpoint_url)
         else:
-            self.conn = kinesis.connect_to_region(self.config['aws']['awsAuth']['region'],
-                                                  aws_access_key_id=self.config['aws']['awsAuth']['access_key'],
-                                                  aws_secret_access_key=self.config['aws']['awsAuth']['secret_access_key'])
+            self.client = ClientRegistry.getClient('kinesis',
+                                                   self.config['aws']['awsAuth']['access_key'],
+                                                   self.config['aws']['awsAuth']['secret_access_key'],
+                                                   self.config['aws']['awsAuth']['region'],
+                                                   endpoint_url)
 
     def createStream(self, streamName=None, shardNumber=1):
         '''
@@ -52,49 +82,80 @@ class AWSKinesis:
             str_name = streamName
 
         if shardNumber < 1:
-            raise Exception, "O stream deve ser inicializado com ao menos 1 shard"
+            raise Exception("O stream deve ser inicializado com ao menos 1 shard")
 
-        self.conn.create_stream(str_name, shardNumber)
-        return self.conn.describe_stream(str_name)
+        self.client.create_stream(StreamName=str_name, ShardCount=shardNumber)
+        return self.client.describe_stream(StreamName=str_name)
 
-    def getStreamList():
+    def getStreamList(self):
         '''
         Recupera a lista de streams existentes no Kinesis
 
         :return: listagem com os dados dos streams localizados
         '''
-        kinesisStreamList = self.conn.list_streams()
-        return kinesisStreamList
+        streamNames = []
+        params = {}
+        while True:
+            response = self.client.list_streams(**params)
+            streamNames.extend(response['StreamNames'])
+            if not response.get('HasMoreStreams') or not streamNames:
+                break
+            params['ExclusiveStartStreamName'] = streamNames[-1]
+
+        return {'StreamNames': streamNames, 'HasMoreStreams': False}
 
-    def putRecord(self, record, streamName=None, partitionKey=None):
+    def putRecord(self, record, streamName=None, partitionKey=None, explicitHashKey=None):
         '''
         Insere um registro único no Kinesis.
 
         :param record: registro a ser inserido, no formato JSON
         :param streamName: nome do stream onde o registro será inserido
         :param partitionKey: identificador do local onde será inserido (uma forma de identificar o shard)
+        :param explicitHashKey: hash key explícita; se omitida e houver particionador
+                                ativo no stream, é calculada por ele
 
         :return: resposta do Kinesis à requisição de inserção do registro
         '''
         str_name = ""
-        if partitionKey is None or not partitionKey:
-            partitionKey = str(uuid.uuid4())
-
         if streamName is None or not streamName:
             str_name = self.config['aws']['kinesis']['stream_name']
         else:
             str_name = streamName
 
-        return self.conn.put_record(str_name, record, partitionKey)
+        partitioner = self.partitioners.get(str_name)
+        if explicitHashKey is None and partitioner is not None:
+            explicitHashKey = partitioner.getExplicitHashKey(partitionKey or None)
+
+        if partitionKey is None or not partitionKey:
+            partitionKey = str(uuid.uuid4())
+
+        params = {'StreamName': str_name, 'Data': record, 'PartitionKey': partitionKey}
+        if explicitHashKey is not None:
+            params['ExplicitHashKey'] = explicitHashKey
+
+        startTime = time.time()
+        try:
+            response = self.client.put_record(**params)
+        except Exception as e:
+            self.metrics.recordRequestError(str_name, time.time() - startTime, 1, getErrorCode(e))
+            raise
+
+        self.metrics.recordPut(str_name, time.time() - startTime, [params], [response])
+        if partitioner is not None:
+            partitioner.recordPut(response['ShardId'], len(record))
+        return response
 
     def putRecords(self, records, streamName=None):
         '''
         Insere registros em lote (até 500) no Kinesis.
 
-        :param record: array de registros a serem inseridos
+        :param record: array de registros a serem inseridos, no formato
+                       {'Data': ..., 'PartitionKey': ...}
         :param streamName: nome do stream onde os registros serão inseridos
 
-        :return: resposta do Kinesis à requisição de inserção dos registros
+        :return: resposta do Kinesis à requisição de inserção dos registros. Em falhas
+                 parciais, FailedRecordCount é maior que zero e os ítens de Records
+                 correspondentes trazem ErrorCode e ErrorMessage.
         '''
         str_name = ""
         
@@ -102,8 +163,187 @@ class AWSKinesis:
             str_name = self.config['aws']['kinesis']['stream_name']
         else:
             str_name = streamName
-    
-        self.conn.put_records(records, str_name)
+
+        partitioner = self.partitioners.get(str_name)
+        shardResolver = None
+        entries = records
+        if partitioner is not None:
+            shardResolver = partitioner.getShardForKey
+            entries = []
+            for record in records:
+                if 'ExplicitHashKey' not in record:
+                    record = dict(record)
+                    explicitHashKey = partitioner.getExplicitHashKey(record['PartitionKey'])
+                    if explicitHashKey is not None:
+                        record['ExplicitHashKey'] = explicitHashKey
+                entries.append(record)
+
+        startTime = time.time()
+        try:
+            response = self.client.put_records(Records=entries, StreamName=str_name)
+        except Exception as e:
+            self.metrics.recordRequestError(str_name, time.time() - startTime, len(entries),
+                                            getErrorCode(e))
+            raise
+
+        self.metrics.recordPut(str_name, time.time() - startTime, entries, response['Records'],
+                               shardResolver)
+        if partitioner is not None:
+            for entry, result in zip(entries, response['Records']):
+                if 'ShardId' in result:
+                    partitioner.recordPut(result['ShardId'], len(entry['Data']))
+        return response
+
+    def getMetricsSnapshot(self, reset=False):
+        '''
+        Retorna as métricas de escrita por stream e por shard: latência das
+        requisições (histograma e percentis), registros e bytes por segundo,
+        registros recusados por ProvisionedThroughputExceeded, erros e reenvios.
+
+        :param reset: zera as métricas após a leitura
+
+        :return: snapshot das métricas (ver KinesisMetrics.getSnapshot)
+        '''
+        return self.metrics.getSnapshot(reset)
+
+    def startMetricsExporter(self, exporter=None, interval=60.0):
+        '''
+        Inicia a exportação periódica das métricas. A cada intervalo, o snapshot
+        é entregue ao exportador e as métricas são zeradas.
+
+        :param exporter: função chamada com cada snapshot; se omitida, as métricas
+                         são registradas no log
+        :param interval: intervalo entre exportações, em segundos
+
+        :return: instância de KinesisMetricsExporter
+        '''
+        self.stopMetricsExporter()
+        if exporter is None:
+            exporter = logSnapshot
+        self.metricsExporter = KinesisMetricsExporter(self.metrics, exporter, interval)
+        return self.metricsExporter
+
+    def stopMetricsExporter(self):
+        '''
+        Encerra a exportação periódica das métricas, se ativa.
+        '''
+        if self.metricsExporter is not None:
+            self.metricsExporter.stop()
+            self.metricsExporter = None
+
+    def enablePartitioner(self, streamName=None, mode=MODE_BALANCED, refreshInterval=60.0):
+        '''
+        Ativa um particionador no stream (ver KinesisPartitioner). A partir daí,
+        putRecord e putRecords (e os produtores criados em createProducer)
+        preenchem a ExplicitHashKey dos registros que não a trazem e contabilizam
+        os envios por shard.
+
+        :param streamName: nome do stream
+        :param mode: 'balanced' (distribui as partition keys igualmente entre os
+                     shards abertos) ou 'hash' (roteamento padrão do Kinesis)
+        :param refreshInterval: intervalo máximo entre recargas das faixas de hash
+                                dos shards, em segundos
+
+        :return: instância de KinesisPartitioner
+        '''
+        str_name = ""
+        if streamName is None or not streamName:
+            str_name = self.config['aws']['kinesis']['stream_name']
+        else:
+            str_name = streamName
+
+        partitioner = KinesisPartitioner(self, str_name, mode, refreshInterval)
+        self.partitioners[str_name] = partitioner
+        return partitioner
+
+    def disablePartitioner(self, streamName=None):
+        '''
+        Desativa o particionador do stream.
+
+        :param streamName: nome do stream
+
+        :return: particionador desativado, ou None se não havia
+        '''
+        str_name = ""
+        if streamName is None or not streamName:
+            str_name = self.config['aws']['kinesis']['stream_name']
+        else:
+            str_name = streamName
+
+        return self.partitioners.pop(str_name, None)
+
+    def createProducer(self, streamName=None, **producerArgs):
+        '''
+        Cria um produtor com envio automático em lotes e reenvio dos registros
+        que falharem (ver KinesisProducer).
+
+        :param streamName: nome do stream de destino
+        :param producerArgs: parâmetros adicionais de KinesisProducer (lingerTime,
+                             maxRetries, maxBatchRecords, etc)
+
+        :return: instância de KinesisProducer
+        '''
+        return KinesisProducer(self, streamName, **producerArgs)
+
+    def aggregateRecords(self, records, shardResolver=None):
+        '''
+        Agrega registros de usuário no formato do KPL, gerando entradas prontas
+        para putRecords. Cada entrada carrega vários registros de usuário, o que
+        reduz o número de registros por segundo consumidos em cada shard.
+
+        :param records: registros no formato {'Data': ..., 'PartitionKey': ...,
+                        'ExplicitHashKey': ... (opcional)}
+        :param shardResolver: função opcional hash key -> shard, para agregar
+                              apenas registros destinados ao mesmo shard
+
+        :return: lista de entradas agregadas para putRecords
+        '''
+        aggregator = KinesisAggregator(shardResolver=shardResolver)
+        aggregated = []
+        for record in records:
+            data = record['Data']
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            aggregated.extend(aggregator.addRecord(record['PartitionKey'], data,
+                                                   record.get('ExplicitHashKey')))
+        aggregated.extend(aggregator.flush())
+        return [item.toEntry() for item in aggregated]
+
+    def deaggregateRecords(self, records):
+        '''
+        Desagrega registros lidos do Kinesis (formato do GetRecords). Registros
+        agregados no formato do KPL são expandidos nos registros de usuário que
+        contêm, com SubSequenceNumber; os demais são repassados sem alteração.
+
+        :param records: registros retornados pelo GetRecords
+
+        :return: gerador de registros de usuário
+        '''
+        for record in records:
+            userRecords = deaggregate(record['Data'])
+            if userRecords is None:
+                yield record
+                continue
+
+            for subSequence, (partitionKey, explicitHashKey, data) in enumerate(userRecords):
+                userRecord = dict(record)
+                userRecord['Data'] = data
+                userRecord['PartitionKey'] = partitionKey
+                userRecord['SubSequenceNumber'] = subSequence
+                if explicitHashKey is not None:
+                    userRecord['ExplicitHashKey'] = explicitHashKey
+                yield userRecord
+
+    def getShardResolver(self, streamName=None):
+        '''
+        Gera função que mapeia uma hash key (int) para o ShardId do shard aberto
+        que a contém, a partir da lista atual de shards do stream.
+
+        :param streamName: nome do stream
+
+        :return: função hash key -> ShardId
+        '''
+        return KinesisPartitioner(self, streamName, MODE_HASH, refreshInterval=None).getShardId
 
     def getShardList(self, streamName=None, getOnlyOpenedShards=True):
         """
@@ -124,8 +364,14 @@ class AWSKinesis:
         else:
             str_name = streamName
 
-        streamDescription = self.conn.describe_stream(str_name)
-        shardList = streamDescription['StreamDescription']['Shards']
+        shardList = []
+        params = {'StreamName': str_name}
+        while True:
+            streamDescription = self.client.describe_stream(**params)
+            shardList.extend(streamDescription['StreamDescription']['Shards'])
+            if not streamDescription['StreamDescription'].get('HasMoreShards') or not shardList:
+                break
+            params['ExclusiveStartShardId'] = shardList[-1]['ShardId']
 
         if getOnlyOpenedShards:
             #Se quero somente os shards funcionais
@@ -139,6 +385,62 @@ class AWSKinesis:
 
         return finalList
 
+    def getShardIterator(self, shardId, iteratorType='TRIM_HORIZON', sequenceNumber=None,
+                         streamName=None):
+        '''
+        Recupera um iterador de leitura de um shard.
+
+        :param shardId: identificador do shard
+        :param iteratorType: TRIM_HORIZON, LATEST, AT_SEQUENCE_NUMBER ou AFTER_SEQUENCE_NUMBER
+        :param sequenceNumber: número de sequência de referência (tipos *_SEQUENCE_NUMBER)
+        :param streamName: nome do stream
+
+        :return: iterador do shard
+        '''
+        str_name = ""
+        if streamName is None or not streamName:
+            str_name = self.config['aws']['kinesis']['stream_name']
+        else:
+            str_name = streamName
+
+        params = {'StreamName': str_name, 'ShardId': shardId, 'ShardIteratorType': iteratorType}
+        if sequenceNumber is not None:
+            params['StartingSequenceNumber'] = sequenceNumber
+
+        response = self.client.get_shard_iterator(**params)
+        return response['ShardIterator']
+
+    def getRecords(self, shardIterator, limit=None):
+        '''
+        Lê registros de um shard a partir de um iterador.
+
+        :param shardIterator: iterador obtido em getShardIterator ou no
+                              NextShardIterator da leitura anterior
+        :param limit: número máximo de registros retornados (até 10.000)
+
+        :return: resposta do GetRecords (Records, NextShardIterator, MillisBehindLatest)
+        '''
+        params = {'ShardIterator': shardIterator}
+        if limit is not None:
+            params['Limit'] = limit
+
+        return self.client.get_records(**params)
+
+    def createConsumer(self, handler, applicationName, streamName=None, **consumerArgs):
+        '''
+        Cria um consumidor com um leitor por shard e checkpoints locais
+        (ver KinesisConsumer).
+
+        :param handler: função chamada com (shardId, lista de registros)
+        :param applicationName: nome da aplicação, que identifica os checkpoints
+        :param streamName: nome do stream
+        :param consumerArgs: parâmetros adicionais de KinesisConsumer (checkpointPath,
+                             maxWorkers, batchSize, etc)
+
+        :return: instância de KinesisConsumer
+        '''
+        return KinesisConsumer(self, handler, applicationName, streamName, **consumerArgs)
+
     def splitShard(self, streamName=None, shardToSplit=None, newStartHashKey=None):
         '''
         Realiza o split em shard do Kinesis.
@@ -146,7 +448,11 @@ class AWSKinesis:
         contêm uma porção de keys.
 
         :param streamName: nome do stream onde será feito o splir em um dos shards
-        :param shardToSplit:
+        :param shardToSplit: identificador do shard (aberto) a ser dividido
+        :param newStartHashKey: hash key inicial do segundo shard gerado; se omitida,
+                                a faixa do shard é dividida ao meio
+
+        :return: resposta do Kinesis à requisição
         '''
         str_name = None
         if streamName is None or not streamName:
@@ -154,7 +460,19 @@ class AWSKinesis:
         else:
             str_name = streamName
 
-        self.conn.split_shard(str_name, shardToSplit, newStartHashKey)
+        if newStartHashKey is None:
+            for shardInfo in self.getShardList(str_name):
+                if shardInfo['ShardId'] == shardToSplit:
+                    hashRange = shardInfo['HashKeyRange']
+                    startKey = int(hashRange['StartingHashKey'])
+                    endKey = int(hashRange['EndingHashKey'])
+                    newStartHashKey = str((startKey + endKey + 1) // 2)
+                    break
+            else:
+                raise ValueError('Shard inexistente ou fechado: %s' % shardToSplit)
+
+        return self.client.split_shard(StreamName=str_name, ShardToSplit=shardToSplit,
+                                       NewStartingHashKey=str(newStartHashKey))
 
     def mergeShard(self, streamName=None, shardToMerge1=None, shardToMerge2=None):
         '''
@@ -164,5 +482,66 @@ class AWSKinesis:
         desativados (porém mantidos para fins de acesso aos dados armazenados neles)
         e um novo é criado, com a faixa de hash keys equivalente à junção dos 2 shards
         desativados.
+
+        :param streamName: nome do stream
+        :param shardToMerge1: identificador do primeiro shard
+        :param shardToMerge2: identificador do shard adjacente (faixas de hash contíguas)
+
+        :return: resposta do Kinesis à requisição
+        '''
+        str_name = None
+        if streamName is None or not streamName:
+            str_name = self.config['aws']['kinesis']['stream_name']
+        else:
+            str_name = streamName
+
+        return self.client.merge_shards(StreamName=str_name, ShardToMerge=shardToMerge1,
+                                        AdjacentShardToMerge=shardToMerge2)
+
+    def getStreamStatus(self, streamName=None):
+        '''
+        Recupera o estado do stream (CREATING, DELETING, ACTIVE ou UPDATING).
+
+        :param streamName: nome do stream
+
+        :return: estado do stream
+        '''
+        str_name = None
+        if streamName is None or not streamName:
+            str_name = self.config['aws']['kinesis']['stream_name']
+        else:
+            str_name = streamName
+
+        response = self.client.describe_stream_summary(StreamName=str_name)
+        return response['StreamDescriptionSummary']['StreamStatus']
+
+    def waitForStreamActive(self, streamName=None, timeout=300, pollInterval=5):
+        '''
+        Aguarda o stream chegar ao estado ACTIVE (necessário entre operações de
+        split e merge, que deixam o stream em UPDATING).
+
+        :param streamName: nome do stream
+        :param timeout: tempo máximo de espera, em segundos
+        :param pollInterval: intervalo entre as consultas de estado, em segundos
+        '''
+        deadline = time.time() + timeout
+        while True:
+            status = self.getStreamStatus(streamName)
+            if status == 'ACTIVE':
+                return
+            if time.time() >= deadline:
+                raise TimeoutException('O stream não ficou ACTIVE em %d segundos (estado: %s)' %
+                                       (timeout, status))
+            time.sleep(pollInterval)
+
+    def createReshardPlanner(self, streamName=None, **plannerArgs):
+        '''
+        Cria um planejador de resharding para o stream (ver KinesisReshardPlanner).
+
+        :param streamName: nome do stream
+        :param plannerArgs: parâmetros adicionais de KinesisReshardPlanner (minShards,
+                            maxShards, metricsSource, dryRun, etc)
+
+        :return: instância de KinesisReshardPlanner
         '''
-        pass
+        return KinesisReshardPlanner(self, streamName, **plannerArgs)
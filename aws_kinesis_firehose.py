@@ -1,17 +1,95 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from clientregistry import ClientRegistry
 from configuration import Configuration
-from datetime import datetime
-from datetime import timedelta
+from firehosewriter import FirehoseWriter
 
-import base64
-import boto3
-import time
 
 class AWSKinesisFirehose:
-	client = None
-	config = None
+    '''
+    Adaptador de acesso ao Kinesis Firehose
+    '''
+    client = None
+    config = None
 
-	def __init__(self):
-		pass
\ No newline at end of file
+    def __init__(self, awsAccessKey=None, awsSecretAccessKey=None, awsRegion=None):
+        '''
+        Construtor
+
+        :param awsAccessKey: Chave pública do usuário para acesso na AWS
+        :param awsSecretAccessKey: Chave secreta do usuário para acesso na AWS
+        :param awsRegion: Código da região global da AWS a ser utilizada
+        '''
+        configWrapper = Configuration()
+        self.config = configWrapper.getConfigurationFromFile()
+        accessKey = None
+        secretAccessKey = None
+        region = None
+
+        if awsAccessKey is None or not awsAccessKey:
+            accessKey = self.config['aws']['awsAuth']['access_key']
+        else:
+            accessKey = awsAccessKey
+
+        if awsSecretAccessKey is None or not awsSecretAccessKey:
+            secretAccessKey = self.config['aws']['awsAuth']['secret_access_key']
+        else:
+            secretAccessKey = awsSecretAccessKey
+
+        if awsRegion is None or not awsRegion:
+            region = self.config['aws']['awsAuth']['region']
+        else:
+            region = awsRegion
+
+        self.client = ClientRegistry.getClient('firehose', accessKey, secretAccessKey, region)
+
+    def putRecord(self, record, deliveryStreamName=None):
+        '''
+        Insere um registro único no delivery stream.
+
+        :param record: conteúdo do registro (bytes ou texto)
+        :param deliveryStreamName: nome do delivery stream; se omitido, usa o da configuração
+
+        :return: resposta do Firehose (RecordId)
+        '''
+        str_name = ""
+        if deliveryStreamName is None or not deliveryStreamName:
+            str_name = self.config['aws']['firehose']['delivery_stream_name']
+        else:
+            str_name = deliveryStreamName
+
+        return self.client.put_record(DeliveryStreamName=str_name, Record={'Data': record})
+
+    def putRecordBatch(self, records, deliveryStreamName=None):
+        '''
+        Insere registros em lote (até 500 e 4 MB) no delivery stream.
+
+        :param records: lista com o conteúdo (bytes ou texto) de cada registro
+        :param deliveryStreamName: nome do delivery stream; se omitido, usa o da configuração
+
+        :return: resposta do Firehose. Em falhas parciais, FailedPutCount é maior que
+                 zero e os ítens de RequestResponses correspondentes trazem ErrorCode
+                 e ErrorMessage.
+        '''
+        str_name = ""
+        if deliveryStreamName is None or not deliveryStreamName:
+            str_name = self.config['aws']['firehose']['delivery_stream_name']
+        else:
+            str_name = deliveryStreamName
+
+        return self.client.put_record_batch(DeliveryStreamName=str_name,
+                                            Records=[{'Data': record} for record in records])
+
+    def createWriter(self, deliveryStreamName=None, **writerArgs):
+        '''
+        Cria um escritor com envio automático em lotes, empacotamento opcional de
+        registros pequenos e reenvio das entradas que falharem (ver FirehoseWriter).
+
+        :param deliveryStreamName: nome do delivery stream de destino
+        :param writerArgs: parâmetros adicionais de FirehoseWriter (lingerTime, packing,
+                           maxConcurrentRequests, etc)
+
+        :return: instância de FirehoseWriter
+        '''
+        return FirehoseWriter(self, deliveryStreamName, **writerArgs)
@@ -1,28 +1,61 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from clientregistry import ClientRegistry
 from configuration import Configuration
 from datetime import datetime
 from datetime import timedelta
+from redshiftbulkloader import RedshiftBulkLoader
+from redshiftcache import RedshiftQueryCache
+from redshiftcache import isCacheableQuery
+from redshiftcolumnar import fetchColumnar
+from redshiftpool import RedshiftConnectionPool
+from redshiftunloader import RedshiftUnloader
 
 import base64
-import boto3
+import functools
 import json
 import logging
 import os
-import psycopg2
 import sys
 import time
 import uuid
 
 
+# Limites padrão de cada comando gerado por executeBatch
+BATCH_PAGE_SIZE = 1000
+BATCH_MAX_BYTES = 1024 * 1024
+
+_TEXT_TYPE = type(u'')
+
+
+def _connect(rsHost, rsPort, rsDatabase, rsUser, rsPassword):
+    '''
+    Abre uma conexão psycopg2 com o Redshift. Função de módulo, usada como
+    fábrica do pool sem manter referência à instância de AWSRedshift.
+    '''
+    # Importação tardia: o driver só é carregado quando há conexão SQL
+    import psycopg2
+
+    return psycopg2.connect(host=rsHost,
+                            port=rsPort,
+                            dbname=rsDatabase,
+                            user=rsUser,
+                            password=rsPassword)
+
+
 class AWSRedshift:
     '''
     Classe para gerenciamento de clusters do Redshift e submissão de comandos SQL
     '''
     client = None
-    sql_client = None
+    # Pool de conexões SQL com o Redshift (ver RedshiftConnectionPool)
+    pool = None
     config = None
+    # Credenciais AWS (accessKey, secretAccessKey, region) usadas no staging do bulkLoad
+    awsCredentials = None
+    # Cache de resultados de consultas, opcional (ver enableQueryCache)
+    cache = None
 
     def __init__(self,
                  awsAccessKey=None,
@@ -32,7 +65,9 @@ class AWSRedshift:
                  redshiftHostPort=None,
                  redshiftDatabaseName=None,
                  redshiftUser=None,
-                 redshiftPassword=None):
+                 redshiftPassword=None,
+                 minConnections=None,
+                 maxConnections=None):
         '''
         Construtor.
 
@@ -46,6 +81,10 @@ class AWSRedshift:
         :param redshiftDatabaseName: Base de dados a ser usada para as consultas
         :param redshiftUser: Login de usuário para acesso via cliente SQL
         :param redshiftPassword: Senha do usuário para acesso ao cliente SQL
+        :param minConnections: Número mínimo de conexões SQL mantidas no pool
+                               (padrão: aws.redshift.pool_min_size ou 1)
+        :param maxConnections: Número máximo de conexões SQL simultâneas
+                               (padrão: aws.redshift.pool_max_size ou 10)
         '''
         configWrapper = Configuration()
         self.config = configWrapper.getConfigurationFromFile()
@@ -75,10 +114,8 @@ class AWSRedshift:
         else:
             region = awsRegion
 
-        self.client = boto3.client('redshift',
-                                   aws_access_key_id=accessKey,
-                                   aws_secret_access_key=secretAccessKey,
-                                   region_name=region)
+        self.client = ClientRegistry.getClient('redshift', accessKey, secretAccessKey, region)
+        self.awsCredentials = (accessKey, secretAccessKey, region)
 
         if redshiftHostAddr is None or not redshiftHostAddr:
             rsHost = self.config['aws']['redshift']['url']
@@ -105,7 +142,17 @@ class AWSRedshift:
         else:
             rsPassword = redshiftPassword
 
-        self.sql_client = self.startSqlConnection(rsHost, rsPort, rsDatabase, rsUser, rsPassword)
+        if minConnections is None:
+            minConnections = self.config['aws']['redshift'].get('pool_min_size', 1)
+        if maxConnections is None:
+            maxConnections = self.config['aws']['redshift'].get('pool_max_size', 10)
+
+        # A fábrica não referencia self: um ciclo self -> pool -> fábrica -> self
+        # impediria a coleta da instância (com __del__) no Python 2
+        self.pool = RedshiftConnectionPool(
+            functools.partial(_connect, rsHost, rsPort, rsDatabase, rsUser, rsPassword),
+            minSize=minConnections,
+            maxSize=maxConnections)
 
     def startSqlConnection(self, rsHost, rsPort, rsDatabase, rsUser, rsPassword):
     	'''
@@ -119,53 +166,394 @@ class AWSRedshift:
 
     	:return: Objeto de conexão com o Redshift
     	'''
-        conn = psycopg2.connect(host=rsHost,
-                                port=rsPort,
-                                dbname=rsDatabase,
-                                user=rsUser,
-                                password=rsPassword)
-        return conn
-
-    def executeQuery(self, queryToExecute):
+        return _connect(rsHost, rsPort, rsDatabase, rsUser, rsPassword)
+
+    def executeQuery(self, queryToExecute, streaming=False, itersize=2000, batches=False,
+                     useCache=True):
     	'''
     	Executa consulta no Redshift.
 
     	:param queryToExecute: Consulta a ser realizada no Redshift
+    	:param streaming: Se verdadeiro, retorna um gerador de registros lidos aos
+    	                  poucos de um cursor no servidor (ver iterQuery), com uso
+    	                  de memória constante para qualquer volume de resultado
+    	:param itersize: Número de registros trazidos do servidor por vez (streaming)
+    	:param batches: Gera listas de até itersize registros em vez de registros
+    	                individuais (streaming)
+    	:param useCache: Usa o cache de resultados, se habilitado (ver enableQueryCache)
 
     	:return: Coleção de registros retornados pelo Redshift
     	'''
+        if streaming:
+            return self.iterQuery(queryToExecute, itersize, batches)
+
+        if useCache and self.cache is not None and isCacheableQuery(queryToExecute):
+            return self.cache.getOrLoad(queryToExecute, None,
+                                        lambda: self.executeQuery(queryToExecute, useCache=False))
+
         record_list = []
-        cursor = self.sql_client.cursor()
-        cursor.execute(queryToExecute)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(queryToExecute)
 
-        if cursor.rowcount > 0:
-            for row in cursor.fetchall():
-                record_list.append(row)
+            if cursor.rowcount > 0:
+                record_list = cursor.fetchall()
 
         return record_list
 
-    def executeCommand(self, sqlCommand):
+    def iterQuery(self, queryToExecute, itersize=2000, batches=False, parameters=None):
+        '''
+        Executa consulta no Redshift com um cursor nomeado (no servidor), gerando
+        os registros à medida que são lidos. Somente itersize registros ficam em
+        memória por vez.
+
+        A conexão fica retirada do pool até o gerador ser esgotado ou fechado.
+
+        :param queryToExecute: Consulta a ser realizada no Redshift
+        :param itersize: Número de registros trazidos do servidor por vez
+        :param batches: Gera listas de até itersize registros em vez de registros
+                        individuais
+        :param parameters: Parâmetros da consulta (placeholders %s)
+
+        :return: Gerador de registros (ou de listas de registros)
+        '''
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(name='aws_python_%s' % uuid.uuid4().hex)
+            cursor.itersize = itersize
+            try:
+                cursor.execute(queryToExecute, parameters)
+                if batches:
+                    while True:
+                        rows = cursor.fetchmany(itersize)
+                        if not rows:
+                            break
+                        yield rows
+                else:
+                    for row in cursor:
+                        yield row
+            finally:
+                cursor.close()
+
+    def executeColumnar(self, queryToExecute, parameters=None, batchSize=10000,
+                        expectedRows=None, structured=False):
+        '''
+        Executa consulta no Redshift e devolve o resultado em arrays NumPy por
+        coluna, tipados conforme os tipos das colunas (ver fetchColumnar). Os
+        registros são lidos em lotes de um cursor no servidor e gravados em
+        arrays pré-alocados, sem a lista de tuplas do resultado inteiro; os NULLs
+        são marcados em máscaras (numpy.ma).
+
+        Requer NumPy.
+
+        :param queryToExecute: Consulta a ser realizada no Redshift
+        :param parameters: Parâmetros da consulta (placeholders %s)
+        :param batchSize: Número de registros trazidos do servidor por vez
+        :param expectedRows: Número estimado de registros, para a pré-alocação
+        :param structured: Devolve um array estruturado em vez de um dicionário
+
+        :return: Dicionário nome da coluna -> array, ou array estruturado
+        '''
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(name='aws_python_%s' % uuid.uuid4().hex)
+            try:
+                cursor.execute(queryToExecute, parameters)
+                return fetchColumnar(cursor, batchSize, expectedRows, structured)
+            finally:
+                cursor.close()
+
+    def executeCommand(self, sqlCommand, parameters=None):
         '''
         Function: executeCommand
         Summary: Executa comando no Redshift (insert, create table, etc) que requer
                  commit no final.
         Examples: executeCommand("insert into table values 1, 2, 3")
+                  executeCommand("delete from table where id = %s", (10,))
         Attributes:
             @param (sqlCommand):Comando SQL a ser executado
+            @param (parameters):Parâmetros do comando (placeholders %s), opcional
         '''
-        result = None
-        conn = self.sql_client
-        conn.autocommit = True
-        cursor = conn.cursor()
-        cursor.execute(sqlCommand)
-        conn.commit()
+        with self.pool.connection() as conn:
+            # Comandos como VACUUM não podem ser executados dentro de uma transação;
+            # o pool restaura o modo na devolução da conexão
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(sqlCommand, parameters)
+            conn.commit()
+        if self.cache is not None:
+            self.cache.invalidateStatement(sqlCommand)
         return 'SUCCESS'
 
+    def executeBatch(self, sqlCommand, parameterList, template=None, pageSize=BATCH_PAGE_SIZE,
+                     maxBatchBytes=BATCH_MAX_BYTES, commitPerBatch=False):
+        '''
+        Executa um comando parametrizado para uma coleção de registros, expandindo-os
+        em comandos com VALUES de várias linhas (como execute_values do psycopg2):
+        cada comando leva até pageSize registros ou maxBatchBytes bytes, com uma
+        ida ao servidor por comando em vez de uma por registro. Os valores são
+        escapados pelo driver (mogrify).
+
+        Ex.: executeBatch("insert into vendas (id, valor) values %s",
+                          [(1, 10.5), (2, 7.0)])
+
+        :param sqlCommand: Comando com um único placeholder %s no lugar da lista de
+                           VALUES ('%' literais devem ser escritos como '%%')
+        :param parameterList: Iterável de tuplas de parâmetros, uma por registro
+        :param template: Modelo de cada registro (padrão: "(%s, %s, ...)", conforme o
+                         tamanho da primeira tupla)
+        :param pageSize: Número máximo de registros por comando
+        :param maxBatchBytes: Tamanho máximo de cada comando, em bytes
+        :param commitPerBatch: Confirma (commit) após cada comando; por padrão, todos
+                               os comandos são confirmados juntos ao final, em uma
+                               única transação
+
+        :return: Número de registros gravados
+        '''
+        parts = sqlCommand.split('%s')
+        if len(parts) != 2:
+            raise ValueError('O comando deve ter exatamente um placeholder %s (VALUES)')
+        prefix, suffix = [self._encodeSql(part.replace('%%', '%')) for part in parts]
+
+        rowCount = 0
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                values = []
+                valuesBytes = 0
+                for parameters in parameterList:
+                    if template is None:
+                        template = '(%s)' % ', '.join(['%s'] * len(parameters))
+                    value = cursor.mogrify(template, parameters)
+                    if values and (len(values) >= pageSize or
+                                   len(prefix) + valuesBytes + len(value) > maxBatchBytes):
+                        rowCount += self._executeValues(conn, cursor, prefix, values, suffix,
+                                                        commitPerBatch)
+                        values = []
+                        valuesBytes = 0
+                    values.append(value)
+                    valuesBytes += len(value) + 1
+
+                if values:
+                    rowCount += self._executeValues(conn, cursor, prefix, values, suffix,
+                                                    commitPerBatch)
+                conn.commit()
+        finally:
+            # Também invalida em caso de falha: com commitPerBatch, parte dos
+            # registros pode ter sido confirmada
+            if rowCount and self.cache is not None:
+                self.cache.invalidateStatement(sqlCommand.replace('%s', '()'))
+        return rowCount
+
+    def _executeValues(self, conn, cursor, prefix, values, suffix, commit):
+        cursor.execute(prefix + b','.join(values) + suffix)
+        if commit:
+            conn.commit()
+        return len(values)
+
+    def _encodeSql(self, sql):
+        if isinstance(sql, _TEXT_TYPE):
+            return sql.encode('utf-8')
+        return sql
+
+    def getSliceCount(self):
+        '''
+        :return: Número de slices do cluster (stv_slices)
+        '''
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM stv_slices')
+            return cursor.fetchone()[0]
+
+    def bulkLoad(self, tableName, rows, columns=None, bucketName=None, stagingPrefix=None,
+                 iamRole=None, numParts=None, chunkRows=10000, maxWorkers=8, cleanup=True,
+                 copyOptions=None, s3=None):
+        '''
+        Carrega grandes volumes de registros em uma tabela: os registros são
+        gravados em paralelo em partes CSV comprimidas (uma por slice do
+        cluster), enviadas simultaneamente ao S3 e carregadas com um único COPY
+        via manifesto (ver RedshiftBulkLoader).
+
+        Ex.: bulkLoad('vendas', registros, ['id', 'valor', 'data'])
+
+        :param tableName: Tabela de destino
+        :param rows: Iterável de registros (sequências de valores) ou DataFrame
+        :param columns: Colunas de destino, na ordem dos valores dos registros
+        :param bucketName: Bucket de staging (padrão: aws.redshift.staging_bucket)
+        :param stagingPrefix: Prefixo de staging (padrão: aws.redshift.staging_prefix)
+        :param iamRole: ARN da role usada pelo COPY (padrão: aws.redshift.iam_role); se
+                        não houver, o COPY usa as credenciais de acesso
+        :param numParts: Número de partes (padrão: número de slices do cluster)
+        :param chunkRows: Número máximo de registros de cada bloco distribuído entre as
+                          partes (reduzido para que todas as partes recebam registros)
+        :param maxWorkers: Número de envios simultâneos ao S3
+        :param cleanup: Remove os objetos de staging após o COPY
+        :param copyOptions: Opções adicionais do COPY (ex.: "TRUNCATECOLUMNS")
+        :param s3: Instância de AWSS3 usada no staging (padrão: criada com as
+                   credenciais desta instância)
+
+        :return: Dicionário com table, rows, parts, bytes e elapsed (segundos)
+        '''
+        bucketName, stagingPrefix, authorization, s3 = self._getStagingSettings(
+            bucketName, stagingPrefix, iamRole, s3)
+
+        loader = RedshiftBulkLoader(self, s3, bucketName, stagingPrefix, authorization,
+                                    numParts, chunkRows, maxWorkers, cleanup=cleanup)
+        try:
+            return loader.load(tableName, rows, columns, copyOptions)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidateTables([tableName])
+
+    def exportQuery(self, queryToExecute, localPath=None, fileFormat='csv', compression='gzip',
+                    bucketName=None, stagingPrefix=None, iamRole=None, maxWorkers=8,
+                    cleanup=True, unloadOptions=None, s3=None):
+        '''
+        Exporta grandes resultados com UNLOAD ... PARALLEL ON: cada slice do
+        cluster grava seus arquivos no S3, que são baixados e decodificados em
+        paralelo (ver RedshiftUnloader), sem passar pela conexão com o nó líder.
+
+        Ex.: exportQuery('select * from vendas', '/tmp/vendas.csv')
+             for row in exportQuery('select * from vendas', fileFormat='parquet'): ...
+
+        :param queryToExecute: Consulta a ser exportada
+        :param localPath: Arquivo CSV local de destino; se omitido, retorna um gerador
+                          de registros (o UNLOAD é executado na primeira iteração)
+        :param fileFormat: Formato do UNLOAD: 'csv' ou 'parquet' (requer pyarrow)
+        :param compression: Compressão do UNLOAD: 'gzip' ou None (somente CSV)
+        :param bucketName: Bucket de staging (padrão: aws.redshift.staging_bucket)
+        :param stagingPrefix: Prefixo de staging (padrão: aws.redshift.staging_prefix)
+        :param iamRole: ARN da role usada pelo UNLOAD (padrão: aws.redshift.iam_role); se
+                        não houver, o UNLOAD usa as credenciais de acesso
+        :param maxWorkers: Número de arquivos baixados e decodificados simultaneamente
+        :param cleanup: Remove os arquivos do UNLOAD após a leitura
+        :param unloadOptions: Opções adicionais do UNLOAD (ex.: "MAXFILESIZE 256 MB")
+        :param s3: Instância de AWSS3 usada no staging (padrão: criada com as
+                   credenciais desta instância)
+
+        :return: Relatório da exportação (parts, rows, bytes, elapsed), se localPath
+                 for informado; senão, gerador de registros
+        '''
+        bucketName, stagingPrefix, authorization, s3 = self._getStagingSettings(
+            bucketName, stagingPrefix, iamRole, s3)
+
+        unloader = RedshiftUnloader(self, s3, bucketName, stagingPrefix, authorization,
+                                    maxWorkers, cleanup)
+        if localPath is None:
+            return unloader.iterRows(queryToExecute, fileFormat, compression, unloadOptions)
+        return unloader.exportToFile(queryToExecute, localPath, fileFormat, compression,
+                                     unloadOptions)
+
+    def _getStagingSettings(self, bucketName, stagingPrefix, iamRole, s3):
+        '''
+        Resolve bucket, prefixo, autorização (COPY/UNLOAD) e cliente S3 de staging.
+        '''
+        redshiftConfig = self.config['aws']['redshift']
+        if bucketName is None or not bucketName:
+            bucketName = redshiftConfig['staging_bucket']
+        if stagingPrefix is None:
+            stagingPrefix = redshiftConfig.get('staging_prefix', 'redshift-staging/')
+        if iamRole is None or not iamRole:
+            iamRole = redshiftConfig.get('iam_role')
+
+        accessKey, secretAccessKey, region = self.awsCredentials
+        if iamRole:
+            authorization = "IAM_ROLE '%s'" % iamRole
+        else:
+            authorization = "ACCESS_KEY_ID '%s' SECRET_ACCESS_KEY '%s'" % (accessKey,
+                                                                          secretAccessKey)
+
+        if s3 is None:
+            # Importação tardia: evita carregar o adaptador do S3 sem necessidade
+            from aws_s3 import AWSS3
+            s3 = AWSS3(accessKey, secretAccessKey, region)
+
+        return bucketName, stagingPrefix, authorization, s3
+
+    def enableQueryCache(self, maxBytes=64 * 1024 * 1024, ttl=300.0, spillDir=None,
+                         maxSpillBytes=1024 * 1024 * 1024):
+        '''
+        Habilita o cache de resultados de executeQuery (ver RedshiftQueryCache).
+        As entradas são invalidadas quando executeCommand, executeBatch ou
+        bulkLoad alteram uma tabela citada na consulta; escritas feitas
+        diretamente em connection() devem ser seguidas de invalidateQueryCache().
+
+        :param maxBytes: Volume máximo dos resultados em memória, em bytes
+        :param ttl: Tempo de validade de um resultado, em segundos
+        :param spillDir: Diretório para os resultados descartados da memória (opcional)
+        :param maxSpillBytes: Volume máximo dos resultados em disco, em bytes
+
+        :return: Instância de RedshiftQueryCache
+        '''
+        self.cache = RedshiftQueryCache(maxBytes, ttl, spillDir, maxSpillBytes)
+        return self.cache
+
+    def disableQueryCache(self):
+        '''
+        Desabilita o cache de resultados, descartando as entradas.
+        '''
+        if self.cache is not None:
+            self.cache.clear()
+            self.cache = None
+
+    def invalidateQueryCache(self, tables=None):
+        '''
+        Invalida resultados em cache.
+
+        :param tables: Tabelas alteradas; se omitido, invalida todo o cache
+
+        :return: Número de resultados removidos
+        '''
+        if self.cache is None:
+            return 0
+        if tables is None:
+            return self.cache.clear()
+        return self.cache.invalidateTables(tables)
+
+    def getQueryCacheStats(self):
+        '''
+        :return: Métricas do cache de resultados (hits, misses, evictions, etc), ou
+                 None se o cache não estiver habilitado
+        '''
+        if self.cache is None:
+            return None
+        return self.cache.getStats()
+
+    def connection(self, timeout=None):
+        '''
+        Retira uma conexão SQL do pool para uso em um bloco with. Ao fim do bloco,
+        a conexão é devolvida ao pool, descartando o que não foi confirmado (commit).
+
+        Ex.:
+            with redshift.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(...)
+                conn.commit()
+
+        :param timeout: tempo máximo de espera por uma conexão livre, em segundos
+
+        :return: gerenciador de contexto que fornece uma conexão psycopg2
+        '''
+        return self.pool.connection(timeout)
+
+    def close(self):
+        '''
+        Finaliza as conexões com o cliente SQL do Redshift (ver
+        RedshiftConnectionPool.closeAll). Conexões em uso são fechadas quando
+        devolvidas ao pool.
+        '''
+        if self.pool is not None:
+            self.pool.closeAll()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
     def __del__(self):
     	'''
     	Destrutor.
 
-    	Finaliza conexão com o cliente SQL do Redshift
+    	Finaliza as conexões com o cliente SQL do Redshift
     	'''
-        self.sql_client.commit()
-        self.sql_client.close()
+        self.close()
@@ -1,12 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from clientregistry import ClientRegistry
 from configuration import Configuration
 from datetime import datetime
 from datetime import timedelta
+from s3bulklister import S3BulkLister
+from s3bulkoperations import S3BulkOperations
+from s3inventory import S3InventoryIndex
+from s3objectcolumns import S3ObjectColumns
+from s3objectcolumns import TYPE_FILE
+from s3objectcolumns import TYPE_FOLDER
+from s3recordreader import DEFAULT_CHUNK_SIZE
+from s3recordreader import S3RecordReader
+from s3transferengine import DEFAULT_PART_SIZE
+from s3transferengine import S3TransferEngine
 
 import base64
-import boto3
 import time
 
 
@@ -18,14 +28,19 @@ class AWSS3:
     '''
     client = None
     config = None
+    # Índice local do inventário de objetos (ver openInventory)
+    inventory = None
 
-    def __init__(self, awsAccessKey=None, awsSecretAccessKey=None, awsRegion=None):
+    def __init__(self, awsAccessKey=None, awsSecretAccessKey=None, awsRegion=None,
+                 endpointUrl=None):
         '''
         Construtor
 
         :param awsAccessKey: Chave pública do usuário para acesso na AWS
         :param awsSecretAccessKey: Chave secreta do usuário para acesso na AWS
         :param region: Código da região global da AWS a ser utilizada
+        :param endpointUrl: Endpoint alternativo do S3 (ex.: um S3 local para testes);
+                            se omitido, usa aws.s3.endpoint_url
         '''
         configWrapper = Configuration()
         self.config = configWrapper.getConfigurationFromFile()
@@ -48,10 +63,11 @@ class AWSS3:
         else:
             region = awsRegion
 
-        self.client = boto3.client('s3',
-                                   aws_access_key_id=accessKey,
-                                   aws_secret_access_key=secretAccessKey,
-                                   region_name=region)
+        if endpointUrl is None or not endpointUrl:
+            endpointUrl = self.config['aws']['s3'].get('endpoint_url') or None
+
+        self.client = ClientRegistry.getClient('s3', accessKey, secretAccessKey, region,
+                                               endpointUrl)
 
     def getBuckets(self):
     	'''
@@ -73,24 +89,253 @@ class AWSS3:
 
         return result_data
 
-    def getObjects(self, bucketName, folderPath=None):
+    def getObjects(self, bucketName, folderPath=None, streaming=False,
+                   startAfter=None, maxKeys=None, pageSize=None, compact=False):
     	'''
     	Recupera objetos de um dado diretório em um bucket do S3.
 
+    	A listagem é paginada por completo (list_objects_v2), sem o corte em
+    	1.000 chaves de uma única chamada.
+
     	:param bucketName: Nome do bucket para o qual se busca a lista de ítens.
     	:param folderPath: Nome da pasta dentro do bucket para a qual se recuperará
     	                   a listagem de objetos. Caso não seja fornecida, serão recuperados
     	                   todos os ítens no bucket.
+    	:param streaming: Se verdadeiro, retorna um gerador de ítens (ver iterObjects)
+    	                  em vez da coleção completa.
+    	:param startAfter: Chave a partir da qual a listagem se inicia (exclusive)
+    	:param maxKeys: Número máximo de ítens retornados
+    	:param pageSize: Número de chaves solicitadas por requisição (até 1.000)
+    	:param compact: Se verdadeiro, retorna a listagem em colunas (S3ObjectColumns),
+    	                com tamanhos inteiros e sem um dicionário por objeto.
 
-    	:return: Coleção de objetos encontrados.
+    	:return: Coleção de objetos encontrados, ou gerador de ítens no modo streaming.
     	'''
-        object_list = None
-        if folderPath is None or not folderPath:
-            object_list = self.client.list_objects(Bucket=bucketName)
-        else:
-            object_list = self.client.list_objects(Bucket=bucketName, Prefix=folderPath, Delimiter='/')
+        if compact:
+            if streaming:
+                raise ValueError('Os modos streaming e compact são mutuamente exclusivos')
+            columns = S3ObjectColumns(bucketName, folderPath if folderPath else '')
+            columns.extend(self._iterListing(self.iterS3ObjectRows, bucketName, folderPath,
+                                             startAfter, maxKeys, pageSize, False))
+            return columns
+
+        itemIterator = self.iterObjects(bucketName, folderPath, startAfter, maxKeys, pageSize)
+        if streaming:
+            return itemIterator
+
+        result_data = {
+            'bucket': bucketName,
+            'prefix': folderPath if folderPath else '',
+            'itemList': list(itemIterator)
+        }
+        return result_data
+
+    def iterObjects(self, bucketName, folderPath=None, startAfter=None, maxKeys=None,
+                    pageSize=None, recursive=False):
+        '''
+        Gera os objetos de um diretório do S3 à medida que as páginas chegam.
+
+        Usa os continuation tokens do list_objects_v2, mantendo em memória
+        apenas a página corrente, independente do tamanho do bucket. Os ítens
+        têm o mesmo formato dos retornados em formatS3ObjectList.
+
+        :param bucketName: Nome do bucket a ser listado
+        :param folderPath: Pasta a ser listada; se omitida, lista todo o bucket
+        :param startAfter: Chave a partir da qual a listagem se inicia (exclusive)
+        :param maxKeys: Número máximo de ítens gerados
+        :param pageSize: Número de chaves solicitadas por requisição (até 1.000)
+        :param recursive: Se verdadeiro, lista também o conteúdo das subpastas
+                          (sem delimitador) em vez de retorná-las como pastas
+
+        :return: Gerador de ítens (arquivos e pastas)
+        '''
+        return self._iterListing(self.iterS3ObjectPage, bucketName, folderPath, startAfter,
+                                 maxKeys, pageSize, recursive)
+
+    def _iterListing(self, pageFormatter, bucketName, folderPath, startAfter, maxKeys,
+                     pageSize, recursive):
+        '''
+        Percorre as páginas do list_objects_v2 gerando os ítens produzidos por
+        pageFormatter para cada página.
+        '''
+        requestArgs = {'Bucket': bucketName}
+        if folderPath:
+            requestArgs['Prefix'] = folderPath
+            if not recursive:
+                requestArgs['Delimiter'] = '/'
+        if startAfter:
+            requestArgs['StartAfter'] = startAfter
+        if pageSize:
+            requestArgs['MaxKeys'] = min(int(pageSize), 1000)
+
+        itemCount = 0
+        while True:
+            if maxKeys is not None:
+                remaining = maxKeys - itemCount
+                if remaining <= 0:
+                    return
+                requestArgs['MaxKeys'] = min(requestArgs.get('MaxKeys', 1000), remaining)
+
+            page = self.client.list_objects_v2(**requestArgs)
+            for item_data in pageFormatter(page):
+                yield item_data
+                itemCount += 1
+                if maxKeys is not None and itemCount >= maxKeys:
+                    return
+
+            if not page.get('IsTruncated'):
+                return
+            requestArgs['ContinuationToken'] = page['NextContinuationToken']
+            requestArgs.pop('StartAfter', None)
+
+    def getAnalysisObjects(self, maxWorkers=8, maxWorkersPerBucket=4, queueSize=1000,
+                           splitDepth=1, pageSize=None):
+        '''
+        Lista em paralelo todos os arquivos dos buckets e pastas configurados em
+        aws.s3.buckets_for_analysis.
+
+        :param maxWorkers: Número total de threads de listagem
+        :param maxWorkersPerBucket: Número máximo de listagens simultâneas por bucket
+        :param queueSize: Capacidade da fila de ítens (backpressure)
+        :param splitDepth: Níveis de subpastas divididos em tarefas paralelas
+        :param pageSize: Número de chaves solicitadas por requisição
+
+        :return: Gerador de ítens de arquivo, com a chave 'bucket' preenchida
+        '''
+        targets = []
+        for bucketConfig in self.config['aws']['s3']['buckets_for_analysis']:
+            folderList = bucketConfig.get('folderList') or [None]
+            for folderPath in folderList:
+                targets.append((bucketConfig['bucket'], folderPath))
+
+        lister = S3BulkLister(self, maxWorkers, maxWorkersPerBucket, queueSize,
+                              splitDepth, pageSize)
+        return lister.iterObjects(targets)
+
+    def openInventory(self, dbPath):
+        '''
+        Abre (ou cria) o índice local do inventário de objetos do S3.
+
+        O índice permite responder consultas de tamanho, contagem e diferenças
+        de prefixos sem chamadas à API; use refresh() para atualizá-lo.
+
+        :param dbPath: Caminho do arquivo SQLite do índice
+
+        :return: Instância de S3InventoryIndex, também mantida em self.inventory
+        '''
+        if self.inventory is not None:
+            self.inventory.close()
+        self.inventory = S3InventoryIndex(self, dbPath)
+        return self.inventory
+
+    def deleteObjects(self, bucketName, items=None, folderPath=None, maxWorkers=8,
+                      progressCallback=None):
+        '''
+        Remove objetos em lote (delete_objects com até 1.000 chaves por requisição).
+
+        :param bucketName: Bucket dos objetos
+        :param items: Iterável de chaves ou de ítens de listagem (ex.: retorno de
+                      iterObjects, possivelmente filtrado). Se omitido, remove
+                      todos os objetos sob folderPath.
+        :param folderPath: Prefixo a ser removido quando items não é informado
+        :param maxWorkers: Número de requisições simultâneas
+        :param progressCallback: Função opcional chamada com o relatório após cada lote
 
-        return self.formatS3ObjectList(object_list)
+        :return: BulkOperationReport com sucessos, falhas por chave e vazão
+        '''
+        if items is None:
+            if not folderPath:
+                raise ValueError('Informe items ou folderPath para a remoção em lote')
+            items = self.iterObjects(bucketName, folderPath, recursive=True)
+
+        operations = S3BulkOperations(self.client, maxWorkers)
+        return operations.deleteObjects(bucketName, items, progressCallback)
+
+    def copyObjects(self, sourceBucket, destinationBucket, items=None, sourcePrefix='',
+                    destinationPrefix='', keyMapper=None, maxWorkers=8, progressCallback=None):
+        '''
+        Copia objetos no próprio S3, em paralelo, usando cópia multipart para
+        objetos grandes.
+
+        :param sourceBucket: Bucket de origem
+        :param destinationBucket: Bucket de destino
+        :param items: Iterável de chaves ou de ítens de listagem. Se omitido, copia
+                      todos os objetos sob sourcePrefix.
+        :param sourcePrefix: Prefixo de origem, substituído por destinationPrefix
+        :param destinationPrefix: Prefixo de destino
+        :param keyMapper: Função opcional de mapeamento de chave de origem para destino
+        :param maxWorkers: Número de cópias simultâneas
+        :param progressCallback: Função opcional chamada com o relatório após cada cópia
+
+        :return: BulkOperationReport com sucessos, falhas por chave e vazão
+        '''
+        if items is None:
+            items = self.iterObjects(sourceBucket, sourcePrefix, recursive=True)
+
+        operations = S3BulkOperations(self.client, maxWorkers)
+        return operations.copyObjects(sourceBucket, items, destinationBucket,
+                                      destinationPrefix, sourcePrefix, keyMapper,
+                                      progressCallback)
+
+    def iterRecords(self, bucketName, key, recordFormat='lines', compression='auto',
+                    sqlExpression=None, csvDelimiter=',', csvHeader=False,
+                    chunkSize=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+        '''
+        Lê os registros de um objeto do S3 em fluxo, sem baixá-lo por inteiro.
+
+        :param bucketName: Bucket do objeto
+        :param key: Chave do objeto
+        :param recordFormat: 'lines', 'csv' ou 'json' (um documento por linha)
+        :param compression: 'gzip', None ou 'auto' (detecta gzip pelo conteúdo)
+        :param sqlExpression: Expressão SQL aplicada no S3 via S3 Select (csv ou json)
+        :param csvDelimiter: Delimitador de campos CSV
+        :param csvHeader: Indica que a primeira linha do CSV é cabeçalho
+        :param chunkSize: Tamanho dos blocos lidos do S3, em bytes
+        :param encoding: Codificação do texto do objeto
+
+        :return: Gerador de registros (textos, listas de campos ou documentos JSON)
+        '''
+        reader = S3RecordReader(self.client, chunkSize, encoding)
+        return reader.iterRecords(bucketName, key, recordFormat, compression,
+                                  sqlExpression, csvDelimiter, csvHeader)
+
+    def upload(self, localPath, bucketName, key, partSize=DEFAULT_PART_SIZE, maxWorkers=8,
+               maxRetries=3, resume=True):
+        '''
+        Envia um arquivo local para o S3, em upload multipart paralelo quando o
+        arquivo é maior que uma parte.
+
+        :param localPath: Caminho do arquivo a ser enviado
+        :param bucketName: Bucket de destino
+        :param key: Chave do objeto de destino
+        :param partSize: Tamanho de cada parte, em bytes (mínimo de 5 MB)
+        :param maxWorkers: Número de partes enviadas simultaneamente
+        :param maxRetries: Número de novas tentativas por parte
+        :param resume: Retoma upload interrompido a partir do arquivo de estado local
+
+        :return: ETag do objeto criado
+        '''
+        engine = S3TransferEngine(self.client, partSize, maxWorkers, maxRetries)
+        return engine.upload(localPath, bucketName, key, resume)
+
+    def download(self, bucketName, key, localPath, partSize=DEFAULT_PART_SIZE, maxWorkers=8,
+                 maxRetries=3, resume=True):
+        '''
+        Baixa um objeto do S3 com GETs paralelos por intervalo de bytes, gravados
+        diretamente em um arquivo local pré-alocado.
+
+        :param bucketName: Bucket de origem
+        :param key: Chave do objeto
+        :param localPath: Caminho do arquivo local de destino
+        :param partSize: Tamanho de cada intervalo, em bytes (mínimo de 5 MB)
+        :param maxWorkers: Número de intervalos baixados simultaneamente
+        :param maxRetries: Número de novas tentativas por intervalo
+        :param resume: Retoma download interrompido a partir do arquivo de estado local
+
+        :return: Número de bytes do objeto
+        '''
+        engine = S3TransferEngine(self.client, partSize, maxWorkers, maxRetries)
+        return engine.download(bucketName, key, localPath, resume)
 
     def formatS3ObjectList(self, objectList):
     	'''
@@ -107,25 +352,51 @@ class AWSS3:
 
         result_data['bucket'] = objectList['Name']
         result_data['prefix'] = objectList['Prefix']
+        result_data['itemList'] = list(self.iterS3ObjectPage(objectList))
+
+        return result_data
+
+    def iterS3ObjectPage(self, objectList):
+        '''
+        Gera os ítens (arquivos e pastas) de uma página de listagem do S3.
+
+        :param objectList: Página de listagem retornada pelo S3
+        '''
+        prefix = str(objectList.get('Prefix', ''))
 
         if 'Contents' in objectList:
             for obj_item in objectList['Contents']:
-                if str(obj_item['Key']) != objectList['Prefix']:
+                if str(obj_item['Key']) != prefix:
                     item_data = {
                         'type': 'file',
                         'path': obj_item['Key'],
                         'etag': obj_item['ETag'],
                         'size': str(obj_item['Size'])
                     }
-                    result_data['itemList'].append(item_data)
+                    yield item_data
 
         if 'CommonPrefixes' in objectList:
             for obj_item in objectList['CommonPrefixes']:
-                if str(obj_item['Prefix']) != str(objectList['Prefix']):
+                if str(obj_item['Prefix']) != prefix:
                     item_data = {
                         'type': 'folder',
                         'path': obj_item['Prefix']
                     }
-                    result_data['itemList'].append(item_data)
+                    yield item_data
 
-        return result_data
+    def iterS3ObjectRows(self, objectList):
+        '''
+        Gera os ítens de uma página de listagem do S3 como tuplas
+        (tipo, caminho, tamanho, etag), usadas pela listagem compacta.
+
+        :param objectList: Página de listagem retornada pelo S3
+        '''
+        prefix = objectList.get('Prefix', '')
+
+        for obj_item in objectList.get('Contents', ()):
+            if obj_item['Key'] != prefix:
+                yield (TYPE_FILE, obj_item['Key'], obj_item['Size'], obj_item['ETag'])
+
+        for obj_item in objectList.get('CommonPrefixes', ()):
+            if obj_item['Prefix'] != prefix:
+                yield (TYPE_FOLDER, obj_item['Prefix'], 0, None)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+
+class ClientRegistry:
+    '''
+    Registro de clientes boto3 compartilhados pelo processo.
+
+    Cada combinação (serviço, região, credenciais, endpoint) recebe um único
+    cliente, criado na primeira requisição e reaproveitado nas seguintes.
+    Clientes boto3 são thread-safe, de forma que o mesmo objeto pode ser usado
+    por várias threads, compartilhando também o pool de conexões HTTP.
+    '''
+
+    # Número máximo de conexões HTTP mantidas por cliente
+    maxPoolConnections = 10
+    # Habilita TCP keep-alive nas conexões dos clientes
+    tcpKeepAlive = True
+
+    _clients = {}
+    _sessions = {}
+    _lock = threading.Lock()
+    _hits = 0
+    _misses = 0
+
+    @classmethod
+    def configure(cls, maxPoolConnections=None, tcpKeepAlive=None):
+        '''
+        Ajusta os parâmetros de conexão usados na criação de novos clientes.
+
+        Clientes já existentes não são alterados; use clear() para recriá-los.
+
+        :param maxPoolConnections: Número máximo de conexões HTTP por cliente
+        :param tcpKeepAlive: Habilita ou não TCP keep-alive
+        '''
+        with cls._lock:
+            if maxPoolConnections is not None:
+                if maxPoolConnections < 1:
+                    raise ValueError('maxPoolConnections deve ser ao menos 1')
+                cls.maxPoolConnections = maxPoolConnections
+            if tcpKeepAlive is not None:
+                cls.tcpKeepAlive = bool(tcpKeepAlive)
+
+    @classmethod
+    def getClient(cls, serviceName, accessKey, secretAccessKey, region, endpointUrl=None):
+        '''
+        Recupera o cliente compartilhado para o serviço e credenciais dados.
+
+        :param serviceName: Nome do serviço na AWS (s3, emr, redshift, etc)
+        :param accessKey: Chave pública do usuário para acesso na AWS
+        :param secretAccessKey: Chave secreta do usuário para acesso na AWS
+        :param region: Código da região global da AWS a ser utilizada
+        :param endpointUrl: Endpoint alternativo do serviço (opcional)
+
+        :return: Cliente boto3 do serviço
+        '''
+        key = (serviceName, region, accessKey, secretAccessKey, endpointUrl)
+        with cls._lock:
+            client = cls._clients.get(key)
+            if client is not None:
+                cls._hits += 1
+                return client
+
+            cls._misses += 1
+            # Importação tardia: o SDK só é carregado quando o primeiro
+            # cliente é de fato necessário
+            import boto3
+            from botocore.config import Config
+
+            # Sessões boto3 não são thread-safe; são criadas e usadas somente
+            # sob o lock do registro.
+            sessionKey = (region, accessKey, secretAccessKey)
+            session = cls._sessions.get(sessionKey)
+            if session is None:
+                session = boto3.session.Session(aws_access_key_id=accessKey,
+                                                aws_secret_access_key=secretAccessKey,
+                                                region_name=region)
+                cls._sessions[sessionKey] = session
+
+            try:
+                clientConfig = Config(max_pool_connections=cls.maxPoolConnections,
+                                      tcp_keepalive=cls.tcpKeepAlive)
+            except TypeError:
+                # Versões antigas do botocore (inclusive as últimas compatíveis
+                # com Python 2) não aceitam tcp_keepalive
+                clientConfig = Config(max_pool_connections=cls.maxPoolConnections)
+            client = session.client(serviceName,
+                                    endpoint_url=endpointUrl,
+                                    config=clientConfig)
+            cls._clients[key] = client
+            return client
+
+    @classmethod
+    def getStats(cls):
+        '''
+        Retorna os contadores de uso do registro.
+
+        :return: Dicionário com hits, misses e número de clientes ativos
+        '''
+        return {
+            'hits': cls._hits,
+            'misses': cls._misses,
+            'clients': len(cls._clients)
+        }
+
+    @classmethod
+    def clear(cls):
+        '''
+        Descarta todos os clientes e sessões registrados e zera os contadores.
+        '''
+        with cls._lock:
+            cls._clients.clear()
+            cls._sessions.clear()
+            cls._hits = 0
+            cls._misses = 0
@@ -5,7 +5,67 @@ from utils import Utils
 
 import json
 import os
+import stat
 import sys
+import tempfile
+import threading
+
+
+# Cache de configurações compartilhado pelo processo, indexado pelo caminho do
+# arquivo. Cada entrada guarda a assinatura do arquivo (mtime, tamanho, inode)
+# no momento da leitura e a visão imutável do conteúdo.
+_configCache = {}
+_configCacheLock = threading.Lock()
+
+
+class ImmutableConfig(dict):
+    '''
+    Visão somente-leitura de um nó do arquivo de configurações.
+
+    Compartilhada entre todas as instâncias do processo; qualquer tentativa de
+    alteração levanta TypeError. Para alterar configurações, gere uma cópia com
+    toMutable() e grave-a com Configuration.updateConfigurationFile().
+    '''
+
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError('Configurações em cache são somente leitura')
+
+    __setitem__ = _readOnly
+    __delitem__ = _readOnly
+    clear = _readOnly
+    pop = _readOnly
+    popitem = _readOnly
+    setdefault = _readOnly
+    update = _readOnly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def toMutable(self):
+        '''
+        Gera cópia mutável (dicts e lists comuns) do conteúdo.
+        '''
+        return _thaw(self)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return ImmutableConfig((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, dict):
+        return dict((key, _thaw(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_thaw(item) for item in value]
+    return value
+
 
 class Configuration:
     configurationFileName = 'appConfig.json'
@@ -24,23 +84,74 @@ class Configuration:
         config = self.getConfigurationFromFile()
         return config['mail']['host'] + ':' + str(config['mail']['port'])
 
-    def getConfigurationFromFile(self):
+    def getConfigurationFilePath(self):
         '''
-        Recupera configurações do arquivo de configurações
+        Retorna o caminho absoluto do arquivo de configurações.
         '''
         utils = Utils()
         currentLocation = utils.getCurrentDir()
-        configContent = open(os.path.join(currentLocation, 'appConfig.json')).read()
-        appConfig = json.loads(configContent)
-        return appConfig
+        return os.path.join(currentLocation, self.configurationFileName)
+
+    def getConfigurationFromFile(self):
+        '''
+        Recupera configurações do arquivo de configurações.
+
+        O conteúdo é mantido em cache no processo e só é relido quando o mtime,
+        o tamanho ou o inode do arquivo mudam.
+
+        :return: Visão imutável (ImmutableConfig) das configurações
+        '''
+        filePath = self.getConfigurationFilePath()
+        fileStat = os.stat(filePath)
+        signature = (fileStat.st_mtime, fileStat.st_size, fileStat.st_ino)
+
+        cached = _configCache.get(filePath)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with _configCacheLock:
+            cached = _configCache.get(filePath)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+            with open(filePath) as configFile:
+                appConfig = _freeze(json.load(configFile))
+            _configCache[filePath] = (signature, appConfig)
+            return appConfig
+
+    def invalidateCache(self):
+        '''
+        Descarta o conteúdo em cache do arquivo de configurações, forçando nova
+        leitura no próximo acesso.
+        '''
+        with _configCacheLock:
+            _configCache.pop(self.getConfigurationFilePath(), None)
 
     def updateConfigurationFile(self, newConfigs):
         '''
         Atualiza configurações no arquivo.
+
+        A escrita é atômica: o conteúdo é gravado em arquivo temporário no mesmo
+        diretório e depois renomeado sobre o original. O cache é invalidado.
+
+        :param newConfigs: Novo conteúdo completo das configurações
         '''
-        utils = Utils()
-        currentLocation = utils.getCurrentDir()
-        filePath = os.path.join(currentLocation, 'appConfig.json')
+        filePath = self.getConfigurationFilePath()
+        fileDescriptor, tempPath = tempfile.mkstemp(prefix='.appConfig.',
+                                                    dir=os.path.dirname(filePath))
+        try:
+            with os.fdopen(fileDescriptor, 'w') as outFile:
+                json.dump(_thaw(newConfigs), outFile)
+                outFile.flush()
+                os.fsync(outFile.fileno())
+            # mkstemp cria o arquivo com permissão 0600; mantém a do original
+            if os.path.exists(filePath):
+                os.chmod(tempPath, stat.S_IMODE(os.stat(filePath).st_mode))
+            os.rename(tempPath, filePath)
+        except Exception:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
 
-        with open(filePath, 'w') as outFile:
-            json.dump(newConfigs, outFile)
+        with _configCacheLock:
+            _configCache.pop(filePath, None)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from kinesismetrics import getErrorCode
+
+import collections
+import json
+import logging
+import threading
+import time
+import zlib
+
+
+# Limites do PutRecordBatch
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_RECORD_BYTES = 1000 * 1024
+
+# Modos de empacotamento de registros pequenos
+PACKING_NEWLINE = 'newline'
+PACKING_GZIP = 'gzip'
+PACKING_MODES = (None, PACKING_NEWLINE, PACKING_GZIP)
+
+_TEXT_TYPE = type(u'')
+
+
+class FirehosePutError(Exception):
+    '''
+    Falha definitiva no envio de um registro ao Kinesis Firehose.
+    '''
+
+    def __init__(self, errorCode, errorMessage=None):
+        super(FirehosePutError, self).__init__('%s: %s' % (errorCode, errorMessage))
+        self.errorCode = errorCode
+        self.errorMessage = errorMessage
+
+
+class _BufferedRecord(object):
+    __slots__ = ('data', 'future', 'size')
+
+    def __init__(self, data, future):
+        self.data = data
+        self.future = future
+        self.size = len(data)
+
+
+class FirehoseWriter:
+    '''
+    Escritor de registros do Kinesis Firehose com envio automático em lotes.
+
+    Os registros recebidos em put() são acumulados em memória e enviados via
+    PutRecordBatch (até 500 registros e 4 MB por chamada) quando o lote fica
+    completo ou quando o registro mais antigo espera mais que lingerTime. Os
+    lotes são enviados por um pool de threads, com até maxConcurrentRequests
+    lotes em andamento. Em respostas com falha parcial (FailedPutCount > 0),
+    somente as entradas que falharam são reenviadas, com espera exponencial.
+
+    Registros pequenos podem ser empacotados em blobs maiores, reduzindo o
+    número de registros cobrados e de chamadas:
+
+        newline: os registros são concatenados, separados por quebra de linha,
+                 em blobs de até 1.000 KB;
+        gzip: os registros, separados por quebra de linha, são comprimidos em
+              blobs gzip de até 1.000 KB. No destino (S3), os blobs formam um
+              arquivo gzip de vários membros; a compressão do próprio delivery
+              stream deve ficar desativada.
+
+    Cada put() devolve um Future resolvido com o RecordId do registro (ou do
+    blob que o contém), ou com a exceção final caso as tentativas se esgotem.
+    '''
+
+    def __init__(self, firehose, deliveryStreamName=None, maxBatchRecords=MAX_BATCH_RECORDS,
+                 maxBatchBytes=MAX_BATCH_BYTES, lingerTime=0.1, packing=None,
+                 gzipBlockSize=4 * 1024 * 1024, maxRetries=5, retryBackoff=0.1,
+                 maxBufferedRecords=500000, maxConcurrentRequests=4):
+        '''
+        Construtor
+
+        :param firehose: Instância de AWSKinesisFirehose usada no envio
+        :param deliveryStreamName: Nome do delivery stream; se omitido, usa o da configuração
+        :param maxBatchRecords: Número máximo de entradas por requisição (até 500)
+        :param maxBatchBytes: Tamanho máximo de cada requisição, em bytes (até 4 MB)
+        :param lingerTime: Tempo máximo de espera de um registro no buffer, em segundos
+        :param packing: None, 'newline' ou 'gzip' (ver descrição da classe)
+        :param gzipBlockSize: Volume de dados (antes da compressão) de cada blob gzip
+        :param maxRetries: Número de reenvios de uma entrada que falhou
+        :param retryBackoff: Espera inicial entre reenvios, em segundos (dobra a cada falha)
+        :param maxBufferedRecords: Limite do buffer; put() bloqueia quando ele está cheio
+        :param maxConcurrentRequests: Número máximo de lotes enviados simultaneamente
+        '''
+        if packing not in PACKING_MODES:
+            raise ValueError('Modo de empacotamento inválido: %s' % packing)
+        if deliveryStreamName is None or not deliveryStreamName:
+            deliveryStreamName = firehose.config['aws']['firehose']['delivery_stream_name']
+
+        self.firehose = firehose
+        self.deliveryStreamName = deliveryStreamName
+        self.maxBatchRecords = min(maxBatchRecords, MAX_BATCH_RECORDS)
+        self.maxBatchBytes = min(maxBatchBytes, MAX_BATCH_BYTES)
+        self.lingerTime = lingerTime
+        self.packing = packing
+        self.gzipBlockSize = gzipBlockSize
+        self.maxRetries = maxRetries
+        self.retryBackoff = retryBackoff
+        self.maxBufferedRecords = maxBufferedRecords
+
+        # Limites do lote retirado do buffer, antes do empacotamento
+        if packing is None:
+            self.maxTakeRecords = self.maxBatchRecords
+            self.maxTakeBytes = self.maxBatchBytes
+        elif packing == PACKING_NEWLINE:
+            self.maxTakeRecords = None
+            self.maxTakeBytes = self.maxBatchBytes
+        else:
+            self.maxTakeRecords = None
+            self.maxTakeBytes = max(self.gzipBlockSize, self.maxBatchBytes)
+
+        self.buffer = collections.deque()
+        self.bufferedBytes = 0
+        self.firstBufferedTime = None
+        self.inFlight = 0
+        self.flushRequested = False
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.executor = ThreadPoolExecutor(max_workers=maxConcurrentRequests)
+        self.requestSlots = threading.BoundedSemaphore(maxConcurrentRequests)
+        self.sender = threading.Thread(target=self._run)
+        self.sender.daemon = True
+        self.sender.start()
+
+    def put(self, data, callback=None):
+        '''
+        Enfileira um registro para envio.
+
+        :param data: Conteúdo do registro: bytes, texto (codificado em UTF-8) ou
+                     objeto serializável em JSON
+        :param callback: Função opcional chamada com o Future quando o envio termina
+
+        :return: Future resolvido com o RecordId
+        '''
+        if isinstance(data, _TEXT_TYPE):
+            data = data.encode('utf-8')
+        elif not isinstance(data, bytes):
+            data = json.dumps(data).encode('utf-8')
+        if self.packing is not None and not data.endswith(b'\n'):
+            data += b'\n'
+
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        record = _BufferedRecord(data, future)
+        if record.size > MAX_RECORD_BYTES:
+            raise ValueError('O registro excede o limite de %d bytes do Firehose' % MAX_RECORD_BYTES)
+
+        with self.condition:
+            while len(self.buffer) >= self.maxBufferedRecords and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                raise RuntimeError('O escritor já foi encerrado')
+            if not self.buffer:
+                self.firstBufferedTime = time.time()
+            self.buffer.append(record)
+            self.bufferedBytes += record.size
+            if len(self.buffer) == 1 or self._isBatchReady():
+                self.condition.notify_all()
+        return future
+
+    def flush(self):
+        '''
+        Envia imediatamente os registros em buffer e aguarda a conclusão de todos
+        os envios pendentes.
+        '''
+        with self.condition:
+            self.flushRequested = True
+            self.condition.notify_all()
+            while (self.buffer or self.inFlight) and self.sender.is_alive():
+                self.condition.wait(0.1)
+            self.flushRequested = False
+
+    def close(self):
+        '''
+        Envia os registros pendentes e encerra as threads de envio.
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.sender.join()
+        self.executor.shutdown(wait=True)
+
+    def _isBatchReady(self):
+        return ((self.maxTakeRecords is not None and len(self.buffer) >= self.maxTakeRecords) or
+                self.bufferedBytes >= self.maxTakeBytes)
+
+    def _takeBatch(self):
+        batch = []
+        batchBytes = 0
+        while self.buffer:
+            if self.maxTakeRecords is not None and len(batch) >= self.maxTakeRecords:
+                break
+            record = self.buffer[0]
+            if batch and batchBytes + record.size > self.maxTakeBytes:
+                break
+            batch.append(self.buffer.popleft())
+            batchBytes += record.size
+        self.bufferedBytes -= batchBytes
+        self.firstBufferedTime = time.time() if self.buffer else None
+        return batch
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.buffer:
+                        if self.closed:
+                            return
+                        self.condition.wait()
+                        continue
+
+                    waited = time.time() - self.firstBufferedTime
+                    if (self._isBatchReady() or self.flushRequested or self.closed or
+                            waited >= self.lingerTime):
+                        break
+                    self.condition.wait(self.lingerTime - waited)
+
+                batch = self._takeBatch()
+                self.inFlight += len(batch)
+                # Libera produtores bloqueados pelo buffer cheio
+                self.condition.notify_all()
+
+            # Limita o número de lotes em andamento no pool
+            self.requestSlots.acquire()
+            self.executor.submit(self._processBatch, batch)
+
+    def _processBatch(self, batch):
+        try:
+            # Registros cancelados pelo chamador não são enviados; os demais passam
+            # a RUNNING e não podem mais ser cancelados
+            pending = [record for record in batch if record.future.set_running_or_notify_cancel()]
+            for request in self._splitRequests(self._buildEntries(pending)):
+                self._sendRequest(request)
+        except Exception as e:
+            logging.exception('Falha no processamento de lote do Firehose: %s', e)
+            for record in batch:
+                if not record.future.done():
+                    record.future.set_exception(e)
+        finally:
+            self.requestSlots.release()
+            with self.condition:
+                self.inFlight -= len(batch)
+                self.condition.notify_all()
+
+    def _buildEntries(self, records):
+        '''
+        Gera as entradas do PutRecordBatch, cada uma com os registros de usuário
+        que ela contém.
+        '''
+        if self.packing is None:
+            return [(record.data, [record]) for record in records]
+
+        blockSize = MAX_RECORD_BYTES if self.packing == PACKING_NEWLINE else self.gzipBlockSize
+        groups = []
+        group = []
+        groupBytes = 0
+        for record in records:
+            if group and groupBytes + record.size > blockSize:
+                groups.append(group)
+                group = []
+                groupBytes = 0
+            group.append(record)
+            groupBytes += record.size
+        if group:
+            groups.append(group)
+
+        if self.packing == PACKING_NEWLINE:
+            return [(b''.join(record.data for record in group), group) for group in groups]
+
+        entries = []
+        for group in groups:
+            entries.extend(self._compressGroup(group))
+        return entries
+
+    def _compressGroup(self, group):
+        '''
+        Comprime um grupo de registros em um blob gzip; se o resultado exceder o
+        limite de um registro do Firehose, o grupo é dividido ao meio.
+        '''
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        data = compressor.compress(b''.join(record.data for record in group)) + compressor.flush()
+        if len(data) <= MAX_RECORD_BYTES:
+            return [(data, group)]
+        if len(group) == 1:
+            group[0].future.set_exception(
+                ValueError('O registro comprimido excede o limite de %d bytes do Firehose' %
+                           MAX_RECORD_BYTES))
+            return []
+        middle = len(group) // 2
+        return self._compressGroup(group[:middle]) + self._compressGroup(group[middle:])
+
+    def _splitRequests(self, entries):
+        '''
+        Divide as entradas em requisições dentro dos limites do PutRecordBatch.
+        '''
+        request = []
+        requestBytes = 0
+        for data, records in entries:
+            if request and (len(request) >= self.maxBatchRecords or
+                            requestBytes + len(data) > self.maxBatchBytes):
+                yield request
+                request = []
+                requestBytes = 0
+            request.append((data, records))
+            requestBytes += len(data)
+        if request:
+            yield request
+
+    def _sendRequest(self, request):
+        pending = request
+        attempts = 0
+        while pending:
+            try:
+                response = self.firehose.putRecordBatch([data for data, _ in pending],
+                                                        self.deliveryStreamName)
+                results = response['RequestResponses']
+            except Exception as e:
+                logging.warning('Falha no envio de lote ao Firehose: %s', e)
+                results = [{'ErrorCode': getErrorCode(e), 'ErrorMessage': str(e)}] * len(pending)
+
+            attempts += 1
+            failed = []
+            for (data, records), result in zip(pending, results):
+                if 'ErrorCode' not in result or result['ErrorCode'] is None:
+                    for record in records:
+                        record.future.set_result(result['RecordId'])
+                elif attempts > self.maxRetries:
+                    error = FirehosePutError(result['ErrorCode'], result.get('ErrorMessage'))
+                    for record in records:
+                        record.future.set_exception(error)
+                else:
+                    failed.append((data, records))
+
+            if failed:
+                time.sleep(self.retryBackoff * (2 ** (attempts - 1)))
+            pending = failed
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Agregação e desagregação de registros no formato do KPL (Kinesis Producer
+Library).
+
+Um registro agregado é composto por:
+
+    magic (F3 89 9A C2) + AggregatedRecord (protobuf) + MD5(AggregatedRecord)
+
+    message AggregatedRecord {
+        repeated string partition_key_table = 1;
+        repeated string explicit_hash_key_table = 2;
+        repeated Record records = 3;
+    }
+    message Record {
+        required uint64 partition_key_index = 1;
+        optional uint64 explicit_hash_key_index = 2;
+        required bytes data = 3;
+        repeated Tag tags = 4;
+    }
+
+Esse é o formato lido pela KCL e pelas bibliotecas de desagregação usadas em
+funções Lambda.
+'''
+
+import hashlib
+
+
+AGGREGATION_MAGIC = b'\xf3\x89\x9a\xc2'
+# Tamanho máximo de um registro do Kinesis (dados + partition key)
+MAX_AGGREGATED_SIZE = 1024 * 1024
+_DIGEST_SIZE = 16
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_LENGTH_DELIMITED = 2
+_WIRE_FIXED32 = 5
+
+
+def _encodeVarint(value):
+    encoded = bytearray()
+    while True:
+        towrite = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(towrite | 0x80)
+        else:
+            encoded.append(towrite)
+            return bytes(encoded)
+
+
+def _decodeVarint(buf, position):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def _encodeLengthDelimited(fieldNumber, payload):
+    return (_encodeVarint((fieldNumber << 3) | _WIRE_LENGTH_DELIMITED) +
+            _encodeVarint(len(payload)) + payload)
+
+
+def _encodeVarintField(fieldNumber, value):
+    return _encodeVarint((fieldNumber << 3) | _WIRE_VARINT) + _encodeVarint(value)
+
+
+def _iterFields(buf, start, end):
+    '''
+    Gera (número do campo, valor) de uma mensagem protobuf em buf[start:end].
+    Campos length-delimited são retornados como (início, fim) em buf.
+    '''
+    position = start
+    while position < end:
+        key, position = _decodeVarint(buf, position)
+        fieldNumber = key >> 3
+        wireType = key & 0x7
+        if wireType == _WIRE_VARINT:
+            value, position = _decodeVarint(buf, position)
+        elif wireType == _WIRE_LENGTH_DELIMITED:
+            length, position = _decodeVarint(buf, position)
+            value = (position, position + length)
+            position += length
+        elif wireType == _WIRE_FIXED64:
+            value = None
+            position += 8
+        elif wireType == _WIRE_FIXED32:
+            value = None
+            position += 4
+        else:
+            raise ValueError('Tipo de campo protobuf não suportado: %d' % wireType)
+        if position > end:
+            raise ValueError('Mensagem protobuf truncada')
+        yield fieldNumber, value
+
+
+def getHashKey(partitionKey, explicitHashKey=None):
+    '''
+    Hash key efetiva (inteiro de 128 bits) usada pelo Kinesis para escolher o
+    shard de um registro: a explicitHashKey, se informada, ou o MD5 da
+    partition key.
+    '''
+    if explicitHashKey is not None:
+        return int(explicitHashKey)
+    return int(hashlib.md5(partitionKey.encode('utf-8')).hexdigest(), 16)
+
+
+class AggregatedRecord(object):
+    '''
+    Registro do Kinesis em formação, agrupando vários registros de usuário.
+    '''
+
+    def __init__(self, partitionKey, explicitHashKey, overrideHashKeys):
+        self.partitionKey = partitionKey
+        self.explicitHashKey = explicitHashKey
+        self.overrideHashKeys = overrideHashKeys
+        self.partitionKeys = {}
+        self.explicitHashKeys = {}
+        self.encodedTables = []
+        self.encodedRecords = []
+        self.userObjects = []
+        self.protobufSize = 0
+
+    def _entrySize(self, partitionKey, explicitHashKey, data):
+        size = 0
+        pkIndex = self.partitionKeys.get(partitionKey)
+        if pkIndex is None:
+            pkIndex = len(self.partitionKeys)
+            size += len(_encodeLengthDelimited(1, partitionKey.encode('utf-8')))
+        recordSize = len(_encodeVarintField(1, pkIndex)) + len(_encodeLengthDelimited(3, data))
+        if explicitHashKey is not None:
+            ehkIndex = self.explicitHashKeys.get(explicitHashKey)
+            if ehkIndex is None:
+                ehkIndex = len(self.explicitHashKeys)
+                size += len(_encodeLengthDelimited(2, explicitHashKey.encode('utf-8')))
+            recordSize += len(_encodeVarintField(2, ehkIndex))
+        return size + len(_encodeVarint(recordSize)) + 1 + recordSize
+
+    def getSize(self, extraBytes=0):
+        '''
+        Tamanho do registro do Kinesis resultante (dados + partition key).
+        '''
+        return (len(AGGREGATION_MAGIC) + self.protobufSize + extraBytes + _DIGEST_SIZE +
+                len(self.partitionKey.encode('utf-8')))
+
+    def fits(self, partitionKey, explicitHashKey, data, maxSize):
+        if self.overrideHashKeys:
+            explicitHashKey = self.explicitHashKey
+        return self.getSize(self._entrySize(partitionKey, explicitHashKey, data)) <= maxSize
+
+    def add(self, partitionKey, explicitHashKey, data, userObject):
+        if self.overrideHashKeys:
+            explicitHashKey = self.explicitHashKey
+
+        pkIndex = self.partitionKeys.get(partitionKey)
+        if pkIndex is None:
+            pkIndex = self.partitionKeys[partitionKey] = len(self.partitionKeys)
+            self._addTableEntry(_encodeLengthDelimited(1, partitionKey.encode('utf-8')))
+
+        record = _encodeVarintField(1, pkIndex)
+        if explicitHashKey is not None:
+            ehkIndex = self.explicitHashKeys.get(explicitHashKey)
+            if ehkIndex is None:
+                ehkIndex = self.explicitHashKeys[explicitHashKey] = len(self.explicitHashKeys)
+                self._addTableEntry(_encodeLengthDelimited(2, explicitHashKey.encode('utf-8')))
+            record += _encodeVarintField(2, ehkIndex)
+        record += _encodeLengthDelimited(3, data)
+
+        encodedRecord = _encodeLengthDelimited(3, record)
+        self.encodedRecords.append(encodedRecord)
+        self.protobufSize += len(encodedRecord)
+        self.userObjects.append(userObject)
+
+    def _addTableEntry(self, encodedEntry):
+        self.encodedTables.append(encodedEntry)
+        self.protobufSize += len(encodedEntry)
+
+    def __len__(self):
+        return len(self.userObjects)
+
+    def serialize(self):
+        '''
+        Gera os bytes do registro agregado (magic + protobuf + MD5).
+        '''
+        message = b''.join(self.encodedTables) + b''.join(self.encodedRecords)
+        return AGGREGATION_MAGIC + message + hashlib.md5(message).digest()
+
+    def toEntry(self):
+        '''
+        Gera a entrada no formato do PutRecords.
+        '''
+        entry = {'Data': self.serialize(), 'PartitionKey': self.partitionKey}
+        if self.explicitHashKey is not None:
+            entry['ExplicitHashKey'] = self.explicitHashKey
+        return entry
+
+
+class KinesisAggregator:
+    '''
+    Agrupa registros de usuário em registros agregados do Kinesis.
+
+    Os registros agregados recebem como partition key a do primeiro registro
+    de usuário e como ExplicitHashKey a hash key efetiva dele, o que determina
+    o shard de destino de todo o agregado.
+
+    Com shardResolver (função de hash key -> identificador do shard), os
+    registros só são agregados com outros do mesmo shard, preservando a
+    distribuição e a ordem por partition key. Sem ele, quaisquer registros são
+    agregados juntos (exceto os que têm ExplicitHashKey própria, agrupados por
+    ela) e cada registro de usuário recebe a hash key do agregado,
+    para que consumidores que filtram por faixa de hash do shard (KCL) não os
+    descartem; nesse modo a ordem por partition key não é garantida entre
+    agregados diferentes.
+    '''
+
+    def __init__(self, maxSize=MAX_AGGREGATED_SIZE, shardResolver=None):
+        '''
+        Construtor
+
+        :param maxSize: Tamanho máximo de cada registro agregado (até 1 MB)
+        :param shardResolver: Função opcional que recebe a hash key (int) e retorna
+                              o identificador do shard correspondente
+        '''
+        self.maxSize = min(maxSize, MAX_AGGREGATED_SIZE)
+        self.shardResolver = shardResolver
+        self.openRecords = {}
+
+    def addRecord(self, partitionKey, data, explicitHashKey=None, userObject=None):
+        '''
+        Acrescenta um registro de usuário.
+
+        :param partitionKey: Partition key do registro
+        :param data: Conteúdo do registro (bytes)
+        :param explicitHashKey: Hash key explícita do registro
+        :param userObject: Objeto qualquer associado ao registro, devolvido em
+                           AggregatedRecord.userObjects
+
+        :return: Lista de registros agregados completados por esta inclusão
+        '''
+        hashKey = getHashKey(partitionKey, explicitHashKey)
+        if self.shardResolver is not None:
+            groupId = self.shardResolver(hashKey)
+        else:
+            # Registros com hash key explícita só são agregados com outros de
+            # mesma hash key, para não perder o direcionamento pedido
+            groupId = explicitHashKey
+
+        completed = []
+        current = self.openRecords.get(groupId)
+        if current is not None and not current.fits(partitionKey, explicitHashKey, data, self.maxSize):
+            completed.append(current)
+            current = None
+
+        if current is None:
+            current = AggregatedRecord(partitionKey, str(hashKey), self.shardResolver is None)
+            if not current.fits(partitionKey, explicitHashKey, data, self.maxSize):
+                raise ValueError('O registro excede o tamanho máximo de um registro agregado')
+            self.openRecords[groupId] = current
+
+        current.add(partitionKey, explicitHashKey, data, userObject)
+        return completed
+
+    def flush(self):
+        '''
+        Encerra e retorna todos os registros agregados em formação.
+        '''
+        completed = [record for record in self.openRecords.values() if len(record)]
+        self.openRecords = {}
+        return completed
+
+
+def isAggregated(data):
+    '''
+    Indica se os dados de um registro do Kinesis estão no formato agregado.
+    '''
+    return (len(data) > len(AGGREGATION_MAGIC) + _DIGEST_SIZE and
+            data[:len(AGGREGATION_MAGIC)] == AGGREGATION_MAGIC)
+
+
+def deaggregate(data):
+    '''
+    Extrai os registros de usuário de um registro agregado.
+
+    :param data: Conteúdo (bytes) de um registro do Kinesis
+
+    :return: Lista de tuplas (partitionKey, explicitHashKey, dados), ou None se os
+             dados não estiverem no formato agregado ou o MD5 não conferir
+    '''
+    if not isAggregated(data):
+        return None
+
+    message = data[len(AGGREGATION_MAGIC):-_DIGEST_SIZE]
+    if hashlib.md5(message).digest() != data[-_DIGEST_SIZE:]:
+        return None
+
+    buf = bytearray(message)
+    partitionKeys = []
+    explicitHashKeys = []
+    records = []
+    for fieldNumber, value in _iterFields(buf, 0, len(buf)):
+        if fieldNumber == 1:
+            partitionKeys.append(bytes(buf[value[0]:value[1]]).decode('utf-8'))
+        elif fieldNumber == 2:
+            explicitHashKeys.append(bytes(buf[value[0]:value[1]]).decode('utf-8'))
+        elif fieldNumber == 3:
+            records.append(value)
+
+    result = []
+    for start, end in records:
+        pkIndex = None
+        ehkIndex = None
+        recordData = b''
+        for fieldNumber, value in _iterFields(buf, start, end):
+            if fieldNumber == 1:
+                pkIndex = value
+            elif fieldNumber == 2:
+                ehkIndex = value
+            elif fieldNumber == 3:
+                recordData = bytes(buf[value[0]:value[1]])
+        result.append((partitionKeys[pkIndex],
+                       explicitHashKeys[ehkIndex] if ehkIndex is not None else None,
+                       recordData))
+    return result
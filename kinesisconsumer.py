@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+import sqlite3
+import threading
+import time
+
+
+class KinesisCheckpointStore:
+    '''
+    Armazenamento local (SQLite) dos checkpoints de leitura dos shards.
+
+    Para cada aplicação, stream e shard guarda o último SequenceNumber
+    processado e se o shard (fechado) já foi lido até o fim.
+    '''
+
+    def __init__(self, dbPath):
+        '''
+        Construtor
+
+        :param dbPath: Caminho do arquivo SQLite dos checkpoints
+        '''
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(dbPath, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                          'application TEXT NOT NULL, '
+                          'stream TEXT NOT NULL, '
+                          'shard_id TEXT NOT NULL, '
+                          'sequence_number TEXT, '
+                          'finished INTEGER NOT NULL DEFAULT 0, '
+                          'PRIMARY KEY (application, stream, shard_id))')
+        self.conn.commit()
+
+    def getCheckpoint(self, application, stream, shardId):
+        '''
+        :return: Tupla (sequenceNumber, finished), ou (None, False) se não há checkpoint
+        '''
+        with self.lock:
+            row = self.conn.execute('SELECT sequence_number, finished FROM checkpoints '
+                                    'WHERE application = ? AND stream = ? AND shard_id = ?',
+                                    (application, stream, shardId)).fetchone()
+        if row is None:
+            return None, False
+        return row[0], bool(row[1])
+
+    def setCheckpoint(self, application, stream, shardId, sequenceNumber, finished=False):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO checkpoints '
+                              '(application, stream, shard_id, sequence_number, finished) '
+                              'VALUES (?, ?, ?, ?, ?)',
+                              (application, stream, shardId, sequenceNumber, int(finished)))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class KinesisConsumer:
+    '''
+    Consumidor de streams do Kinesis com um leitor por shard.
+
+    Os shards são descobertos periodicamente e lidos em paralelo por um pool
+    de threads. Shards filhos (gerados por split ou merge) só começam a ser
+    lidos depois que os shards pais foram lidos até o fim, preservando a ordem
+    dos registros por partition key.
+
+    Os registros são entregues ao handler em lotes (handler(shardId, registros))
+    e, após o handler retornar sem erro, o SequenceNumber do último registro é
+    gravado no KinesisCheckpointStore. Em um reinício, a leitura continua após
+    o último checkpoint. Se o handler falhar, o lote é relido a partir do
+    checkpoint anterior.
+
+    O intervalo entre leituras se adapta ao MillisBehindLatest: enquanto o
+    leitor está atrasado, as leituras são feitas no intervalo mínimo; quando
+    alcança o fim do shard, o intervalo cresce até o máximo.
+    '''
+
+    def __init__(self, kinesis, handler, applicationName, streamName=None,
+                 checkpointPath='kinesis_checkpoints.db', maxWorkers=4, batchSize=1000,
+                 minPollInterval=0.2, maxPollInterval=2.0, initialPosition='TRIM_HORIZON',
+                 shardRefreshInterval=30.0, maxShardRunTime=60.0, deaggregate=True):
+        '''
+        Construtor
+
+        :param kinesis: Instância de AWSKinesis
+        :param handler: Função chamada com (shardId, lista de registros)
+        :param applicationName: Nome da aplicação, que identifica os checkpoints
+        :param streamName: Nome do stream; se omitido, usa o da configuração
+        :param checkpointPath: Caminho do arquivo SQLite de checkpoints
+        :param maxWorkers: Número de shards lidos simultaneamente
+        :param batchSize: Número máximo de registros por GetRecords (até 10.000)
+        :param minPollInterval: Intervalo mínimo entre leituras de um shard, em segundos
+        :param maxPollInterval: Intervalo máximo entre leituras de um shard, em segundos
+        :param initialPosition: Posição inicial dos shards sem checkpoint existentes no
+                                início do consumo (TRIM_HORIZON ou LATEST); shards
+                                filhos, criados depois ou de pais já concluídos,
+                                são sempre lidos desde TRIM_HORIZON
+        :param shardRefreshInterval: Intervalo de redescoberta dos shards, em segundos
+        :param maxShardRunTime: Tempo máximo de leitura contínua de um shard antes de
+                                ceder a thread a outros shards, em segundos
+        :param deaggregate: Desagrega registros no formato do KPL
+        '''
+        self.kinesis = kinesis
+        self.handler = handler
+        self.applicationName = applicationName
+        if streamName is None or not streamName:
+            streamName = kinesis.config['aws']['kinesis']['stream_name']
+        self.streamName = streamName
+        self.checkpoints = KinesisCheckpointStore(checkpointPath)
+        self.maxWorkers = maxWorkers
+        self.batchSize = batchSize
+        self.minPollInterval = minPollInterval
+        self.maxPollInterval = maxPollInterval
+        self.initialPosition = initialPosition
+        self.shardRefreshInterval = shardRefreshInterval
+        self.maxShardRunTime = maxShardRunTime
+        self.deaggregate = deaggregate
+
+        self.activeShards = set()
+        # Shards existentes na primeira listagem e tipo de iterador inicial de cada shard
+        self.initialShards = None
+        self.iteratorTypes = {}
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.wakeEvent = threading.Event()
+
+    def run(self):
+        '''
+        Executa o consumo até que stop() seja chamado. Bloqueia a thread corrente.
+        '''
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            while not self.stopEvent.is_set():
+                for shardId in self._getReadyShards():
+                    with self.lock:
+                        if shardId in self.activeShards or len(self.activeShards) >= self.maxWorkers:
+                            continue
+                        self.activeShards.add(shardId)
+                    executor.submit(self._readShard, shardId)
+
+                self.wakeEvent.wait(self.shardRefreshInterval)
+                self.wakeEvent.clear()
+        finally:
+            self.stopEvent.set()
+            executor.shutdown(wait=True)
+
+    def start(self):
+        '''
+        Executa o consumo em uma thread em segundo plano.
+
+        :return: Thread iniciada
+        '''
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        '''
+        Sinaliza o encerramento do consumo; os leitores param após o lote corrente.
+        '''
+        self.stopEvent.set()
+        self.wakeEvent.set()
+
+    def _getReadyShards(self):
+        '''
+        Retorna os shards que podem ser lidos: não concluídos e cujos pais
+        (ainda existentes no stream) já foram lidos até o fim.
+        '''
+        try:
+            shardList = self.kinesis.getShardList(self.streamName, getOnlyOpenedShards=False)
+        except Exception as e:
+            logging.warning('Falha ao listar shards do stream %s: %s', self.streamName, e)
+            return []
+
+        knownShards = set(shardInfo['ShardId'] for shardInfo in shardList)
+        if self.initialShards is None:
+            self.initialShards = knownShards
+        finished = set()
+        for shardId in knownShards:
+            if self.checkpoints.getCheckpoint(self.applicationName, self.streamName, shardId)[1]:
+                finished.add(shardId)
+
+        ready = []
+        for shardInfo in shardList:
+            shardId = shardInfo['ShardId']
+            if shardId in finished:
+                continue
+            parents = [shardInfo.get('ParentShardId'), shardInfo.get('AdjacentParentShardId')]
+            if all(parent is None or parent not in knownShards or parent in finished
+                   for parent in parents):
+                # Filhos de um split ou merge são lidos desde o início: com LATEST, o
+                # que foi gravado neles enquanto os pais eram lidos seria perdido
+                if shardId in self.initialShards and not any(parent in finished
+                                                             for parent in parents):
+                    self.iteratorTypes.setdefault(shardId, self.initialPosition)
+                else:
+                    self.iteratorTypes.setdefault(shardId, 'TRIM_HORIZON')
+                ready.append(shardId)
+        return ready
+
+    def _getIterator(self, shardId):
+        sequenceNumber, _ = self.checkpoints.getCheckpoint(self.applicationName,
+                                                           self.streamName, shardId)
+        if sequenceNumber is not None:
+            return self.kinesis.getShardIterator(shardId, 'AFTER_SEQUENCE_NUMBER',
+                                                 sequenceNumber, self.streamName)
+        return self.kinesis.getShardIterator(shardId,
+                                             self.iteratorTypes.get(shardId, 'TRIM_HORIZON'),
+                                             streamName=self.streamName)
+
+    def _readShard(self, shardId):
+        startTime = time.time()
+        pollInterval = self.minPollInterval
+        try:
+            shardIterator = self._getIterator(shardId)
+            while not self.stopEvent.is_set():
+                try:
+                    response = self.kinesis.getRecords(shardIterator, self.batchSize)
+                except Exception as e:
+                    logging.warning('Falha na leitura do shard %s: %s', shardId, e)
+                    pollInterval = min(pollInterval * 2, self.maxPollInterval)
+                    self.stopEvent.wait(pollInterval)
+                    # O iterador pode ter expirado: recomeça do último checkpoint
+                    shardIterator = self._getIterator(shardId)
+                    continue
+
+                records = response.get('Records', [])
+                if records:
+                    lastSequenceNumber = records[-1]['SequenceNumber']
+                    if self.deaggregate:
+                        records = list(self.kinesis.deaggregateRecords(records))
+                    self.handler(shardId, records)
+                    self.checkpoints.setCheckpoint(self.applicationName, self.streamName,
+                                                   shardId, lastSequenceNumber)
+
+                shardIterator = response.get('NextShardIterator')
+                if shardIterator is None:
+                    # Shard fechado e lido até o fim: libera a leitura dos filhos
+                    sequenceNumber, _ = self.checkpoints.getCheckpoint(self.applicationName,
+                                                                       self.streamName, shardId)
+                    self.checkpoints.setCheckpoint(self.applicationName, self.streamName,
+                                                   shardId, sequenceNumber, finished=True)
+                    self.wakeEvent.set()
+                    return
+
+                if time.time() - startTime >= self.maxShardRunTime:
+                    return
+
+                if response.get('MillisBehindLatest', 0) > 0 and records:
+                    pollInterval = self.minPollInterval
+                else:
+                    pollInterval = min(pollInterval * 2, self.maxPollInterval)
+                self.stopEvent.wait(pollInterval)
+        except Exception as e:
+            logging.exception('Leitura do shard %s interrompida: %s', shardId, e)
+            # Evita releituras imediatas e sucessivas de um lote que falhou
+            self.stopEvent.wait(self.maxPollInterval)
+        finally:
+            with self.lock:
+                self.activeShards.discard(shardId)
+            self.wakeEvent.set()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+import json
+import logging
+import threading
+import time
+
+
+# Limites superiores (em milissegundos) das faixas do histograma de latência
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# Código de erro do Kinesis para escrita acima da capacidade do shard
+THROTTLING_ERROR = 'ProvisionedThroughputExceededException'
+
+
+def getErrorCode(exception):
+    '''
+    Código de erro de uma exceção do cliente boto3 (ex.:
+    ProvisionedThroughputExceededException), ou o nome da classe da exceção.
+    '''
+    response = getattr(exception, 'response', None)
+    if isinstance(response, dict):
+        errorCode = response.get('Error', {}).get('Code')
+        if errorCode:
+            return errorCode
+    return type(exception).__name__
+
+
+class LatencyHistogram(object):
+    '''
+    Histograma de latências em faixas fixas (LATENCY_BUCKETS), com contagem,
+    soma e máximo. O registro de uma amostra custa uma busca binária e um
+    incremento, independente do número de amostras.
+    '''
+
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, latencyMs):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, latencyMs)] += 1
+        self.count += 1
+        self.total += latencyMs
+        if latencyMs > self.maximum:
+            self.maximum = latencyMs
+
+    def getPercentile(self, percentile):
+        '''
+        Estimativa do percentil (limite superior da faixa que o contém).
+
+        :param percentile: Percentil entre 0 e 100
+        '''
+        if not self.count:
+            return 0.0
+        threshold = self.count * percentile / 100.0
+        accumulated = 0
+        for index, bucketCount in enumerate(self.counts):
+            accumulated += bucketCount
+            if accumulated >= threshold and bucketCount:
+                if index < len(LATENCY_BUCKETS):
+                    return float(min(LATENCY_BUCKETS[index], self.maximum))
+                break
+        return self.maximum
+
+    def toDict(self):
+        buckets = {}
+        for index, bucketCount in enumerate(self.counts):
+            if not bucketCount:
+                continue
+            if index < len(LATENCY_BUCKETS):
+                buckets['<=%d' % LATENCY_BUCKETS[index]] = bucketCount
+            else:
+                buckets['>%d' % LATENCY_BUCKETS[-1]] = bucketCount
+
+        return {
+            'Count': self.count,
+            'Mean': self.total / self.count if self.count else 0.0,
+            'Max': self.maximum,
+            'P50': self.getPercentile(50),
+            'P90': self.getPercentile(90),
+            'P99': self.getPercentile(99),
+            'Buckets': buckets
+        }
+
+
+class _Counters(object):
+    __slots__ = ('latency', 'requests', 'records', 'bytes', 'throttled', 'errors', 'retries')
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.records = 0
+        self.bytes = 0
+        self.throttled = 0
+        self.errors = 0
+        self.retries = 0
+
+    def toDict(self, interval):
+        return {
+            'Requests': self.requests,
+            'Records': self.records,
+            'Bytes': self.bytes,
+            'RecordsPerSecond': self.records / interval,
+            'BytesPerSecond': self.bytes / interval,
+            'Throttled': self.throttled,
+            'Errors': self.errors,
+            'Retries': self.retries,
+            'Latency': self.latency.toDict()
+        }
+
+
+class KinesisMetrics:
+    '''
+    Métricas de escrita no Kinesis, por stream e por shard: histograma de
+    latência das requisições, registros e bytes gravados (e as taxas por
+    segundo), registros recusados por ProvisionedThroughputExceeded, demais
+    erros e reenvios.
+
+    As métricas são acumuladas desde a criação ou o último reset e lidas com
+    getSnapshot().
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.streams = {}
+        self.shards = {}
+        self.windowStart = time.time()
+
+    def _getCounters(self, streamName, shardId=None):
+        if shardId is None:
+            counters = self.streams.get(streamName)
+            if counters is None:
+                counters = self.streams[streamName] = _Counters()
+            return counters
+
+        streamShards = self.shards.get(streamName)
+        if streamShards is None:
+            streamShards = self.shards[streamName] = {}
+        counters = streamShards.get(shardId)
+        if counters is None:
+            counters = streamShards[shardId] = _Counters()
+        return counters
+
+    def recordPut(self, streamName, latency, entries, results, shardResolver=None):
+        '''
+        Registra o resultado de uma requisição PutRecord/PutRecords.
+
+        :param streamName: Nome do stream
+        :param latency: Duração da requisição, em segundos
+        :param entries: Registros enviados ({'Data', 'PartitionKey', 'ExplicitHashKey'})
+        :param results: Resultado de cada registro ({'ShardId', ...} ou {'ErrorCode', ...})
+        :param shardResolver: Função opcional (partitionKey, explicitHashKey) -> ShardId, usada
+                              para atribuir a um shard os registros que falharam
+        '''
+        latencyMs = latency * 1000.0
+        with self.lock:
+            streamCounters = self._getCounters(streamName)
+            streamCounters.requests += 1
+            streamCounters.latency.add(latencyMs)
+
+            requestShards = set()
+            for entry, result in zip(entries, results):
+                shardId = result.get('ShardId')
+                if shardId is None and shardResolver is not None:
+                    shardId = shardResolver(entry['PartitionKey'], entry.get('ExplicitHashKey'))
+                shardCounters = self._getCounters(streamName, shardId) if shardId else None
+
+                errorCode = result.get('ErrorCode')
+                if errorCode is None:
+                    size = len(entry['Data'])
+                    streamCounters.records += 1
+                    streamCounters.bytes += size
+                    if shardCounters is not None:
+                        shardCounters.records += 1
+                        shardCounters.bytes += size
+                elif errorCode == THROTTLING_ERROR:
+                    streamCounters.throttled += 1
+                    if shardCounters is not None:
+                        shardCounters.throttled += 1
+                else:
+                    streamCounters.errors += 1
+                    if shardCounters is not None:
+                        shardCounters.errors += 1
+
+                if shardCounters is not None and shardId not in requestShards:
+                    requestShards.add(shardId)
+                    shardCounters.requests += 1
+                    shardCounters.latency.add(latencyMs)
+
+    def recordRequestError(self, streamName, latency, recordCount, errorCode):
+        '''
+        Registra uma requisição que falhou por inteiro (exceção do cliente).
+
+        :param streamName: Nome do stream
+        :param latency: Duração da requisição, em segundos
+        :param recordCount: Número de registros da requisição
+        :param errorCode: Código do erro retornado pelo Kinesis
+        '''
+        with self.lock:
+            counters = self._getCounters(streamName)
+            counters.requests += 1
+            counters.latency.add(latency * 1000.0)
+            if errorCode == THROTTLING_ERROR:
+                counters.throttled += recordCount
+            else:
+                counters.errors += recordCount
+
+    def recordRetries(self, streamName, recordCount):
+        '''
+        Registra reenvios de registros.
+        '''
+        with self.lock:
+            self._getCounters(streamName).retries += recordCount
+
+    def getSnapshot(self, reset=False):
+        '''
+        Retorna as métricas acumuladas.
+
+        :param reset: Zera as métricas após a leitura (inicia nova janela)
+
+        :return: Dicionário com Interval (duração da janela, em segundos) e
+                 Streams (nome -> métricas do stream, com as métricas por shard
+                 em Shards)
+        '''
+        with self.lock:
+            now = time.time()
+            interval = max(now - self.windowStart, 1e-6)
+            snapshot = {'Timestamp': now, 'Interval': interval, 'Streams': {}}
+            for streamName, counters in self.streams.items():
+                streamSnapshot = counters.toDict(interval)
+                streamSnapshot['Shards'] = dict(
+                    (shardId, shardCounters.toDict(interval))
+                    for shardId, shardCounters in self.shards.get(streamName, {}).items())
+                snapshot['Streams'][streamName] = streamSnapshot
+
+            if reset:
+                self.streams = {}
+                self.shards = {}
+                self.windowStart = now
+        return snapshot
+
+
+def logSnapshot(snapshot):
+    '''
+    Exportador padrão: registra o snapshot no log, em JSON.
+    '''
+    logging.info('Métricas do Kinesis: %s', json.dumps(snapshot, sort_keys=True))
+
+
+class KinesisMetricsExporter:
+    '''
+    Exporta periodicamente as métricas de um KinesisMetrics, em uma thread em
+    segundo plano. A cada intervalo, o snapshot da janela é entregue ao
+    exportador (ex.: log, CloudWatch) e as métricas são zeradas.
+    '''
+
+    def __init__(self, metrics, exporter=logSnapshot, interval=60.0):
+        '''
+        Construtor
+
+        :param metrics: Instância de KinesisMetrics
+        :param exporter: Função chamada com cada snapshot
+        :param interval: Intervalo entre exportações, em segundos
+        '''
+        self.metrics = metrics
+        self.exporter = exporter
+        self.interval = interval
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopEvent.wait(self.interval):
+            self._export()
+
+    def _export(self):
+        try:
+            self.exporter(self.metrics.getSnapshot(reset=True))
+        except Exception as e:
+            logging.warning('Falha na exportação das métricas do Kinesis: %s', e)
+
+    def stop(self):
+        '''
+        Encerra a exportação periódica, exportando a última janela.
+        '''
+        self.stopEvent.set()
+        self.thread.join()
+        self._export()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from kinesisaggregation import getHashKey
+
+import bisect
+import collections
+import itertools
+import logging
+import threading
+import time
+
+
+# Modos de escolha da ExplicitHashKey
+MODE_HASH = 'hash'
+MODE_BALANCED = 'balanced'
+PARTITIONER_MODES = (MODE_HASH, MODE_BALANCED)
+# Espera mínima entre tentativas de recarga do índice após uma falha, em segundos
+REFRESH_RETRY_DELAY = 5.0
+
+
+class KinesisPartitioner:
+    '''
+    Particionador de registros ciente das faixas de hash dos shards.
+
+    As faixas de hash key dos shards abertos são mantidas em um índice
+    ordenado pela hash key inicial, e a localização do shard de uma hash key
+    é uma busca binária. O índice é uma tupla imutável, substituída por
+    inteiro a cada recarga, e pode ser lido sem o lock.
+
+    Modos:
+
+        hash: mantém o roteamento padrão do Kinesis (MD5 da partition key),
+              sem ExplicitHashKey; útil só para localizar shards e contar envios.
+        balanced: no primeiro uso, cada partition key é atribuída ao shard
+                  aberto menos carregado (menos registros enviados; em caso
+                  de empate, menos chaves atribuídas) e fica fixada nele, com
+                  a ExplicitHashKey no meio da faixa do shard, preservando a
+                  ordem por partition key. Após um reshard, a chave segue para
+                  o shard filho que contém esse ponto. As atribuições são
+                  mantidas para as maxAssignedKeys chaves usadas mais
+                  recentemente; uma chave descartada é reatribuída no próximo
+                  uso.
+
+    Em ambos os modos, registros sem partition key são distribuídos em rodízio
+    entre os shards, e chaves fixadas com pinKey() vão sempre ao mesmo ponto
+    do espaço de hash.
+
+    O índice é recarregado a cada refreshInterval segundos e, após um envio
+    que retorna um ShardId desconhecido (sinal de split ou merge), no cálculo
+    da próxima ExplicitHashKey. Falhas na recarga são registradas em log e não
+    interrompem os envios: o índice anterior continua em uso até a próxima
+    tentativa.
+    '''
+
+    def __init__(self, kinesis, streamName=None, mode=MODE_BALANCED, refreshInterval=60.0,
+                 maxAssignedKeys=100000):
+        '''
+        Construtor
+
+        :param kinesis: Instância de AWSKinesis usada na listagem dos shards
+        :param streamName: Nome do stream; se omitido, usa o da configuração
+        :param mode: 'hash' ou 'balanced'
+        :param refreshInterval: Intervalo máximo entre recargas do índice, em segundos
+                                (None desativa a recarga periódica)
+        :param maxAssignedKeys: Número máximo de partition keys com shard atribuído
+                                (modo balanced)
+        '''
+        if mode not in PARTITIONER_MODES:
+            raise ValueError('Modo de particionamento inválido: %s' % mode)
+
+        self.kinesis = kinesis
+        self.streamName = streamName
+        self.mode = mode
+        self.refreshInterval = refreshInterval
+        self.maxAssignedKeys = maxAssignedKeys
+
+        # Tupla (startKeys, endKeys, shardIds, knownShards)
+        self.shardIndex = ([], [], [], frozenset())
+        self.lastRefresh = None
+        self.stale = False
+        self.retryAfter = 0
+        self.pinnedKeys = {}
+        # Partition key -> ExplicitHashKey atribuída (modo balanced), da menos à
+        # mais recentemente usada
+        self.assignedKeys = collections.OrderedDict()
+        self.keyCounts = {}
+        self.putCounts = {}
+        self.putBytes = {}
+        self.roundRobin = itertools.count()
+        self.lock = threading.Lock()
+
+        self.refresh()
+
+    def refresh(self):
+        '''
+        Recarrega as faixas de hash dos shards abertos do stream.
+        '''
+        shardRanges = []
+        for shardInfo in self.kinesis.getShardList(self.streamName):
+            hashRange = shardInfo['HashKeyRange']
+            shardRanges.append((int(hashRange['StartingHashKey']),
+                                int(hashRange['EndingHashKey']),
+                                shardInfo['ShardId']))
+        shardRanges.sort()
+
+        shardIds = [shardId for _, _, shardId in shardRanges]
+        shardIndex = ([startKey for startKey, _, _ in shardRanges],
+                      [endKey for _, endKey, _ in shardRanges],
+                      shardIds,
+                      frozenset(shardIds))
+
+        with self.lock:
+            self.shardIndex = shardIndex
+            self.lastRefresh = time.time()
+            self.stale = False
+
+    def _refreshIfExpired(self):
+        now = time.time()
+        expired = (self.refreshInterval is not None and
+                   now - self.lastRefresh >= self.refreshInterval)
+        if not (self.stale or expired) or now < self.retryAfter:
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.warning('Falha na recarga dos shards do stream %s: %s', self.streamName, e)
+            self.retryAfter = now + REFRESH_RETRY_DELAY
+
+    def getShardId(self, hashKey):
+        '''
+        Localiza o shard aberto que contém a hash key.
+
+        :param hashKey: Hash key (inteiro de 128 bits)
+
+        :return: ShardId, ou None se nenhum shard aberto contém a hash key
+        '''
+        startKeys, endKeys, shardIds, _ = self.shardIndex
+        index = self._findIndex(startKeys, endKeys, hashKey)
+        if index is None:
+            return None
+        return shardIds[index]
+
+    @staticmethod
+    def _findIndex(startKeys, endKeys, hashKey):
+        index = bisect.bisect_right(startKeys, hashKey) - 1
+        if index < 0 or hashKey > endKeys[index]:
+            return None
+        return index
+
+    def getShardForKey(self, partitionKey, explicitHashKey=None):
+        '''
+        Localiza o shard de destino de um registro.
+        '''
+        return self.getShardId(getHashKey(partitionKey, explicitHashKey))
+
+    @staticmethod
+    def _getMiddleHashKey(startKeys, endKeys, index):
+        return str((startKeys[index] + endKeys[index]) // 2)
+
+    def pinKey(self, partitionKey, shardId):
+        '''
+        Fixa uma partition key em um shard: os registros dela recebem uma
+        ExplicitHashKey no meio da faixa do shard. Após um reshard, a chave
+        continua no mesmo ponto do espaço de hash e segue para o shard filho
+        que o contém.
+
+        :param partitionKey: Partition key a fixar
+        :param shardId: Shard aberto de destino
+        '''
+        startKeys, endKeys, shardIds, knownShards = self.shardIndex
+        if shardId not in knownShards:
+            raise ValueError('Shard inexistente ou fechado: %s' % shardId)
+        with self.lock:
+            self.pinnedKeys[partitionKey] = self._getMiddleHashKey(startKeys, endKeys,
+                                                                   shardIds.index(shardId))
+
+    def unpinKey(self, partitionKey):
+        with self.lock:
+            self.pinnedKeys.pop(partitionKey, None)
+
+    def getExplicitHashKey(self, partitionKey=None):
+        '''
+        Calcula a ExplicitHashKey de um registro.
+
+        :param partitionKey: Partition key do registro; None para registros sem
+                             chave (sem requisito de ordem)
+
+        :return: ExplicitHashKey (texto), ou None para usar o roteamento padrão
+        '''
+        self._refreshIfExpired()
+
+        if partitionKey is not None:
+            pinned = self.pinnedKeys.get(partitionKey)
+            if pinned is not None:
+                return pinned
+
+        startKeys, endKeys, shardIds, _ = self.shardIndex
+        if not shardIds:
+            return None
+        if partitionKey is None:
+            with self.lock:
+                position = next(self.roundRobin)
+            return self._getMiddleHashKey(startKeys, endKeys, position % len(shardIds))
+        if self.mode == MODE_HASH:
+            return None
+
+        with self.lock:
+            hashKey = self.assignedKeys.pop(partitionKey, None)
+            if hashKey is None:
+                shardId = min(shardIds, key=lambda shardId: (self.putCounts.get(shardId, 0),
+                                                             self.keyCounts.get(shardId, 0)))
+                self.keyCounts[shardId] = self.keyCounts.get(shardId, 0) + 1
+                hashKey = self._getMiddleHashKey(startKeys, endKeys, shardIds.index(shardId))
+                if len(self.assignedKeys) >= self.maxAssignedKeys:
+                    self.assignedKeys.popitem(last=False)
+            # Passa a ser a chave mais recentemente usada
+            self.assignedKeys[partitionKey] = hashKey
+        return hashKey
+
+    def recordPut(self, shardId, byteCount=0, recordCount=1):
+        '''
+        Contabiliza registros enviados a um shard. Um ShardId fora do índice
+        indica que o stream foi reparticionado: o índice é marcado como
+        desatualizado e recarregado no próximo getExplicitHashKey (nunca aqui,
+        para que uma falha na listagem dos shards não afete um envio já feito).
+
+        :param shardId: ShardId retornado pelo Kinesis
+        :param byteCount: Bytes enviados
+        :param recordCount: Número de registros enviados
+        '''
+        with self.lock:
+            self.putCounts[shardId] = self.putCounts.get(shardId, 0) + recordCount
+            self.putBytes[shardId] = self.putBytes.get(shardId, 0) + byteCount
+        if shardId not in self.shardIndex[3]:
+            self.stale = True
+
+    def getShardStats(self):
+        '''
+        Estatísticas dos shards abertos.
+
+        :return: Lista de dicionários com ShardId, StartingHashKey, EndingHashKey,
+                 PutCount e PutBytes, na ordem do espaço de hash
+        '''
+        startKeys, endKeys, shardIds, _ = self.shardIndex
+        with self.lock:
+            return [{'ShardId': shardId,
+                     'StartingHashKey': str(startKey),
+                     'EndingHashKey': str(endKey),
+                     'PutCount': self.putCounts.get(shardId, 0),
+                     'PutBytes': self.putBytes.get(shardId, 0)}
+                    for startKey, endKey, shardId in zip(startKeys, endKeys, shardIds)]
+
+    def getHotShards(self, ratio=2.0):
+        '''
+        Shards abertos que receberam mais que ratio vezes a média de registros.
+
+        :param ratio: Múltiplo da média a partir do qual o shard é considerado quente
+
+        :return: Lista de ShardIds, do mais ao menos carregado
+        '''
+        stats = self.getShardStats()
+        if not stats:
+            return []
+        mean = float(sum(item['PutCount'] for item in stats)) / len(stats)
+        hotShards = [item for item in stats if mean and item['PutCount'] > ratio * mean]
+        hotShards.sort(key=lambda item: item['PutCount'], reverse=True)
+        return [item['ShardId'] for item in hotShards]
+
+    def resetCounts(self):
+        with self.lock:
+            self.putCounts = {}
+            self.putBytes = {}
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import Future
+from kinesisaggregation import KinesisAggregator
+from kinesismetrics import getErrorCode
+
+import collections
+import logging
+import sys
+import threading
+import time
+import uuid
+
+
+# Limites do PutRecords
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+MAX_RECORD_BYTES = 1024 * 1024
+
+
+class KinesisPutError(Exception):
+    '''
+    Falha definitiva no envio de um registro ao Kinesis.
+    '''
+
+    def __init__(self, errorCode, errorMessage=None):
+        super(KinesisPutError, self).__init__('%s: %s' % (errorCode, errorMessage))
+        self.errorCode = errorCode
+        self.errorMessage = errorMessage
+
+
+class _BufferedRecord(object):
+    __slots__ = ('data', 'partitionKey', 'explicitHashKey', 'future', 'size', 'attempts')
+
+    def __init__(self, data, partitionKey, explicitHashKey, future):
+        self.data = data
+        self.partitionKey = partitionKey
+        self.explicitHashKey = explicitHashKey
+        self.future = future
+        # O limite de tamanho do Kinesis considera dados + partition key
+        self.size = len(data) + len(partitionKey.encode('utf-8'))
+        self.attempts = 0
+
+    def toEntry(self):
+        entry = {'Data': self.data, 'PartitionKey': self.partitionKey}
+        if self.explicitHashKey is not None:
+            entry['ExplicitHashKey'] = self.explicitHashKey
+        return entry
+
+
+class KinesisProducer:
+    '''
+    Produtor de registros do Kinesis com envio automático em lotes.
+
+    Os registros recebidos em put() são acumulados em memória e enviados por
+    uma thread em segundo plano via PutRecords quando o lote atinge 500
+    registros, 5 MB, ou quando o registro mais antigo espera mais que
+    lingerTime. Em respostas com falha parcial (FailedRecordCount > 0), somente
+    os registros que falharam são reenviados, com espera exponencial.
+
+    Cada put() devolve um Future resolvido com o ShardId e o SequenceNumber do
+    registro, ou com a exceção final caso as tentativas se esgotem.
+    '''
+
+    def __init__(self, kinesis, streamName=None, maxBatchRecords=MAX_BATCH_RECORDS,
+                 maxBatchBytes=MAX_BATCH_BYTES, lingerTime=0.1, maxRetries=5,
+                 retryBackoff=0.1, maxBufferedRecords=100000, aggregate=False,
+                 shardResolver=None):
+        '''
+        Construtor
+
+        :param kinesis: Instância de AWSKinesis usada no envio
+        :param streamName: Nome do stream; se omitido, usa o da configuração
+        :param maxBatchRecords: Número máximo de registros por requisição (até 500)
+        :param maxBatchBytes: Tamanho máximo de cada requisição, em bytes (até 5 MB)
+        :param lingerTime: Tempo máximo de espera de um registro no buffer, em segundos
+        :param maxRetries: Número de reenvios de um registro que falhou
+        :param retryBackoff: Espera inicial entre reenvios, em segundos (dobra a cada falha)
+        :param maxBufferedRecords: Limite do buffer; put() bloqueia quando ele está cheio
+        :param aggregate: Agrega os registros no formato do KPL (ver KinesisAggregator);
+                          nesse modo o limite de 500 vale para os registros agregados
+        :param shardResolver: Função hash key -> shard usada na agregação
+        '''
+        if streamName is None or not streamName:
+            streamName = kinesis.config['aws']['kinesis']['stream_name']
+
+        self.kinesis = kinesis
+        self.streamName = streamName
+        self.maxBatchRecords = min(maxBatchRecords, MAX_BATCH_RECORDS)
+        self.maxBatchBytes = min(maxBatchBytes, MAX_BATCH_BYTES)
+        self.lingerTime = lingerTime
+        self.maxRetries = maxRetries
+        self.retryBackoff = retryBackoff
+        self.maxBufferedRecords = maxBufferedRecords
+        self.aggregate = aggregate
+        self.shardResolver = shardResolver
+        # Com agregação, muitos registros de usuário cabem em um único registro do
+        # Kinesis: o lote é limitado apenas pelo tamanho
+        self.maxUserRecords = sys.maxsize if aggregate else self.maxBatchRecords
+
+        self.buffer = collections.deque()
+        self.bufferedBytes = 0
+        self.firstBufferedTime = None
+        self.inFlight = 0
+        self.flushRequested = False
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.sender = threading.Thread(target=self._run)
+        self.sender.daemon = True
+        self.sender.start()
+
+    def put(self, data, partitionKey=None, explicitHashKey=None, callback=None):
+        '''
+        Enfileira um registro para envio.
+
+        :param data: Conteúdo do registro (bytes ou texto, codificado em UTF-8)
+        :param partitionKey: Partition key; se omitida, é gerada aleatoriamente
+        :param explicitHashKey: Hash key explícita, para escolher o shard de destino
+        :param callback: Função opcional chamada com o Future quando o envio termina
+
+        :return: Future resolvido com {'ShardId', 'SequenceNumber'}
+        '''
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if partitionKey is None or not partitionKey:
+            partitionKey = str(uuid.uuid4())
+
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        record = _BufferedRecord(data, partitionKey, explicitHashKey, future)
+        if record.size > MAX_RECORD_BYTES:
+            raise ValueError('O registro excede o limite de %d bytes do Kinesis' % MAX_RECORD_BYTES)
+
+        with self.condition:
+            while len(self.buffer) >= self.maxBufferedRecords and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                raise RuntimeError('O produtor já foi encerrado')
+            if not self.buffer:
+                self.firstBufferedTime = time.time()
+            self.buffer.append(record)
+            self.bufferedBytes += record.size
+            # Acorda a thread de envio no primeiro registro (início da espera) e
+            # quando um lote completo está disponível
+            if (len(self.buffer) == 1 or len(self.buffer) >= self.maxUserRecords or
+                    self.bufferedBytes >= self.maxBatchBytes):
+                self.condition.notify_all()
+        return future
+
+    def flush(self):
+        '''
+        Envia imediatamente os registros em buffer e aguarda a conclusão de todos
+        os envios pendentes.
+        '''
+        with self.condition:
+            self.flushRequested = True
+            self.condition.notify_all()
+            while (self.buffer or self.inFlight) and self.sender.is_alive():
+                self.condition.wait(0.1)
+            self.flushRequested = False
+
+    def close(self):
+        '''
+        Envia os registros pendentes e encerra a thread de envio.
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.sender.join()
+
+    def _takeBatch(self):
+        batch = []
+        batchBytes = 0
+        while self.buffer and len(batch) < self.maxUserRecords:
+            record = self.buffer[0]
+            if batch and batchBytes + record.size > self.maxBatchBytes:
+                break
+            batch.append(self.buffer.popleft())
+            batchBytes += record.size
+        self.bufferedBytes -= batchBytes
+        self.firstBufferedTime = time.time() if self.buffer else None
+        return batch
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.buffer:
+                        if self.closed:
+                            return
+                        self.condition.wait()
+                        continue
+
+                    full = (len(self.buffer) >= self.maxUserRecords or
+                            self.bufferedBytes >= self.maxBatchBytes)
+                    waited = time.time() - self.firstBufferedTime
+                    if full or self.flushRequested or self.closed or waited >= self.lingerTime:
+                        break
+                    self.condition.wait(self.lingerTime - waited)
+
+                batch = self._takeBatch()
+                self.inFlight += len(batch)
+                # Libera produtores bloqueados pelo buffer cheio
+                self.condition.notify_all()
+
+            try:
+                self._sendBatch(batch)
+            except Exception as e:
+                # Uma falha inesperada em um lote não pode encerrar a thread de envio
+                logging.exception('Falha no processamento de lote do Kinesis: %s', e)
+                for record in batch:
+                    if not record.future.done():
+                        record.future.set_exception(e)
+            finally:
+                with self.condition:
+                    self.inFlight -= len(batch)
+                    self.condition.notify_all()
+
+    def _buildEntries(self, records):
+        '''
+        Gera as entradas do PutRecords, cada uma com os registros de usuário
+        que ela contém.
+        '''
+        if not self.aggregate:
+            return [(record.toEntry(), [record]) for record in records]
+
+        aggregator = KinesisAggregator(shardResolver=self.shardResolver)
+        aggregated = []
+        for record in records:
+            aggregated.extend(aggregator.addRecord(record.partitionKey, record.data,
+                                                   record.explicitHashKey, record))
+        aggregated.extend(aggregator.flush())
+        return [(item.toEntry(), item.userObjects) for item in aggregated]
+
+    def _splitRequests(self, entries):
+        '''
+        Divide as entradas em requisições dentro dos limites do PutRecords.
+        '''
+        request = []
+        requestBytes = 0
+        for entry, records in entries:
+            entrySize = len(entry['Data']) + len(entry['PartitionKey'].encode('utf-8'))
+            if request and (len(request) >= self.maxBatchRecords or
+                            requestBytes + entrySize > self.maxBatchBytes):
+                yield request
+                request = []
+                requestBytes = 0
+            request.append((entry, records))
+            requestBytes += entrySize
+        if request:
+            yield request
+
+    def _sendBatch(self, batch):
+        # Descarta os registros cujo Future foi cancelado pelo chamador; os demais
+        # passam a "em execução" e não podem mais ser cancelados
+        pending = [record for record in batch if record.future.set_running_or_notify_cancel()]
+        while pending:
+            failed = []
+            for request in self._splitRequests(self._buildEntries(pending)):
+                try:
+                    response = self.kinesis.putRecords([entry for entry, _ in request],
+                                                       self.streamName)
+                    results = response['Records']
+                except Exception as e:
+                    logging.warning('Falha no envio de lote ao Kinesis: %s', e)
+                    results = [{'ErrorCode': getErrorCode(e), 'ErrorMessage': str(e)}] * len(request)
+
+                for (entry, records), result in zip(request, results):
+                    for record in records:
+                        if 'ErrorCode' not in result:
+                            record.future.set_result({'ShardId': result['ShardId'],
+                                                      'SequenceNumber': result['SequenceNumber']})
+                            continue
+
+                        record.attempts += 1
+                        if record.attempts > self.maxRetries:
+                            record.future.set_exception(
+                                KinesisPutError(result['ErrorCode'], result.get('ErrorMessage')))
+                        else:
+                            failed.append(record)
+
+            if failed:
+                self.kinesis.metrics.recordRetries(self.streamName, len(failed))
+                attempts = max(record.attempts for record in failed)
+                time.sleep(self.retryBackoff * (2 ** (attempts - 1)))
+            pending = failed
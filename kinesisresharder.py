@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+
+# Capacidade de escrita de um shard
+SHARD_MAX_RECORDS_PER_SECOND = 1000
+SHARD_MAX_BYTES_PER_SECOND = 1024 * 1024
+
+ACTION_SPLIT = 'split'
+ACTION_MERGE = 'merge'
+
+
+class PartitionerMetricsSource:
+    '''
+    Fonte de métricas de vazão por shard a partir dos contadores de envio de
+    um KinesisPartitioner. Cada chamada retorna as taxas médias desde a
+    chamada anterior (ou desde a criação da fonte).
+    '''
+
+    def __init__(self, partitioner):
+        '''
+        Construtor
+
+        :param partitioner: Instância de KinesisPartitioner com os contadores de envio
+        '''
+        self.partitioner = partitioner
+        self.lastCounts = self._getCounts()
+        self.lastTime = time.time()
+
+    def _getCounts(self):
+        return dict((item['ShardId'], (item['PutCount'], item['PutBytes']))
+                    for item in self.partitioner.getShardStats())
+
+    def __call__(self):
+        '''
+        :return: Dicionário ShardId -> {'RecordsPerSecond', 'BytesPerSecond'}
+        '''
+        counts = self._getCounts()
+        now = time.time()
+        elapsed = max(now - self.lastTime, 1e-6)
+
+        metrics = {}
+        for shardId, (putCount, putBytes) in counts.items():
+            lastCount, lastBytes = self.lastCounts.get(shardId, (0, 0))
+            metrics[shardId] = {'RecordsPerSecond': (putCount - lastCount) / elapsed,
+                                'BytesPerSecond': (putBytes - lastBytes) / elapsed}
+
+        self.lastCounts = counts
+        self.lastTime = now
+        return metrics
+
+
+class KinesisReshardPlanner:
+    '''
+    Planejador de resharding de um stream do Kinesis.
+
+    A partir da vazão de escrita de cada shard aberto, calcula a utilização
+    (maior fração entre registros/s e bytes/s em relação ao limite de 1.000
+    registros/s e 1 MB/s do shard) e monta um plano:
+
+        - split, na metade da faixa de hash, dos shards acima de splitThreshold
+          (os mais carregados primeiro), até maxShards;
+        - merge de pares de shards adjacentes cuja utilização somada fica abaixo
+          de mergeThreshold (os menos carregados primeiro), até minShards;
+        - splits ou merges adicionais para trazer o número de shards para dentro
+          de [minShards, maxShards].
+
+    O plano é aplicado uma operação por vez, aguardando o stream voltar ao
+    estado ACTIVE antes e depois de cada uma. Em dry-run, o plano é apenas
+    calculado e registrado no log.
+    '''
+
+    def __init__(self, kinesis, streamName=None, metricsSource=None, minShards=None,
+                 maxShards=None, splitThreshold=0.8, mergeThreshold=0.3, dryRun=False,
+                 waitTimeout=300, pollInterval=5):
+        '''
+        Construtor
+
+        :param kinesis: Instância de AWSKinesis
+        :param streamName: Nome do stream; se omitido, usa o da configuração
+        :param metricsSource: Função sem parâmetros que retorna a vazão por shard
+                              (ShardId -> {'RecordsPerSecond', 'BytesPerSecond'}); se
+                              omitida, usa os contadores do particionador ativo no stream
+        :param minShards: Número mínimo de shards abertos (padrão: aws.kinesis.min_shard_number)
+        :param maxShards: Número máximo de shards abertos (padrão: aws.kinesis.max_shard_number,
+                          ou sem limite)
+        :param splitThreshold: Utilização a partir da qual um shard é dividido
+        :param mergeThreshold: Utilização somada abaixo da qual dois shards adjacentes
+                               são unidos
+        :param dryRun: Apenas calcula o plano, sem aplicá-lo
+        :param waitTimeout: Tempo máximo de espera pelo estado ACTIVE, em segundos
+        :param pollInterval: Intervalo entre as consultas de estado, em segundos
+        '''
+        kinesisConfig = kinesis.config['aws']['kinesis']
+        if streamName is None or not streamName:
+            streamName = kinesisConfig['stream_name']
+        if minShards is None:
+            minShards = kinesisConfig.get('min_shard_number', 1)
+        if maxShards is None:
+            maxShards = kinesisConfig.get('max_shard_number')
+        if maxShards is not None and maxShards < minShards:
+            raise ValueError('maxShards (%d) menor que minShards (%d)' % (maxShards, minShards))
+        if mergeThreshold >= splitThreshold:
+            raise ValueError('mergeThreshold deve ser menor que splitThreshold')
+
+        self.kinesis = kinesis
+        self.streamName = streamName
+        if metricsSource is None and streamName in kinesis.partitioners:
+            # As taxas são medidas a partir da criação do planejador
+            metricsSource = PartitionerMetricsSource(kinesis.partitioners[streamName])
+        self.metricsSource = metricsSource
+        self.minShards = max(minShards, 1)
+        self.maxShards = maxShards
+        self.splitThreshold = splitThreshold
+        self.mergeThreshold = mergeThreshold
+        self.dryRun = dryRun
+        self.waitTimeout = waitTimeout
+        self.pollInterval = pollInterval
+
+    def _getMetrics(self):
+        if self.metricsSource is None:
+            partitioner = self.kinesis.partitioners.get(self.streamName)
+            if partitioner is None:
+                raise ValueError('Nenhuma fonte de métricas informada e nenhum particionador '
+                                 'ativo no stream %s' % self.streamName)
+            self.metricsSource = PartitionerMetricsSource(partitioner)
+        return self.metricsSource()
+
+    @staticmethod
+    def getUtilization(shardMetrics):
+        '''
+        Utilização de escrita de um shard (1.0 = no limite de capacidade).
+
+        :param shardMetrics: {'RecordsPerSecond', 'BytesPerSecond'}
+        '''
+        return max(float(shardMetrics.get('RecordsPerSecond', 0)) / SHARD_MAX_RECORDS_PER_SECOND,
+                   float(shardMetrics.get('BytesPerSecond', 0)) / SHARD_MAX_BYTES_PER_SECOND)
+
+    def plan(self, metrics=None):
+        '''
+        Calcula o plano de resharding.
+
+        :param metrics: Vazão por shard (ShardId -> {'RecordsPerSecond', 'BytesPerSecond'});
+                        se omitida, é lida da fonte de métricas
+
+        :return: Lista de ações, na ordem de aplicação. Splits:
+                 {'Action': 'split', 'ShardId', 'NewStartingHashKey', 'Utilization'};
+                 merges: {'Action': 'merge', 'ShardId', 'AdjacentShardId', 'Utilization'}
+        '''
+        if metrics is None:
+            metrics = self._getMetrics()
+
+        shards = []
+        for shardInfo in self.kinesis.getShardList(self.streamName):
+            hashRange = shardInfo['HashKeyRange']
+            shardId = shardInfo['ShardId']
+            utilization = None
+            if shardId in metrics:
+                utilization = self.getUtilization(metrics[shardId])
+            shards.append((int(hashRange['StartingHashKey']), int(hashRange['EndingHashKey']),
+                           shardId, utilization))
+        shards.sort()
+
+        shardCount = len(shards)
+        actions = []
+        changedShards = set()
+
+        def split(startKey, endKey, shardId, utilization):
+            actions.append({'Action': ACTION_SPLIT,
+                            'ShardId': shardId,
+                            'NewStartingHashKey': str((startKey + endKey + 1) // 2),
+                            'Utilization': utilization})
+            changedShards.add(shardId)
+
+        # Splits dos shards sobrecarregados, do mais ao menos carregado
+        hotShards = [shard for shard in shards
+                     if shard[3] is not None and shard[3] > self.splitThreshold]
+        hotShards.sort(key=lambda shard: shard[3], reverse=True)
+        for shard in hotShards:
+            if self.maxShards is not None and shardCount >= self.maxShards:
+                logging.warning('Shard %s sobrecarregado (%.2f), mas o stream já tem o máximo '
+                                'de %d shards', shard[2], shard[3], self.maxShards)
+                break
+            split(*shard)
+            shardCount += 1
+
+        # Abaixo do mínimo: divide as maiores faixas de hash
+        if shardCount < self.minShards:
+            candidates = [shard for shard in shards if shard[2] not in changedShards]
+            candidates.sort(key=lambda shard: shard[1] - shard[0], reverse=True)
+            for shard in candidates:
+                if shardCount >= self.minShards:
+                    break
+                split(*shard)
+                shardCount += 1
+
+        # Merges de pares adjacentes, do par menos ao mais carregado. Shards sem
+        # métricas só são unidos para respeitar o máximo de shards.
+        pairs = []
+        for left, right in zip(shards, shards[1:]):
+            if left[1] + 1 != right[0]:
+                continue
+            if left[2] in changedShards or right[2] in changedShards:
+                continue
+            known = left[3] is not None and right[3] is not None
+            utilization = (left[3] or 0.0) + (right[3] or 0.0)
+            pairs.append((not known, utilization, left, right))
+        pairs.sort(key=lambda pair: (pair[0], pair[1]))
+
+        for unknown, utilization, left, right in pairs:
+            if left[2] in changedShards or right[2] in changedShards:
+                continue
+            overMaximum = self.maxShards is not None and shardCount > self.maxShards
+            if not overMaximum and (unknown or utilization >= self.mergeThreshold or
+                                    shardCount <= self.minShards):
+                continue
+            actions.append({'Action': ACTION_MERGE,
+                            'ShardId': left[2],
+                            'AdjacentShardId': right[2],
+                            'Utilization': utilization if not unknown else None})
+            changedShards.add(left[2])
+            changedShards.add(right[2])
+            shardCount -= 1
+
+        return actions
+
+    def apply(self, actions, dryRun=None):
+        '''
+        Aplica um plano de resharding, uma operação por vez.
+
+        :param actions: Plano gerado por plan()
+        :param dryRun: Apenas registra as operações no log (padrão: o do construtor)
+
+        :return: Lista das ações, com a chave Status ('planned' em dry-run,
+                 'applied' nas aplicadas)
+        '''
+        if dryRun is None:
+            dryRun = self.dryRun
+
+        for action in actions:
+            if action['Action'] == ACTION_SPLIT:
+                description = 'split do shard %s em %s' % (action['ShardId'],
+                                                          action['NewStartingHashKey'])
+            else:
+                description = 'merge dos shards %s e %s' % (action['ShardId'],
+                                                           action['AdjacentShardId'])
+
+            if dryRun:
+                logging.info('[dry-run] %s no stream %s', description, self.streamName)
+                action['Status'] = 'planned'
+                continue
+
+            logging.info('Aplicando %s no stream %s', description, self.streamName)
+            self.kinesis.waitForStreamActive(self.streamName, self.waitTimeout, self.pollInterval)
+            if action['Action'] == ACTION_SPLIT:
+                self.kinesis.splitShard(self.streamName, action['ShardId'],
+                                        action['NewStartingHashKey'])
+            else:
+                self.kinesis.mergeShard(self.streamName, action['ShardId'],
+                                        action['AdjacentShardId'])
+            self.kinesis.waitForStreamActive(self.streamName, self.waitTimeout, self.pollInterval)
+            action['Status'] = 'applied'
+
+        if actions and not dryRun:
+            partitioner = self.kinesis.partitioners.get(self.streamName)
+            if partitioner is not None:
+                partitioner.refresh()
+
+        return actions
+
+    def reshard(self, metrics=None, dryRun=None):
+        '''
+        Calcula e aplica o plano de resharding.
+
+        :param metrics: Vazão por shard; se omitida, é lida da fonte de métricas
+        :param dryRun: Apenas calcula o plano (padrão: o do construtor)
+
+        :return: Lista das ações (ver apply)
+        '''
+        return self.apply(self.plan(metrics), dryRun)
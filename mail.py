@@ -4,12 +4,8 @@
 from configuration import Configuration
 from datetime import datetime
 from datetime import timedelta
-from email.MIMEMultipart import MIMEMultipart
-from email.MIMEText import MIMEText
 
-import email
 import json
-import smtplib
 
 
 class Mail:
@@ -39,6 +35,9 @@ class Mail:
         :param subject: Assunto da mensagem
         :param message: Conteúdo da mensagem em si
         '''
+        # Importação tardia: smtplib só é carregado ao instanciar o cliente
+        import smtplib
+
         configWrapper = Configuration()
         self.config = configWrapper.getConfigurationFromFile()
         self.smtp_client = smtplib.SMTP(configWrapper.getFullSmtpHost())
@@ -75,6 +74,9 @@ class Mail:
         if subject is not None:
             self.mail_subject = subject
 
+        from email.MIMEMultipart import MIMEMultipart
+        from email.MIMEText import MIMEText
+
         if self.mail_to is not None:
             for mail_dest in self.mail_to:
                 msg_template = MIMEMultipart()
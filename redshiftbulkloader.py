@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import decimal
+import gzip
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# Número de partes usado quando a quantidade de slices do cluster não pode ser lida
+DEFAULT_PART_COUNT = 4
+# Tamanho dos blocos distribuídos entre as partes quando o número de registros
+# não é conhecido: blocos pequenos mantêm as partes com tamanhos semelhantes
+UNKNOWN_SIZE_CHUNK_ROWS = 500
+# Representação de NULL nos arquivos CSV gerados
+NULL_MARKER = '\\N'
+
+_PY2 = sys.version_info[0] == 2
+_TEXT_TYPE = type(u'')
+# Tipos gravados sem aspas no CSV (bool é subclasse de int)
+_NUMERIC_TYPES = (int, float, decimal.Decimal) + ((long,) if _PY2 else ())
+_PART_DONE = object()
+
+
+def _formatCsvField(value):
+    if value is None:
+        return NULL_MARKER
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, _NUMERIC_TYPES):
+        return str(value)
+    if _PY2 and isinstance(value, bytes):
+        value = value.decode('utf-8')
+    elif not isinstance(value, _TEXT_TYPE):
+        value = _TEXT_TYPE(value)
+    return u'"%s"' % value.replace(u'"', u'""')
+
+
+def formatCsvRows(rows, delimiter=','):
+    '''
+    Serializa registros em CSV (UTF-8), com NULL_MARKER para valores None.
+
+    Números são gravados sem aspas e os demais valores sempre entre aspas, de
+    forma que um texto igual a NULL_MARKER não é carregado como NULL.
+
+    :param rows: Lista de registros (sequências de valores)
+    :param delimiter: Delimitador de campos
+
+    :return: Bytes do CSV
+    '''
+    delimiter = _TEXT_TYPE(delimiter)
+    lines = [delimiter.join([_formatCsvField(value) for value in row]) for row in rows]
+    if not lines:
+        return b''
+    return (u'\n'.join(lines) + u'\n').encode('utf-8')
+
+
+class _PartWriter(object):
+    '''
+    Grava, em uma thread própria, os blocos de registros recebidos em um
+    arquivo CSV comprimido com gzip.
+    '''
+
+    def __init__(self, path, compressLevel):
+        self.path = path
+        self.compressLevel = compressLevel
+        self.rowCount = 0
+        self.error = None
+        self.chunks = queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        try:
+            with gzip.open(self.path, 'wb', self.compressLevel) as outFile:
+                while True:
+                    rows = self.chunks.get()
+                    if rows is _PART_DONE:
+                        break
+                    outFile.write(formatCsvRows(rows))
+                    self.rowCount += len(rows)
+        except Exception as e:
+            self.error = e
+            # Esvazia a fila para não bloquear quem envia os blocos
+            while self.chunks.get() is not _PART_DONE:
+                pass
+
+    def write(self, rows):
+        self.chunks.put(rows)
+
+    def close(self):
+        self.chunks.put(_PART_DONE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class RedshiftBulkLoader:
+    '''
+    Carga em massa no Redshift via S3 e COPY.
+
+    Os registros são divididos em blocos, distribuídos em rodízio entre N
+    arquivos CSV comprimidos com gzip, gravados em paralelo (N = número de
+    slices do cluster, de forma que cada slice carrega uma parte de tamanho
+    semelhante). As partes são enviadas ao S3 simultaneamente, sob um prefixo
+    de staging, e carregadas com um único COPY a partir de um manifesto. Ao
+    final, os arquivos locais e (opcionalmente) os objetos de staging são
+    removidos.
+    '''
+
+    def __init__(self, redshift, s3, bucketName, stagingPrefix='redshift-staging/',
+                 authorization=None, numParts=None, chunkRows=10000, maxWorkers=8,
+                 compressLevel=6, cleanup=True):
+        '''
+        Construtor
+
+        :param redshift: Instância de AWSRedshift onde o COPY é executado
+        :param s3: Instância de AWSS3 usada no envio das partes
+        :param bucketName: Bucket de staging
+        :param stagingPrefix: Prefixo de staging no bucket
+        :param authorization: Cláusula de autorização do COPY (ex.: "IAM_ROLE 'arn:...'")
+        :param numParts: Número de partes; se omitido, usa o número de slices do cluster
+        :param chunkRows: Número máximo de registros de cada bloco distribuído entre as
+                          partes (reduzido para que todas as partes recebam registros)
+        :param maxWorkers: Número de envios simultâneos ao S3
+        :param compressLevel: Nível de compressão gzip (1 a 9)
+        :param cleanup: Remove os objetos de staging após o COPY
+        '''
+        self.redshift = redshift
+        self.s3 = s3
+        self.bucketName = bucketName
+        self.stagingPrefix = stagingPrefix
+        self.authorization = authorization
+        self.numParts = numParts
+        self.chunkRows = chunkRows
+        self.maxWorkers = maxWorkers
+        self.compressLevel = compressLevel
+        self.cleanup = cleanup
+
+    def _getPartCount(self):
+        if self.numParts is not None:
+            return self.numParts
+        try:
+            return self.redshift.getSliceCount()
+        except Exception as e:
+            logging.warning('Não foi possível ler o número de slices do cluster (%s); '
+                            'usando %d partes', e, DEFAULT_PART_COUNT)
+            return DEFAULT_PART_COUNT
+
+    def load(self, tableName, rows, columns=None, copyOptions=None, expectedRows=None):
+        '''
+        Carrega registros em uma tabela.
+
+        :param tableName: Tabela de destino
+        :param rows: Iterável de registros (sequências de valores) ou objeto no
+                     estilo DataFrame (com columns e itertuples)
+        :param columns: Colunas de destino, na ordem dos valores dos registros
+        :param copyOptions: Opções adicionais do COPY (ex.: "TRUNCATECOLUMNS")
+        :param expectedRows: Número estimado de registros, usado na divisão entre as
+                             partes; se omitido, usa len(rows) quando disponível
+
+        :return: Dicionário com table, rows, parts, bytes e elapsed (segundos)
+        '''
+        startTime = time.time()
+        if expectedRows is None and hasattr(rows, '__len__'):
+            expectedRows = len(rows)
+        if hasattr(rows, 'itertuples') and hasattr(rows, 'columns'):
+            if columns is None:
+                columns = [str(column) for column in rows.columns]
+            rows = rows.itertuples(index=False, name=None)
+
+        runPrefix = '%s%s/%s/' % (self.stagingPrefix, tableName, uuid.uuid4().hex)
+        localDir = tempfile.mkdtemp(prefix='redshift_load_')
+        stagedKeys = []
+        try:
+            parts = self._writeParts(rows, localDir, expectedRows)
+            parts = [(path, rowCount) for path, rowCount in parts if rowCount]
+            totalRows = sum(rowCount for _, rowCount in parts)
+            totalBytes = sum(os.path.getsize(path) for path, _ in parts)
+
+            if parts:
+                entries = self._uploadParts(parts, runPrefix, stagedKeys)
+                manifestKey = runPrefix + 'manifest'
+                self.s3.client.put_object(Bucket=self.bucketName, Key=manifestKey,
+                                          Body=json.dumps({'entries': entries}).encode('utf-8'))
+                stagedKeys.append(manifestKey)
+                self._copy(tableName, columns, manifestKey, copyOptions)
+        finally:
+            shutil.rmtree(localDir, ignore_errors=True)
+            if self.cleanup and stagedKeys:
+                report = self.s3.deleteObjects(self.bucketName, items=stagedKeys)
+                if report.failures:
+                    logging.warning('Falha ao remover objetos de staging: %s', report.failures)
+
+        return {
+            'table': tableName,
+            'rows': totalRows,
+            'parts': len(parts),
+            'bytes': totalBytes,
+            'elapsed': time.time() - startTime
+        }
+
+    def _writeParts(self, rows, localDir, expectedRows=None):
+        '''
+        Distribui os registros em blocos entre os arquivos das partes.
+
+        :return: Lista de tuplas (caminho, número de registros)
+        '''
+        partCount = self._getPartCount()
+        # Blocos pequenos o bastante para que cada parte (slice) receba uma fração
+        # semelhante dos registros
+        if expectedRows:
+            chunkRows = min(self.chunkRows, max(1, expectedRows // partCount))
+        else:
+            chunkRows = min(self.chunkRows, UNKNOWN_SIZE_CHUNK_ROWS)
+
+        writers = [_PartWriter(os.path.join(localDir, 'part_%04d.csv.gz' % index),
+                               self.compressLevel)
+                   for index in range(partCount)]
+        try:
+            chunk = []
+            nextWriter = 0
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunkRows:
+                    writers[nextWriter].write(chunk)
+                    nextWriter = (nextWriter + 1) % len(writers)
+                    chunk = []
+            if chunk:
+                writers[nextWriter].write(chunk)
+        finally:
+            errors = []
+            for writer in writers:
+                try:
+                    writer.close()
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+        return [(writer.path, writer.rowCount) for writer in writers]
+
+    def _uploadParts(self, parts, runPrefix, stagedKeys):
+        '''
+        Envia as partes ao S3 simultaneamente.
+
+        :return: Entradas do manifesto do COPY
+        '''
+        def upload(part):
+            path, _ = part
+            key = runPrefix + os.path.basename(path)
+            self.s3.upload(path, self.bucketName, key, resume=False)
+            return key
+
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            futures = [executor.submit(upload, part) for part in parts]
+            entries = []
+            errors = []
+            for future, (path, _) in zip(futures, parts):
+                try:
+                    key = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                stagedKeys.append(key)
+                entries.append({'url': 's3://%s/%s' % (self.bucketName, key),
+                                'mandatory': True,
+                                'meta': {'content_length': os.path.getsize(path)}})
+        finally:
+            executor.shutdown(wait=True)
+        if errors:
+            raise errors[0]
+        return entries
+
+    def _copy(self, tableName, columns, manifestKey, copyOptions):
+        if not self.authorization:
+            raise ValueError('Informe a autorização do COPY (IAM role ou credenciais)')
+
+        columnList = ' (%s)' % ', '.join(columns) if columns else ''
+        sqlCommand = ("COPY %s%s FROM 's3://%s/%s' %s MANIFEST CSV GZIP "
+                      "NULL AS '%s' TIMEFORMAT 'auto' DATEFORMAT 'auto'" %
+                      (tableName, columnList, self.bucketName, manifestKey, self.authorization,
+                       NULL_MARKER.replace('\\', '\\\\')))
+        if copyOptions:
+            sqlCommand += ' ' + copyOptions
+
+        with self.redshift.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sqlCommand)
+            conn.commit()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+# Extensão dos arquivos de entradas gravadas em disco
+SPILL_SUFFIX = '.rqcache'
+
+_TEXT_TYPE = type(u'')
+
+# Trechos entre aspas: literais ('...') e identificadores ("...")
+_QUOTED_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_WORD_PATTERN = re.compile(r'[a-z_][\w$]*')
+_IDENTIFIER = r'(?:"[^"]+"|[a-z_][\w$]*)(?:\s*\.\s*(?:"[^"]+"|[a-z_][\w$]*))*'
+_WRITE_PATTERN = re.compile(
+    r'^\s*(?:insert\s+into|update|delete\s+from|delete|merge\s+into|copy|alter\s+table|'
+    r'truncate(?:\s+table)?|drop\s+table(?:\s+if\s+exists)?|'
+    r'create\s+(?:(?:local\s+)?temp(?:orary)?\s+)?table(?:\s+if\s+not\s+exists)?)\s+'
+    r'(' + _IDENTIFIER + r'(?:\s*,\s*' + _IDENTIFIER + r')*)')
+_READ_PATTERN = re.compile(r'^\s*\(*\s*(?:select|with)\b')
+# Escrita dentro de uma consulta (WITH ... INSERT, SELECT ... INTO)
+_MODIFYING_PATTERN = re.compile(r'\b(?:insert|update|delete|merge|into)\b')
+# Palavras reservadas frequentes, que não precisam entrar no índice de tabelas
+_KEYWORDS = frozenset((
+    'select', 'from', 'where', 'and', 'or', 'not', 'in', 'is', 'null', 'as', 'on', 'join',
+    'left', 'right', 'inner', 'outer', 'full', 'cross', 'group', 'by', 'order', 'having',
+    'limit', 'offset', 'union', 'all', 'distinct', 'case', 'when', 'then', 'else', 'end',
+    'with', 'asc', 'desc', 'between', 'like', 'ilike', 'exists', 'count', 'sum', 'avg',
+    'min', 'max', 'cast', 'over', 'partition', 'true', 'false'))
+
+
+def normalizeSql(sql):
+    '''
+    Normaliza o texto de um comando SQL: espaços em branco colapsados e
+    minúsculas fora das aspas, sem o ';' final.
+    '''
+    pieces = _QUOTED_PATTERN.split(sql)
+    for index in range(0, len(pieces), 2):
+        pieces[index] = _WHITESPACE_PATTERN.sub(' ', pieces[index]).lower()
+    return ''.join(pieces).strip().rstrip(';').strip()
+
+
+def _getSkeleton(normalizedSql):
+    '''
+    Texto normalizado com os literais ('...') esvaziados e os identificadores
+    entre aspas convertidos para minúsculas.
+    '''
+    pieces = _QUOTED_PATTERN.split(normalizedSql)
+    for index in range(1, len(pieces), 2):
+        pieces[index] = "''" if pieces[index].startswith("'") else pieces[index].lower()
+    return ''.join(pieces)
+
+
+def _getTableName(identifier):
+    '''
+    Nome da tabela (sem schema nem aspas) de um identificador.
+    '''
+    return identifier.split('.')[-1].strip().strip('"')
+
+
+def getReferencedNames(sql):
+    '''
+    Nomes que podem ser tabelas lidas por uma consulta: todas as palavras fora
+    de literais, exceto palavras reservadas frequentes. O conjunto inclui
+    também colunas e apelidos, o que só pode causar invalidações a mais.
+    '''
+    skeleton = _getSkeleton(normalizeSql(sql)).replace('"', ' ')
+    return set(_WORD_PATTERN.findall(skeleton)) - _KEYWORDS
+
+
+def getWrittenTables(sql):
+    '''
+    Tabelas alteradas por um comando (INSERT, UPDATE, DELETE, MERGE, COPY, ALTER,
+    TRUNCATE, DROP e CREATE TABLE), sem schema.
+
+    :return: Conjunto de tabelas, ou None se algum dos comandos não for reconhecido
+             (nesse caso, todo o cache deve ser invalidado)
+    '''
+    tables = set()
+    for statement in _getSkeleton(normalizeSql(sql)).split(';'):
+        if not statement.strip():
+            continue
+        match = _WRITE_PATTERN.match(statement)
+        if match is None:
+            if _READ_PATTERN.match(statement):
+                continue
+            return None
+        for identifier in re.split(r'\s*,\s*', match.group(1)):
+            tables.add(_getTableName(identifier))
+    return tables
+
+
+def isCacheableQuery(sql):
+    '''
+    Indica se o comando é uma consulta (SELECT ou WITH ... SELECT) única.
+    '''
+    skeleton = _getSkeleton(normalizeSql(sql))
+    return (';' not in skeleton and _READ_PATTERN.match(skeleton) is not None and
+            _MODIFYING_PATTERN.search(skeleton) is None)
+
+
+class _CacheEntry(object):
+    __slots__ = ('value', 'size', 'expiresAt', 'names', 'path')
+
+    def __init__(self, value, size, expiresAt, names):
+        self.value = value
+        self.size = size
+        self.expiresAt = expiresAt
+        self.names = names
+        self.path = None
+
+
+class RedshiftQueryCache:
+    '''
+    Cache de resultados de consultas do Redshift.
+
+    As entradas são indexadas pelo texto normalizado da consulta e pelos
+    parâmetros, expiram após ttl segundos e são descartadas na ordem do uso
+    menos recente (LRU) quando o volume em memória (tamanho serializado dos
+    resultados) passa de maxBytes. Com spillDir, as entradas descartadas da
+    memória são gravadas em disco (até maxSpillBytes) e voltam à memória no
+    próximo acesso.
+
+    Comandos de escrita invalidam as entradas das consultas que citam as
+    tabelas alteradas (invalidateStatement/invalidateTables). Consultas em
+    andamento durante uma invalidação não têm o resultado armazenado.
+    '''
+
+    def __init__(self, maxBytes=64 * 1024 * 1024, ttl=300.0, spillDir=None,
+                 maxSpillBytes=1024 * 1024 * 1024):
+        '''
+        Construtor
+
+        :param maxBytes: Volume máximo dos resultados em memória, em bytes
+        :param ttl: Tempo de validade de uma entrada, em segundos
+        :param spillDir: Diretório para as entradas descartadas da memória (opcional)
+        :param maxSpillBytes: Volume máximo das entradas em disco, em bytes
+        '''
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.spillDir = spillDir
+        self.maxSpillBytes = maxSpillBytes
+
+        self.lock = threading.Lock()
+        # Entradas em memória e em disco, da menos à mais recentemente usada
+        self.memory = collections.OrderedDict()
+        self.disk = collections.OrderedDict()
+        self.memoryBytes = 0
+        self.diskBytes = 0
+        # Nome citado na consulta -> chaves das entradas
+        self.nameIndex = {}
+        # Contador de invalidações por nome (e global), para descartar resultados
+        # de consultas que estavam em andamento durante uma invalidação
+        self.generations = {}
+        self.globalGeneration = 0
+        self.stats = dict.fromkeys(('hits', 'diskHits', 'misses', 'evictions', 'spills',
+                                    'expirations', 'invalidations'), 0)
+
+        if spillDir is not None:
+            if not os.path.isdir(spillDir):
+                os.makedirs(spillDir)
+            # Remove entradas deixadas por execuções anteriores
+            for fileName in os.listdir(spillDir):
+                if fileName.endswith(SPILL_SUFFIX):
+                    self._removeFile(os.path.join(spillDir, fileName))
+
+    def getKey(self, sql, parameters=None):
+        '''
+        :return: Chave do cache para a consulta e os parâmetros
+        '''
+        text = '%s\x00%r' % (normalizeSql(sql), parameters)
+        if isinstance(text, _TEXT_TYPE):
+            text = text.encode('utf-8')
+        return hashlib.sha1(text).hexdigest()
+
+    def getOrLoad(self, sql, parameters, loader):
+        '''
+        Retorna o resultado da consulta em cache ou, se não houver, executa loader()
+        e armazena o resultado.
+
+        :param sql: Texto da consulta
+        :param parameters: Parâmetros da consulta (ou None)
+        :param loader: Função sem parâmetros que executa a consulta
+
+        :return: Lista de registros
+        '''
+        key = self.getKey(sql, parameters)
+        found, value = self.get(key)
+        if found:
+            return list(value)
+
+        names = getReferencedNames(sql)
+        with self.lock:
+            generation = self._getGeneration(names)
+        value = loader()
+        self.put(key, value, names, generation)
+        return list(value)
+
+    def get(self, key):
+        '''
+        :return: Tupla (encontrado, valor)
+        '''
+        with self.lock:
+            now = time.time()
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry.expiresAt <= now:
+                    self._remove(key)
+                    self.stats['expirations'] += 1
+                    self.stats['misses'] += 1
+                    return False, None
+                # Passa a ser a entrada mais recentemente usada
+                self.memory[key] = self.memory.pop(key)
+                self.stats['hits'] += 1
+                return True, entry.value
+
+            entry = self.disk.get(key)
+            if entry is None or entry.expiresAt <= now:
+                if entry is not None:
+                    self._remove(key)
+                    self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return False, None
+
+            try:
+                with open(entry.path, 'rb') as inFile:
+                    value = pickle.load(inFile)
+            except Exception as e:
+                logging.warning('Falha na leitura de entrada do cache em disco: %s', e)
+                self._remove(key)
+                self.stats['misses'] += 1
+                return False, None
+
+            # A entrada volta para a memória
+            self._remove(key)
+            entry.value = value
+            entry.path = None
+            self._store(key, entry)
+            self.stats['hits'] += 1
+            self.stats['diskHits'] += 1
+            return True, value
+
+    def put(self, key, value, names, generation=None):
+        '''
+        Armazena o resultado de uma consulta.
+
+        :param key: Chave (ver getKey)
+        :param value: Lista de registros
+        :param names: Nomes citados na consulta (ver getReferencedNames)
+        :param generation: Geração lida antes da execução da consulta; se houve
+                           invalidação desde então, o resultado não é armazenado
+        '''
+        try:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            logging.debug('Resultado não serializável; não armazenado no cache: %s', e)
+            return
+
+        with self.lock:
+            if generation is not None and generation != self._getGeneration(names):
+                return
+            if key in self.memory or key in self.disk:
+                self._remove(key)
+            entry = _CacheEntry(value, size, time.time() + self.ttl, frozenset(names))
+            for name in entry.names:
+                self.nameIndex.setdefault(name, set()).add(key)
+            self._store(key, entry)
+
+    def _store(self, key, entry):
+        '''
+        Coloca a entrada na memória, descartando (ou gravando em disco) as menos
+        recentemente usadas até respeitar o limite. Chamado com o lock.
+        '''
+        self.memory[key] = entry
+        self.memoryBytes += entry.size
+        while self.memoryBytes > self.maxBytes and self.memory:
+            oldKey, oldEntry = self.memory.popitem(last=False)
+            self.memoryBytes -= oldEntry.size
+            if not self._spill(oldKey, oldEntry):
+                self._unindex(oldKey, oldEntry)
+                self.stats['evictions'] += 1
+
+    def _spill(self, key, entry):
+        if self.spillDir is None or entry.size > self.maxSpillBytes or entry.expiresAt <= time.time():
+            return False
+
+        path = os.path.join(self.spillDir, key + SPILL_SUFFIX)
+        try:
+            with open(path, 'wb') as outFile:
+                pickle.dump(entry.value, outFile, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logging.warning('Falha na gravação de entrada do cache em disco: %s', e)
+            self._removeFile(path)
+            return False
+
+        entry.value = None
+        entry.path = path
+        self.disk[key] = entry
+        self.diskBytes += entry.size
+        self.stats['spills'] += 1
+        while self.diskBytes > self.maxSpillBytes:
+            oldKey, oldEntry = self.disk.popitem(last=False)
+            self.diskBytes -= oldEntry.size
+            self._removeFile(oldEntry.path)
+            self._unindex(oldKey, oldEntry)
+            self.stats['evictions'] += 1
+        return True
+
+    def _remove(self, key):
+        '''
+        Remove a entrada da memória ou do disco. Chamado com o lock.
+        '''
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memoryBytes -= entry.size
+        else:
+            entry = self.disk.pop(key, None)
+            if entry is None:
+                return
+            self.diskBytes -= entry.size
+            self._removeFile(entry.path)
+        self._unindex(key, entry)
+
+    def _unindex(self, key, entry):
+        for name in entry.names:
+            keys = self.nameIndex.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.nameIndex[name]
+
+    def _removeFile(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _getGeneration(self, names):
+        return (self.globalGeneration,
+                sum(self.generations.get(name, 0) for name in names))
+
+    def invalidateTables(self, tables):
+        '''
+        Invalida as entradas das consultas que citam as tabelas.
+
+        :param tables: Nomes das tabelas (com ou sem schema)
+
+        :return: Número de entradas removidas
+        '''
+        removed = 0
+        with self.lock:
+            for table in tables:
+                name = _getTableName(table.lower())
+                self.generations[name] = self.generations.get(name, 0) + 1
+                for key in list(self.nameIndex.get(name, ())):
+                    self._remove(key)
+                    removed += 1
+            self.stats['invalidations'] += removed
+        return removed
+
+    def invalidateStatement(self, sql):
+        '''
+        Invalida as entradas afetadas por um comando de escrita. Se o comando não
+        for reconhecido, todo o cache é invalidado.
+
+        :return: Número de entradas removidas
+        '''
+        tables = getWrittenTables(sql)
+        if tables is None:
+            return self.clear()
+        return self.invalidateTables(tables)
+
+    def clear(self):
+        '''
+        Remove todas as entradas.
+
+        :return: Número de entradas removidas
+        '''
+        with self.lock:
+            removed = len(self.memory) + len(self.disk)
+            for key in list(self.memory) + list(self.disk):
+                self._remove(key)
+            self.globalGeneration += 1
+            self.stats['invalidations'] += removed
+        return removed
+
+    def getStats(self):
+        '''
+        :return: Dicionário com acertos (hits, dos quais diskHits vieram do disco),
+                 falhas (misses), descartes (evictions), gravações em disco (spills),
+                 expirações, invalidações, número de entradas e volume em memória
+                 e em disco
+        '''
+        with self.lock:
+            stats = dict(self.stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['hitRatio'] = float(stats['hits']) / lookups if lookups else 0.0
+            stats['entries'] = len(self.memory)
+            stats['bytes'] = self.memoryBytes
+            stats['diskEntries'] = len(self.disk)
+            stats['diskBytes'] = self.diskBytes
+        return stats
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+
+
+# Tipo NumPy de cada tipo do Redshift/PostgreSQL (OID informado em
+# cursor.description); os demais tipos usam arrays de objetos
+PG_TYPE_DTYPES = {
+    16: 'bool',                 # boolean
+    20: 'int64',                # bigint
+    21: 'int16',                # smallint
+    23: 'int32',                # integer
+    700: 'float32',             # real
+    701: 'float64',             # double precision
+    1700: 'float64',            # numeric/decimal (convertido para ponto flutuante)
+    1082: 'datetime64[D]',      # date
+    1114: 'datetime64[us]',     # timestamp
+    1184: 'datetime64[us]'      # timestamptz (convertido para UTC)
+}
+TIMESTAMPTZ_OID = 1184
+
+# Valor gravado no lugar de NULL, por tipo NumPy (a posição fica marcada na
+# máscara); datas e objetos recebem NaT/None
+_FILL_VALUES = {
+    'b': False,
+    'i': 0,
+    'f': 0.0
+}
+
+
+def getColumnDtype(typeCode):
+    '''
+    :param typeCode: OID do tipo da coluna (cursor.description[i][1])
+
+    :return: Tipo NumPy (texto) usado para a coluna
+    '''
+    return PG_TYPE_DTYPES.get(typeCode, 'object')
+
+
+def _toUtc(value):
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(_UTC).replace(tzinfo=None)
+    return value
+
+
+class _Utc(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+
+_UTC = _Utc()
+
+
+class _ColumnBuffer(object):
+    '''
+    Array pré-alocado de uma coluna, com a máscara de NULLs criada somente
+    quando o primeiro NULL aparece. A capacidade dobra quando se esgota.
+    '''
+
+    def __init__(self, numpy, dtype, capacity, convertTimezone):
+        self.numpy = numpy
+        self.values = numpy.empty(capacity, dtype=dtype)
+        self.mask = None
+        self.fillValue = _FILL_VALUES.get(self.values.dtype.kind)
+        self.convertTimezone = convertTimezone
+
+    def reserve(self, size):
+        capacity = len(self.values)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity = max(capacity * 2, 1)
+        self.values = self._grow(self.values, capacity)
+        if self.mask is not None:
+            self.mask = self._grow(self.mask, capacity)
+
+    def _grow(self, array, capacity):
+        grown = self.numpy.zeros(capacity, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def fill(self, start, column):
+        '''
+        Grava os valores de uma coluna de um lote a partir da posição start.
+        '''
+        end = start + len(column)
+        if self.convertTimezone:
+            column = [_toUtc(value) for value in column]
+        if None in column:
+            if self.mask is None:
+                self.mask = self.numpy.zeros(len(self.values), dtype=bool)
+            nulls = self.numpy.fromiter((value is None for value in column), bool, len(column))
+            self.mask[start:end] = nulls
+            if self.fillValue is not None:
+                column = [self.fillValue if value is None else value for value in column]
+        self.values[start:end] = column
+
+    def finish(self, size):
+        '''
+        :return: Tupla (valores, máscara de NULLs ou None), ajustados ao número de
+                 registros lidos
+        '''
+        # Libera a capacidade não usada, sem cópia (os arrays são do próprio buffer)
+        self.values.resize(size, refcheck=False)
+        if self.mask is not None:
+            self.mask.resize(size, refcheck=False)
+        return self.values, self.mask
+
+
+def fetchColumnar(cursor, batchSize=10000, expectedRows=None, structured=False):
+    '''
+    Lê o resultado de uma consulta já executada em arrays NumPy por coluna.
+
+    Os registros são lidos em lotes de batchSize (fetchmany) e gravados em
+    arrays tipados pré-alocados (ver PG_TYPE_DTYPES), sem manter a lista de
+    tuplas do resultado inteiro em memória. Colunas com NULL são devolvidas
+    como numpy.ma.MaskedArray, com os NULLs mascarados.
+
+    :param cursor: Cursor psycopg2 com a consulta executada
+    :param batchSize: Número de registros lidos por vez
+    :param expectedRows: Número estimado de registros, para a pré-alocação
+    :param structured: Devolve um único array estruturado (mascarado) em vez de
+                       um dicionário de colunas
+
+    :return: Dicionário nome da coluna -> array, ou array estruturado
+    '''
+    # Importação tardia: NumPy só é necessário na leitura colunar
+    import numpy
+
+    rows = cursor.fetchmany(batchSize)
+    # Em cursores nomeados, a descrição só fica disponível após a primeira leitura
+    description = cursor.description
+    if description is None:
+        raise ValueError('O comando executado não retorna registros')
+
+    names = [column[0] for column in description]
+    capacity = max(expectedRows or 0, len(rows), 1)
+    buffers = [_ColumnBuffer(numpy, getColumnDtype(column[1]), capacity,
+                             column[1] == TIMESTAMPTZ_OID)
+               for column in description]
+
+    size = 0
+    while rows:
+        count = len(rows)
+        for columnBuffer, column in zip(buffers, zip(*rows)):
+            columnBuffer.reserve(size + count)
+            columnBuffer.fill(size, column)
+        size += count
+        rows = cursor.fetchmany(batchSize)
+
+    columns = [columnBuffer.finish(size) for columnBuffer in buffers]
+
+    if structured:
+        dtype = [(str(name), values.dtype) for name, (values, _) in zip(names, columns)]
+        data = numpy.empty(size, dtype=dtype)
+        mask = numpy.zeros(size, dtype=[(str(name), bool) for name in names])
+        for name, (values, nulls) in zip(names, columns):
+            data[str(name)] = values
+            if nulls is not None:
+                mask[str(name)] = nulls
+        return numpy.ma.array(data, mask=mask)
+
+    result = {}
+    for name, (values, nulls) in zip(names, columns):
+        result[name] = values if nulls is None else numpy.ma.array(values, mask=nulls)
+    return result
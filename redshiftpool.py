@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+from timeoutexception import TimeoutException
+
+import logging
+import threading
+import time
+
+
+class _PooledConnection(object):
+    __slots__ = ('connection', 'createdTime', 'lastUsedTime')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.createdTime = time.time()
+        self.lastUsedTime = self.createdTime
+
+
+class RedshiftConnectionPool:
+    '''
+    Pool de conexões SQL (psycopg2) com o Redshift, seguro para uso por várias
+    threads.
+
+    O pool mantém entre minSize e maxSize conexões. Na retirada, conexões
+    ociosas há mais de healthCheckInterval segundos são testadas (SELECT 1) e
+    substituídas se estiverem quebradas; conexões ociosas há mais de
+    maxIdleTime segundos são fechadas, preservando o mínimo. Quando todas as
+    conexões estão em uso, a retirada aguarda até checkoutTimeout segundos.
+
+    Ex.:
+
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            ...
+    '''
+
+    def __init__(self, connectFunction, minSize=1, maxSize=10, maxIdleTime=300.0,
+                 healthCheckInterval=30.0, checkoutTimeout=30.0):
+        '''
+        Construtor
+
+        :param connectFunction: Função sem parâmetros que abre uma nova conexão
+        :param minSize: Número mínimo de conexões mantidas abertas
+        :param maxSize: Número máximo de conexões abertas
+        :param maxIdleTime: Tempo de ociosidade após o qual uma conexão é fechada,
+                            em segundos
+        :param healthCheckInterval: Tempo de ociosidade a partir do qual a conexão é
+                                    testada antes de ser entregue, em segundos
+                                    (0 testa em toda retirada)
+        :param checkoutTimeout: Tempo máximo de espera por uma conexão livre, em segundos
+        '''
+        if minSize < 0 or maxSize < 1 or minSize > maxSize:
+            raise ValueError('Limites do pool inválidos: minSize=%d, maxSize=%d' % (minSize, maxSize))
+
+        self.connectFunction = connectFunction
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.maxIdleTime = maxIdleTime
+        self.healthCheckInterval = healthCheckInterval
+        self.checkoutTimeout = checkoutTimeout
+
+        # Conexões livres, da menos à mais recentemente usada
+        self.idle = []
+        self.inUse = {}
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+        for _ in range(minSize):
+            self.idle.append(_PooledConnection(self.connectFunction()))
+            self.size += 1
+
+    def getConnection(self, timeout=None):
+        '''
+        Retira uma conexão do pool. Deve ser devolvida com releaseConnection().
+
+        :param timeout: Tempo máximo de espera, em segundos (padrão: checkoutTimeout)
+
+        :return: Conexão psycopg2
+        '''
+        if timeout is None:
+            timeout = self.checkoutTimeout
+        deadline = time.time() + timeout
+
+        while True:
+            pooled = None
+            create = False
+            with self.condition:
+                while True:
+                    if self.closed:
+                        raise RuntimeError('O pool de conexões já foi encerrado')
+                    self._evictIdle()
+                    if self.idle:
+                        # A conexão usada mais recentemente tem mais chance de estar ativa
+                        pooled = self.idle.pop()
+                        break
+                    if self.size < self.maxSize:
+                        self.size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutException('Nenhuma conexão livre no pool após %.1f segundos' %
+                                               timeout)
+                    self.condition.wait(remaining)
+
+            if create:
+                try:
+                    pooled = _PooledConnection(self.connectFunction())
+                except Exception:
+                    self._discard()
+                    raise
+            elif not self._isHealthy(pooled):
+                logging.warning('Conexão com o Redshift quebrada; abrindo nova conexão')
+                self._closeQuietly(pooled.connection)
+                self._discard()
+                continue
+
+            with self.condition:
+                self.inUse[id(pooled.connection)] = pooled
+            return pooled.connection
+
+    def releaseConnection(self, connection, broken=False):
+        '''
+        Devolve uma conexão ao pool.
+
+        :param connection: Conexão retirada com getConnection()
+        :param broken: Indica que a conexão deve ser descartada
+        '''
+        with self.condition:
+            pooled = self.inUse.pop(id(connection), None)
+        if pooled is None:
+            raise ValueError('A conexão não pertence ao pool')
+
+        if not broken and not connection.closed:
+            try:
+                # Descarta transação deixada aberta e restaura o modo padrão
+                connection.rollback()
+                if connection.autocommit:
+                    connection.autocommit = False
+            except Exception as e:
+                logging.warning('Falha ao restaurar conexão devolvida ao pool: %s', e)
+                broken = True
+        else:
+            broken = True
+
+        if broken:
+            self._closeQuietly(connection)
+            self._discard()
+            return
+
+        with self.condition:
+            if self.closed:
+                self.size -= 1
+                self._closeQuietly(connection)
+                return
+            pooled.lastUsedTime = time.time()
+            self.idle.append(pooled)
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        '''
+        Retira uma conexão do pool durante um bloco with. A conexão é devolvida
+        ao fim do bloco (com rollback do que não foi confirmado) ou descartada se
+        tiver sido perdida.
+
+        :param timeout: Tempo máximo de espera, em segundos (padrão: checkoutTimeout)
+        '''
+        connection = self.getConnection(timeout)
+        broken = False
+        try:
+            yield connection
+        except Exception:
+            broken = bool(connection.closed)
+            raise
+        finally:
+            # Também devolve a conexão quando um gerador que a usa é fechado
+            # antes do fim (GeneratorExit)
+            self.releaseConnection(connection, broken)
+
+    def _isHealthy(self, pooled):
+        connection = pooled.connection
+        if connection.closed:
+            return False
+        if time.time() - pooled.lastUsedTime < self.healthCheckInterval:
+            return True
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self):
+        '''
+        Libera a vaga de uma conexão descartada.
+        '''
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def _evictIdle(self):
+        '''
+        Fecha conexões ociosas há mais de maxIdleTime, mantendo o mínimo.
+        Chamado com o lock do pool.
+        '''
+        if self.maxIdleTime is None:
+            return
+        limit = time.time() - self.maxIdleTime
+        while self.idle and self.size > self.minSize and self.idle[0].lastUsedTime < limit:
+            pooled = self.idle.pop(0)
+            self.size -= 1
+            self._closeQuietly(pooled.connection)
+
+    def _closeQuietly(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def evictIdle(self):
+        '''
+        Fecha as conexões ociosas há mais de maxIdleTime, mantendo o mínimo.
+        '''
+        with self.condition:
+            self._evictIdle()
+
+    def getStats(self):
+        '''
+        :return: Dicionário com o total de conexões abertas, livres e em uso
+        '''
+        with self.condition:
+            return {'size': self.size, 'idle': len(self.idle), 'inUse': len(self.inUse)}
+
+    def closeAll(self):
+        '''
+        Encerra o pool, fechando as conexões livres. Conexões em uso são fechadas
+        quando devolvidas.
+        '''
+        with self.condition:
+            self.closed = True
+            idle = self.idle
+            self.idle = []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for pooled in idle:
+            self._closeQuietly(pooled.connection)
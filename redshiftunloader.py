@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from redshiftbulkloader import NULL_MARKER
+from redshiftbulkloader import formatCsvRows
+
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# Formatos de exportação suportados
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+EXPORT_FORMATS = (FORMAT_CSV, FORMAT_PARQUET)
+
+_PART_DONE = object()
+
+
+def _parseS3Url(url):
+    '''
+    :return: Tupla (bucket, chave) de uma URL s3://bucket/chave
+    '''
+    bucketName, _, key = url[len('s3://'):].partition('/')
+    return bucketName, key
+
+
+class RedshiftUnloader:
+    '''
+    Exportação de grandes resultados do Redshift via UNLOAD.
+
+    A consulta é executada com UNLOAD ... PARALLEL ON, de forma que cada slice
+    do cluster grava seus próprios arquivos no S3 (CSV, opcionalmente com gzip,
+    ou Parquet), em vez de todo o resultado passar pela conexão com o nó
+    líder. Os arquivos listados no manifesto são então baixados e decodificados
+    em paralelo, para um arquivo CSV local (exportToFile) ou para um gerador
+    de registros (iterRows). Ao final, os arquivos do UNLOAD são removidos do
+    S3 (opcional).
+
+    Na leitura de CSV os campos são devolvidos como texto (NULL como None); na
+    leitura de Parquet os valores mantêm os tipos das colunas. Requer pyarrow
+    para o formato Parquet.
+    '''
+
+    def __init__(self, redshift, s3, bucketName, stagingPrefix='redshift-staging/',
+                 authorization=None, maxWorkers=8, cleanup=True, batchSize=1000, queueSize=16):
+        '''
+        Construtor
+
+        :param redshift: Instância de AWSRedshift onde o UNLOAD é executado
+        :param s3: Instância de AWSS3 usada na leitura dos arquivos
+        :param bucketName: Bucket de destino do UNLOAD
+        :param stagingPrefix: Prefixo de destino no bucket
+        :param authorization: Cláusula de autorização do UNLOAD (ex.: "IAM_ROLE 'arn:...'")
+        :param maxWorkers: Número de arquivos baixados e decodificados simultaneamente
+        :param cleanup: Remove os arquivos do UNLOAD após a leitura
+        :param batchSize: Número de registros de cada lote entregue pelas threads (iterRows)
+        :param queueSize: Número máximo de lotes aguardando consumo (iterRows)
+        '''
+        self.redshift = redshift
+        self.s3 = s3
+        self.bucketName = bucketName
+        self.stagingPrefix = stagingPrefix
+        self.authorization = authorization
+        self.maxWorkers = maxWorkers
+        self.cleanup = cleanup
+        self.batchSize = batchSize
+        self.queueSize = queueSize
+
+    def unload(self, query, fileFormat=FORMAT_CSV, compression='gzip', unloadOptions=None):
+        '''
+        Executa o UNLOAD da consulta para um novo prefixo no bucket de staging.
+
+        :param query: Consulta a ser exportada
+        :param fileFormat: 'csv' ou 'parquet'
+        :param compression: 'gzip' ou None (somente CSV)
+        :param unloadOptions: Opções adicionais do UNLOAD (ex.: "MAXFILESIZE 256 MB")
+
+        :return: Manifesto do UNLOAD ({'entries': [{'url', 'meta'}, ...]}), com a
+                 chave do próprio manifesto em 'manifestKey'
+        '''
+        if fileFormat not in EXPORT_FORMATS:
+            raise ValueError('Formato de exportação inválido: %s' % fileFormat)
+        if compression not in (None, 'gzip'):
+            raise ValueError('Compressão inválida: %s' % compression)
+        if not self.authorization:
+            raise ValueError('Informe a autorização do UNLOAD (IAM role ou credenciais)')
+
+        runPrefix = '%sunload/%s/part_' % (self.stagingPrefix, uuid.uuid4().hex)
+        escapedQuery = query.replace('\\', '\\\\').replace("'", "\\'")
+        sqlCommand = "UNLOAD ('%s') TO 's3://%s/%s' %s MANIFEST VERBOSE PARALLEL ON" % (
+            escapedQuery, self.bucketName, runPrefix, self.authorization)
+        if fileFormat == FORMAT_PARQUET:
+            sqlCommand += ' FORMAT PARQUET'
+        else:
+            sqlCommand += " FORMAT CSV NULL AS '%s'" % NULL_MARKER.replace('\\', '\\\\')
+            if compression == 'gzip':
+                sqlCommand += ' GZIP'
+        if unloadOptions:
+            sqlCommand += ' ' + unloadOptions
+
+        with self.redshift.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sqlCommand)
+            conn.commit()
+
+        manifestKey = runPrefix + 'manifest'
+        body = self.s3.client.get_object(Bucket=self.bucketName, Key=manifestKey)['Body']
+        try:
+            manifest = json.loads(body.read().decode('utf-8'))
+        finally:
+            body.close()
+        manifest['manifestKey'] = manifestKey
+        return manifest
+
+    def exportToFile(self, query, localPath, fileFormat=FORMAT_CSV, compression='gzip',
+                     unloadOptions=None):
+        '''
+        Exporta o resultado da consulta para um arquivo CSV local (sem compressão,
+        NULL como NULL_MARKER). Os arquivos do UNLOAD são baixados e decodificados
+        em paralelo e concatenados na ordem do manifesto.
+
+        :param query: Consulta a ser exportada
+        :param localPath: Caminho do arquivo CSV de destino
+        :param fileFormat: Formato intermediário do UNLOAD: 'csv' ou 'parquet'
+        :param compression: Compressão do UNLOAD: 'gzip' ou None (somente CSV)
+        :param unloadOptions: Opções adicionais do UNLOAD
+
+        :return: Dicionário com parts, rows (record_count do manifesto), bytes e
+                 elapsed (segundos)
+        '''
+        startTime = time.time()
+        manifest = self.unload(query, fileFormat, compression, unloadOptions)
+        entries = manifest.get('entries', [])
+        localDir = tempfile.mkdtemp(prefix='redshift_unload_',
+                                    dir=os.path.dirname(os.path.abspath(localPath)))
+        try:
+            def decodePart(indexedEntry):
+                index, entry = indexedEntry
+                partPath = os.path.join(localDir, 'part_%05d.csv' % index)
+                self._decodePartToFile(entry, fileFormat, partPath)
+                return partPath
+
+            executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+            futures = []
+            try:
+                futures = [executor.submit(decodePart, indexedEntry)
+                           for indexedEntry in enumerate(entries)]
+                with open(localPath, 'wb') as outFile:
+                    for future in futures:
+                        partPath = future.result()
+                        with open(partPath, 'rb') as partFile:
+                            shutil.copyfileobj(partFile, outFile, 1024 * 1024)
+                        os.remove(partPath)
+            finally:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+        finally:
+            shutil.rmtree(localDir, ignore_errors=True)
+            self._cleanup(manifest)
+
+        recordCounts = [entry.get('meta', {}).get('record_count') for entry in entries]
+        return {
+            'parts': len(entries),
+            'rows': sum(recordCounts) if None not in recordCounts else None,
+            'bytes': os.path.getsize(localPath),
+            'elapsed': time.time() - startTime
+        }
+
+    def iterRows(self, query, fileFormat=FORMAT_CSV, compression='gzip', unloadOptions=None):
+        '''
+        Exporta o resultado da consulta e gera os registros à medida que os
+        arquivos do UNLOAD são lidos em paralelo. A ordem dos registros entre
+        arquivos não é garantida (como no próprio UNLOAD paralelo).
+
+        :param query: Consulta a ser exportada
+        :param fileFormat: 'csv' ou 'parquet'
+        :param compression: 'gzip' ou None (somente CSV)
+        :param unloadOptions: Opções adicionais do UNLOAD
+
+        :return: Gerador de registros (listas de campos em CSV, tuplas em Parquet)
+        '''
+        manifest = self.unload(query, fileFormat, compression, unloadOptions)
+        entries = manifest.get('entries', [])
+        batches = queue.Queue(maxsize=self.queueSize)
+        stopEvent = threading.Event()
+
+        def put(item):
+            while not stopEvent.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def readPart(entry):
+            try:
+                for rows in self._iterPartBatches(entry, fileFormat):
+                    if not put(rows):
+                        return
+            except Exception as e:
+                logging.warning('Falha na leitura de arquivo do UNLOAD %s: %s', entry['url'], e)
+                put(e)
+            finally:
+                put(_PART_DONE)
+
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            for entry in entries:
+                executor.submit(readPart, entry)
+            pendingParts = len(entries)
+            while pendingParts:
+                item = batches.get()
+                if item is _PART_DONE:
+                    pendingParts -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    for row in item:
+                        yield row
+        finally:
+            # Interrompe as leituras quando o gerador é fechado antes do fim
+            stopEvent.set()
+            executor.shutdown(wait=True)
+            self._cleanup(manifest)
+
+    def _iterPartBatches(self, entry, fileFormat):
+        '''
+        Gera os registros de um arquivo do UNLOAD em lotes de até batchSize.
+        '''
+        bucketName, key = _parseS3Url(entry['url'])
+        if fileFormat == FORMAT_PARQUET:
+            for rows in self._iterParquetBatches(bucketName, key):
+                yield rows
+            return
+
+        rows = []
+        for row in self.s3.iterRecords(bucketName, key, 'csv', 'auto'):
+            rows.append([None if value == NULL_MARKER else value for value in row])
+            if len(rows) >= self.batchSize:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+    def _iterParquetBatches(self, bucketName, key):
+        # Importação tardia: pyarrow só é necessário no formato Parquet
+        import pyarrow.parquet
+
+        fileHandle, localPath = tempfile.mkstemp(suffix='.parquet')
+        os.close(fileHandle)
+        try:
+            # O rodapé do Parquet fica no fim do arquivo; o arquivo é baixado antes
+            # da leitura (GETs paralelos por intervalo)
+            self.s3.download(bucketName, key, localPath, resume=False)
+            parquetFile = pyarrow.parquet.ParquetFile(localPath)
+            for batch in parquetFile.iter_batches(batch_size=self.batchSize):
+                yield list(zip(*[column.to_pylist() for column in batch.columns]))
+        finally:
+            os.remove(localPath)
+
+    def _decodePartToFile(self, entry, fileFormat, partPath):
+        '''
+        Grava o conteúdo decodificado de um arquivo do UNLOAD em CSV local.
+        '''
+        bucketName, key = _parseS3Url(entry['url'])
+        if fileFormat == FORMAT_PARQUET:
+            with open(partPath, 'wb') as outFile:
+                for rows in self._iterParquetBatches(bucketName, key):
+                    outFile.write(formatCsvRows(rows))
+            return
+
+        downloadPath = partPath + '.download'
+        try:
+            self.s3.download(bucketName, key, downloadPath, resume=False)
+            with open(downloadPath, 'rb') as inFile:
+                isGzip = inFile.read(2) == b'\x1f\x8b'
+            opener = gzip.open if isGzip else open
+            with opener(downloadPath, 'rb') as inFile:
+                with open(partPath, 'wb') as outFile:
+                    shutil.copyfileobj(inFile, outFile, 1024 * 1024)
+        finally:
+            if os.path.exists(downloadPath):
+                os.remove(downloadPath)
+
+    def _cleanup(self, manifest):
+        if not self.cleanup:
+            return
+        keys = [_parseS3Url(entry['url'])[1] for entry in manifest.get('entries', [])]
+        keys.append(manifest['manifestKey'])
+        report = self.s3.deleteObjects(self.bucketName, items=keys)
+        if report.failures:
+            logging.warning('Falha ao remover arquivos do UNLOAD: %s', report.failures)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# Marca de fim de trabalho de uma thread de listagem
+_WORKER_DONE = object()
+
+
+class S3BulkLister:
+    '''
+    Motor de listagem paralela de vários buckets/pastas do S3.
+
+    As pastas recebidas são listadas com delimitador '/' e as subpastas
+    encontradas, até splitDepth níveis, viram novas tarefas independentes,
+    aumentando o paralelismo em prefixos grandes. A partir dessa
+    profundidade, cada subpasta é listada de forma recursiva por uma única
+    tarefa.
+
+    Os ítens de todas as tarefas são unidos em um único fluxo, através de uma
+    fila limitada: se o consumidor for mais lento que as listagens, as
+    threads aguardam (backpressure) em vez de acumular ítens em memória.
+    '''
+
+    def __init__(self, s3, maxWorkers=8, maxWorkersPerBucket=4, queueSize=1000,
+                 splitDepth=1, pageSize=None):
+        '''
+        Construtor
+
+        :param s3: Instância de AWSS3 usada nas listagens
+        :param maxWorkers: Número total de threads de listagem
+        :param maxWorkersPerBucket: Número máximo de listagens simultâneas por bucket
+        :param queueSize: Capacidade da fila de ítens entre as threads e o consumidor
+        :param splitDepth: Quantos níveis de subpastas são divididos em tarefas próprias
+        :param pageSize: Número de chaves solicitadas por requisição ao S3
+        '''
+        if maxWorkers < 1 or maxWorkersPerBucket < 1:
+            raise ValueError('O número de threads deve ser ao menos 1')
+
+        self.s3 = s3
+        self.maxWorkers = maxWorkers
+        self.maxWorkersPerBucket = maxWorkersPerBucket
+        self.queueSize = queueSize
+        self.splitDepth = splitDepth
+        self.pageSize = pageSize
+
+    def iterObjects(self, targets):
+        '''
+        Lista em paralelo os pares (bucket, pasta) informados.
+
+        :param targets: Coleção de tuplas (bucket, pasta); pasta vazia ou None
+                        lista o bucket inteiro
+
+        :return: Gerador de ítens de arquivo, no formato de AWSS3.iterObjects,
+                 acrescidos da chave 'bucket'
+        '''
+        pending = collections.deque()
+        for bucketName, folderPath in targets:
+            if folderPath and not folderPath.endswith('/'):
+                folderPath = folderPath + '/'
+            pending.append((bucketName, folderPath or '', 0))
+
+        state = {
+            'pending': pending,
+            'activeByBucket': collections.defaultdict(int),
+            'running': 0
+        }
+        condition = threading.Condition()
+        stopEvent = threading.Event()
+        output = queue.Queue(self.queueSize)
+
+        workers = []
+        for _ in range(self.maxWorkers):
+            worker = threading.Thread(target=self._worker,
+                                      args=(state, condition, stopEvent, output))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        finishedWorkers = 0
+        try:
+            while finishedWorkers < len(workers):
+                item = output.get()
+                if item is _WORKER_DONE:
+                    finishedWorkers += 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stopEvent.set()
+            with condition:
+                condition.notify_all()
+            # Libera threads eventualmente bloqueadas na fila cheia
+            while any(worker.is_alive() for worker in workers):
+                try:
+                    output.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def _nextTask(self, state, condition, stopEvent):
+        with condition:
+            while not stopEvent.is_set():
+                pending = state['pending']
+                for index in range(len(pending)):
+                    bucketName = pending[index][0]
+                    if state['activeByBucket'][bucketName] < self.maxWorkersPerBucket:
+                        task = pending[index]
+                        del pending[index]
+                        state['activeByBucket'][bucketName] += 1
+                        state['running'] += 1
+                        return task
+
+                if not pending and state['running'] == 0:
+                    condition.notify_all()
+                    return None
+                condition.wait(1.0)
+        return None
+
+    def _worker(self, state, condition, stopEvent, output):
+        try:
+            while True:
+                task = self._nextTask(state, condition, stopEvent)
+                if task is None:
+                    break
+
+                try:
+                    self._listTask(task, state, condition, stopEvent, output)
+                finally:
+                    with condition:
+                        state['activeByBucket'][task[0]] -= 1
+                        state['running'] -= 1
+                        condition.notify_all()
+        except Exception as e:
+            stopEvent.set()
+            self._put(output, e, None)
+        finally:
+            self._put(output, _WORKER_DONE, None)
+
+    def _listTask(self, task, state, condition, stopEvent, output):
+        bucketName, folderPath, depth = task
+        split = depth < self.splitDepth
+        itemIterator = self.s3.iterObjects(bucketName, folderPath,
+                                           pageSize=self.pageSize,
+                                           recursive=not split)
+        for item_data in itemIterator:
+            if item_data['type'] == 'folder':
+                with condition:
+                    state['pending'].append((bucketName, item_data['path'], depth + 1))
+                    condition.notify()
+                continue
+
+            item_data['bucket'] = bucketName
+            if not self._put(output, item_data, stopEvent):
+                return
+
+    def _put(self, output, item, stopEvent):
+        while True:
+            try:
+                output.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if stopEvent is not None and stopEvent.is_set():
+                    return False
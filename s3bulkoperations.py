@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from s3transferengine import getPartSize
+
+import logging
+import threading
+import time
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+
+# Número máximo de chaves aceito por requisição de delete_objects
+DELETE_BATCH_SIZE = 1000
+# Acima deste tamanho as cópias são feitas em multipart (copy_object aceita até 5 GB)
+MULTIPART_COPY_THRESHOLD = 1024 * 1024 * 1024
+# Tamanho de cada parte das cópias multipart (aumentado para objetos acima de
+# 10.000 partes, ver getPartSize)
+MULTIPART_COPY_PART_SIZE = 256 * 1024 * 1024
+# Atributos do objeto preservados na cópia multipart (copy_object os copia por padrão)
+MULTIPART_COPY_ATTRIBUTES = ('CacheControl', 'ContentDisposition', 'ContentEncoding',
+                             'ContentLanguage', 'ContentType', 'Expires', 'Metadata',
+                             'WebsiteRedirectLocation')
+
+
+class BulkOperationReport:
+    '''
+    Resultado (e progresso) de uma operação em lote no S3.
+
+    Os contadores são atualizados à medida que a operação avança e podem ser
+    consultados por outra thread durante a execução.
+    '''
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.succeeded = 0
+        self.bytesProcessed = 0
+        self.failures = []
+        self.startTime = time.time()
+        self.finishTime = None
+        self.lock = threading.Lock()
+
+    def addSuccess(self, count=1, size=0):
+        with self.lock:
+            self.succeeded += count
+            self.bytesProcessed += size
+
+    def addFailure(self, key, error):
+        with self.lock:
+            self.failures.append({'key': key, 'error': str(error)})
+
+    def finish(self):
+        self.finishTime = time.time()
+
+    def getElapsedTime(self):
+        '''
+        Tempo decorrido da operação, em segundos.
+        '''
+        return (self.finishTime or time.time()) - self.startTime
+
+    def getThroughput(self):
+        '''
+        Vazão da operação, em chaves processadas com sucesso por segundo.
+        '''
+        elapsed = self.getElapsedTime()
+        return self.succeeded / elapsed if elapsed > 0 else 0.0
+
+    def toDict(self):
+        with self.lock:
+            return {
+                'operation': self.operation,
+                'succeeded': self.succeeded,
+                'failed': len(self.failures),
+                'failures': list(self.failures),
+                'bytes': self.bytesProcessed,
+                'elapsed': self.getElapsedTime(),
+                'keysPerSecond': self.getThroughput()
+            }
+
+
+def _itemKey(item):
+    return item if not isinstance(item, dict) else item['path']
+
+
+def _isFolder(item):
+    return isinstance(item, dict) and item.get('type') == 'folder'
+
+
+def _notifyProgress(progressCallback, report):
+    if progressCallback is None:
+        return
+    try:
+        progressCallback(report)
+    except Exception as e:
+        logging.exception('Falha no callback de progresso da operação %s: %s',
+                          report.operation, e)
+
+
+class S3BulkOperations:
+    '''
+    Remoção e cópia (server-side) de grandes quantidades de objetos do S3.
+
+    As chaves podem vir de qualquer iterável: listas de chaves, ítens
+    retornados por AWSS3.iterObjects / getObjects(streaming=True) ou versões
+    filtradas deles. O iterável é consumido aos poucos, com um número limitado
+    de requisições em andamento, sem materializar a listagem inteira.
+    '''
+
+    def __init__(self, client, maxWorkers=8):
+        '''
+        Construtor
+
+        :param client: Cliente boto3 do S3
+        :param maxWorkers: Número de requisições simultâneas
+        '''
+        if maxWorkers < 1:
+            raise ValueError('maxWorkers deve ser ao menos 1')
+        self.client = client
+        self.maxWorkers = maxWorkers
+
+    def deleteObjects(self, bucketName, items, progressCallback=None):
+        '''
+        Remove objetos em lotes de até 1.000 chaves por requisição.
+
+        :param bucketName: Bucket dos objetos
+        :param items: Iterável de chaves ou de ítens de listagem (pastas são ignoradas)
+        :param progressCallback: Função opcional chamada com o relatório após cada lote
+
+        :return: BulkOperationReport com sucessos, falhas por chave e vazão
+        '''
+        report = BulkOperationReport('delete')
+
+        def deleteBatch(keys):
+            try:
+                response = self.client.delete_objects(Bucket=bucketName,
+                                                      Delete={'Objects': [{'Key': key} for key in keys],
+                                                              'Quiet': True})
+            except Exception as e:
+                for key in keys:
+                    report.addFailure(key, e)
+            else:
+                errors = response.get('Errors', [])
+                for error in errors:
+                    report.addFailure(error['Key'], '%s: %s' % (error.get('Code'), error.get('Message')))
+                report.addSuccess(len(keys) - len(errors))
+            _notifyProgress(progressCallback, report)
+
+        self._runBounded(deleteBatch, self._batches(items, DELETE_BATCH_SIZE))
+        report.finish()
+        return report
+
+    def copyObjects(self, sourceBucket, items, destinationBucket, destinationPrefix='',
+                    sourcePrefix='', keyMapper=None, progressCallback=None):
+        '''
+        Copia objetos no próprio S3 (sem trafegar os dados pelo cliente).
+
+        Objetos acima de MULTIPART_COPY_THRESHOLD são copiados em multipart,
+        com upload_part_copy por intervalo de bytes.
+
+        :param sourceBucket: Bucket de origem
+        :param items: Iterável de chaves ou de ítens de listagem (pastas são ignoradas)
+        :param destinationBucket: Bucket de destino
+        :param destinationPrefix: Prefixo que substitui sourcePrefix nas chaves de destino
+        :param sourcePrefix: Prefixo removido das chaves de origem
+        :param keyMapper: Função opcional que recebe a chave de origem e retorna a de
+                          destino; quando informada, os prefixos são ignorados
+        :param progressCallback: Função opcional chamada com o relatório após cada cópia
+
+        No mesmo bucket, se destinationPrefix estiver dentro de sourcePrefix, as
+        chaves de origem sob destinationPrefix são ignoradas (evita copiar as
+        próprias cópias quando a origem é listada durante a operação).
+
+        :return: BulkOperationReport com sucessos, falhas por chave e vazão
+        '''
+        report = BulkOperationReport('copy')
+
+        customMapper = keyMapper is not None
+        if keyMapper is None:
+            def keyMapper(key):
+                if sourcePrefix and key.startswith(sourcePrefix):
+                    key = key[len(sourcePrefix):]
+                return destinationPrefix + key
+
+        def copyItem(item):
+            sourceKey = _itemKey(item)
+            try:
+                size = int(item['size']) if isinstance(item, dict) and 'size' in item else None
+                size = self._copyObject(sourceBucket, sourceKey, destinationBucket,
+                                        keyMapper(sourceKey), size)
+            except Exception as e:
+                report.addFailure(sourceKey, e)
+            else:
+                report.addSuccess(1, size)
+            _notifyProgress(progressCallback, report)
+
+        fileItems = (item for item in items if not _isFolder(item))
+        if sourceBucket == destinationBucket and not customMapper:
+            if destinationPrefix == sourcePrefix:
+                raise ValueError('A origem e o destino da cópia são os mesmos')
+            if destinationPrefix.startswith(sourcePrefix):
+                # O destino fica dentro da origem: as cópias criadas durante a
+                # operação (ou anteriores) não são copiadas de novo
+                fileItems = (item for item in fileItems
+                             if not _itemKey(item).startswith(destinationPrefix))
+        self._runBounded(copyItem, fileItems)
+        report.finish()
+        return report
+
+    def _copyObject(self, sourceBucket, sourceKey, destinationBucket, destinationKey, size):
+        copySource = {'Bucket': sourceBucket, 'Key': sourceKey}
+        head = None
+        if size is None or size > MULTIPART_COPY_THRESHOLD:
+            head = self.client.head_object(Bucket=sourceBucket, Key=sourceKey)
+            size = head['ContentLength']
+
+        if size <= MULTIPART_COPY_THRESHOLD:
+            self.client.copy_object(Bucket=destinationBucket, Key=destinationKey,
+                                    CopySource=copySource)
+            return size
+
+        # Diferente de copy_object, o multipart não copia metadados, cabeçalhos
+        # nem tags do objeto de origem
+        uploadArgs = dict((attribute, head[attribute]) for attribute in MULTIPART_COPY_ATTRIBUTES
+                          if head.get(attribute))
+        tags = self.client.get_object_tagging(Bucket=sourceBucket, Key=sourceKey).get('TagSet')
+        if tags:
+            uploadArgs['Tagging'] = '&'.join('%s=%s' % (quote(tag['Key'], safe=''),
+                                                        quote(tag['Value'], safe=''))
+                                             for tag in tags)
+        uploadId = self.client.create_multipart_upload(Bucket=destinationBucket,
+                                                       Key=destinationKey,
+                                                       **uploadArgs)['UploadId']
+        partSize = getPartSize(size, MULTIPART_COPY_PART_SIZE)
+        try:
+            parts = []
+            start = 0
+            while start < size:
+                end = min(start + partSize, size) - 1
+                partNumber = len(parts) + 1
+                response = self.client.upload_part_copy(Bucket=destinationBucket,
+                                                        Key=destinationKey,
+                                                        UploadId=uploadId,
+                                                        PartNumber=partNumber,
+                                                        CopySource=copySource,
+                                                        CopySourceRange='bytes=%d-%d' % (start, end))
+                parts.append({'PartNumber': partNumber,
+                              'ETag': response['CopyPartResult']['ETag']})
+                start = end + 1
+
+            self.client.complete_multipart_upload(Bucket=destinationBucket,
+                                                  Key=destinationKey,
+                                                  UploadId=uploadId,
+                                                  MultipartUpload={'Parts': parts})
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=destinationBucket,
+                                               Key=destinationKey,
+                                               UploadId=uploadId)
+            raise
+        return size
+
+    def _batches(self, items, batchSize):
+        batch = []
+        for item in items:
+            if _isFolder(item):
+                continue
+            batch.append(_itemKey(item))
+            if len(batch) >= batchSize:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _runBounded(self, function, tasks):
+        '''
+        Executa function para cada tarefa no pool, mantendo no máximo
+        2 * maxWorkers tarefas pendentes, para não consumir o iterável de
+        entrada mais rápido do que as requisições são feitas.
+        '''
+        slots = threading.BoundedSemaphore(self.maxWorkers * 2)
+
+        def runTask(task):
+            try:
+                function(task)
+            finally:
+                slots.release()
+
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            for task in tasks:
+                slots.acquire()
+                executor.submit(runTask, task)
+        finally:
+            executor.shutdown(wait=True)
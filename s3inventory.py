@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+import sqlite3
+import threading
+
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    etag TEXT,
+    size INTEGER NOT NULL,
+    last_modified TEXT,
+    PRIMARY KEY (bucket, key)
+);
+CREATE TABLE IF NOT EXISTS refreshes (
+    refresh_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    refreshed_at TEXT NOT NULL,
+    pages_total INTEGER NOT NULL,
+    pages_changed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    refresh_id INTEGER NOT NULL,
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    change TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_by_refresh ON changes (bucket, refresh_id);
+'''
+
+
+def _prefixUpperBound(prefix):
+    '''
+    Menor chave maior que todas as chaves iniciadas por prefix.
+    '''
+    return prefix[:-1] + unichr(ord(prefix[-1]) + 1) if prefix else None
+
+
+class S3InventoryIndex:
+    '''
+    Índice local (SQLite) do inventário de objetos do S3.
+
+    Guarda chave, ETag, tamanho e data de modificação de cada objeto listado,
+    permitindo responder consultas de tamanho, contagem e diferenças de
+    prefixos localmente, sem chamadas à API.
+
+    A atualização (refresh) é incremental: cada página retornada pelo S3 é
+    comparada com o intervalo de chaves correspondente no índice e só é
+    gravada quando algo mudou. Alterações (inclusões, modificações e
+    remoções) ficam registradas por refresh e podem ser consultadas depois.
+    '''
+
+    def __init__(self, s3, dbPath):
+        '''
+        Construtor
+
+        :param s3: Instância de AWSS3 usada nas listagens
+        :param dbPath: Caminho do arquivo SQLite do índice
+        '''
+        self.s3 = s3
+        self.dbPath = dbPath
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(dbPath, check_same_thread=False)
+        self.conn.executescript(_schema)
+        self.conn.commit()
+
+    def close(self):
+        '''
+        Fecha a conexão com o arquivo do índice.
+        '''
+        with self.lock:
+            self.conn.close()
+
+    def refresh(self, bucketName, prefix='', pageSize=None):
+        '''
+        Atualiza o índice de um prefixo a partir do S3.
+
+        :param bucketName: Bucket a ser indexado
+        :param prefix: Prefixo a ser indexado; vazio indexa o bucket inteiro
+        :param pageSize: Número de chaves solicitadas por requisição
+
+        :return: Dicionário com refreshId, páginas lidas/alteradas e totais de
+                 chaves incluídas, modificadas e removidas
+        '''
+        prefix = prefix or ''
+        requestArgs = {'Bucket': bucketName}
+        if prefix:
+            requestArgs['Prefix'] = prefix
+        if pageSize:
+            requestArgs['MaxKeys'] = min(int(pageSize), 1000)
+
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO refreshes (bucket, prefix, refreshed_at, pages_total, pages_changed) '
+                           'VALUES (?, ?, ?, 0, 0)',
+                           (bucketName, prefix, datetime.utcnow().isoformat()))
+            refreshId = cursor.lastrowid
+            self.conn.commit()
+
+        summary = {
+            'refreshId': refreshId,
+            'pages': 0,
+            'pagesChanged': 0,
+            'added': 0,
+            'modified': 0,
+            'removed': 0
+        }
+        lowerKey = None
+        while True:
+            page = self.s3.client.list_objects_v2(**requestArgs)
+            contents = page.get('Contents', [])
+            truncated = page.get('IsTruncated', False)
+
+            summary['pages'] += 1
+            if truncated and not contents:
+                # Página truncada sem chaves (ex.: só CommonPrefixes): não delimita
+                # intervalo algum; o limite inferior continua o mesmo
+                requestArgs['ContinuationToken'] = page['NextContinuationToken']
+                continue
+
+            upperKey = contents[-1]['Key'] if truncated else None
+            if self._applyPage(bucketName, prefix, lowerKey, upperKey, contents,
+                               refreshId, summary):
+                summary['pagesChanged'] += 1
+
+            if not truncated:
+                break
+            lowerKey = upperKey
+            requestArgs['ContinuationToken'] = page['NextContinuationToken']
+
+        with self.lock:
+            self.conn.execute('UPDATE refreshes SET pages_total = ?, pages_changed = ? '
+                              'WHERE refresh_id = ?',
+                              (summary['pages'], summary['pagesChanged'], refreshId))
+            self.conn.commit()
+        return summary
+
+    def _rangeFilter(self, bucketName, prefix, lowerKey, upperKey):
+        clauses = ['bucket = ?']
+        args = [bucketName]
+        if prefix:
+            clauses.append('key >= ? AND key < ?')
+            args.extend([prefix, _prefixUpperBound(prefix)])
+        if lowerKey is not None:
+            clauses.append('key > ?')
+            args.append(lowerKey)
+        if upperKey is not None:
+            clauses.append('key <= ?')
+            args.append(upperKey)
+        return ' AND '.join(clauses), args
+
+    def _applyPage(self, bucketName, prefix, lowerKey, upperKey, contents, refreshId, summary):
+        '''
+        Sincroniza com o índice o intervalo de chaves (lowerKey, upperKey] coberto
+        por uma página da listagem. Retorna True se algo foi alterado.
+        '''
+        pageRows = {}
+        for obj_item in contents:
+            pageRows[obj_item['Key']] = (obj_item['ETag'], obj_item['Size'],
+                                         str(obj_item.get('LastModified')))
+
+        whereClause, whereArgs = self._rangeFilter(bucketName, prefix, lowerKey, upperKey)
+        with self.lock:
+            storedRows = {}
+            for key, etag, size, lastModified in self.conn.execute(
+                    'SELECT key, etag, size, last_modified FROM objects WHERE ' + whereClause,
+                    whereArgs):
+                storedRows[key] = (etag, size, lastModified)
+
+            if storedRows == pageRows:
+                return False
+
+            changes = []
+            upserts = []
+            for key, row in pageRows.items():
+                stored = storedRows.get(key)
+                if stored is None:
+                    changes.append((refreshId, bucketName, key, 'added'))
+                elif stored != row:
+                    changes.append((refreshId, bucketName, key, 'modified'))
+                else:
+                    continue
+                upserts.append((bucketName, key) + row)
+            removed = [key for key in storedRows if key not in pageRows]
+            changes.extend((refreshId, bucketName, key, 'removed') for key in removed)
+
+            self.conn.executemany('INSERT OR REPLACE INTO objects (bucket, key, etag, size, last_modified) '
+                                  'VALUES (?, ?, ?, ?, ?)', upserts)
+            self.conn.executemany('DELETE FROM objects WHERE bucket = ? AND key = ?',
+                                  [(bucketName, key) for key in removed])
+            self.conn.executemany('INSERT INTO changes (refresh_id, bucket, key, change) '
+                                  'VALUES (?, ?, ?, ?)', changes)
+            self.conn.commit()
+
+        for change in changes:
+            summary[change[3]] += 1
+        return True
+
+    def getPrefixStats(self, bucketName, prefix=''):
+        '''
+        Retorna a quantidade de objetos e o tamanho total de um prefixo indexado.
+
+        :param bucketName: Bucket consultado
+        :param prefix: Prefixo consultado; vazio considera o bucket inteiro
+
+        :return: Dicionário com count e size (em bytes)
+        '''
+        whereClause, whereArgs = self._rangeFilter(bucketName, prefix, None, None)
+        with self.lock:
+            count, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects WHERE '
+                                            + whereClause, whereArgs).fetchone()
+        return {'count': count, 'size': size}
+
+    def getChanges(self, bucketName, prefix='', sinceRefreshId=None):
+        '''
+        Retorna as alterações detectadas pelos refreshes de um bucket.
+
+        :param bucketName: Bucket consultado
+        :param prefix: Restringe as alterações a um prefixo
+        :param sinceRefreshId: Considera apenas refreshes posteriores a este
+
+        :return: Lista de dicionários com refreshId, key e change
+                 (added, modified ou removed)
+        '''
+        clauses = ['bucket = ?']
+        args = [bucketName]
+        if prefix:
+            clauses.append('key >= ? AND key < ?')
+            args.extend([prefix, _prefixUpperBound(prefix)])
+        if sinceRefreshId is not None:
+            clauses.append('refresh_id > ?')
+            args.append(sinceRefreshId)
+
+        with self.lock:
+            rows = self.conn.execute('SELECT refresh_id, key, change FROM changes WHERE '
+                                     + ' AND '.join(clauses) + ' ORDER BY refresh_id, key',
+                                     args).fetchall()
+        return [{'refreshId': refreshId, 'key': key, 'change': change}
+                for refreshId, key, change in rows]
+
+    def diffPrefixes(self, bucketName, prefix, otherBucketName, otherPrefix):
+        '''
+        Compara o conteúdo indexado de dois prefixos, pelas chaves relativas a
+        cada prefixo e seus ETags.
+
+        :param bucketName: Bucket do primeiro prefixo
+        :param prefix: Primeiro prefixo
+        :param otherBucketName: Bucket do segundo prefixo
+        :param otherPrefix: Segundo prefixo
+
+        :return: Dicionário com as listas de chaves relativas onlyInFirst,
+                 onlyInSecond e different
+        '''
+        first = self._relativeEtags(bucketName, prefix)
+        second = self._relativeEtags(otherBucketName, otherPrefix)
+        return {
+            'onlyInFirst': sorted(key for key in first if key not in second),
+            'onlyInSecond': sorted(key for key in second if key not in first),
+            'different': sorted(key for key in first
+                                if key in second and first[key] != second[key])
+        }
+
+    def _relativeEtags(self, bucketName, prefix):
+        prefix = prefix or ''
+        whereClause, whereArgs = self._rangeFilter(bucketName, prefix, None, None)
+        with self.lock:
+            rows = self.conn.execute('SELECT key, etag FROM objects WHERE ' + whereClause,
+                                     whereArgs).fetchall()
+        return dict((key[len(prefix):], etag) for key, etag in rows)
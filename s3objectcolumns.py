@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from array import array
+
+
+# Códigos de tipo de ítem armazenados na coluna types
+TYPE_FILE = 0
+TYPE_FOLDER = 1
+
+# Typecode de inteiro de 64 bits para a coluna de tamanhos ('q' não existe no
+# módulo array do Python 2; nele 'l' tem 64 bits em plataformas LP64)
+try:
+    array('q')
+    _INT64 = 'q'
+except ValueError:
+    _INT64 = 'l' if array('l').itemsize == 8 else 'd'
+
+
+class S3ObjectColumns(object):
+    '''
+    Listagem compacta de objetos do S3, armazenada em colunas.
+
+    Em vez de um dicionário por objeto, guarda uma lista de caminhos, uma de
+    ETags, os tamanhos em um array de inteiros de 64 bits e os tipos em um
+    array de bytes. Os tamanhos são inteiros (não strings) e as operações de
+    soma, filtro e ordenação trabalham diretamente sobre as colunas.
+
+    O formato de dicionários de getObjects continua disponível via toDict().
+    '''
+
+    __slots__ = ('bucket', 'prefix', 'paths', 'etags', 'sizes', 'types')
+
+    def __init__(self, bucket=None, prefix=None):
+        '''
+        Construtor
+
+        :param bucket: Nome do bucket listado
+        :param prefix: Prefixo listado
+        '''
+        self.bucket = bucket
+        self.prefix = prefix
+        self.paths = []
+        self.etags = []
+        self.sizes = array(_INT64)
+        self.types = array('b')
+
+    def append(self, itemType, path, size=0, etag=None):
+        '''
+        Acrescenta um ítem à listagem.
+
+        :param itemType: TYPE_FILE ou TYPE_FOLDER
+        :param path: Chave (ou prefixo, para pastas) do ítem
+        :param size: Tamanho em bytes
+        :param etag: ETag do objeto
+        '''
+        self.types.append(itemType)
+        self.paths.append(path)
+        self.sizes.append(size)
+        self.etags.append(etag)
+
+    def extend(self, rows):
+        '''
+        Acrescenta ítens na forma de tuplas (tipo, caminho, tamanho, etag).
+        '''
+        for itemType, path, size, etag in rows:
+            self.append(itemType, path, size, etag)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        '''
+        Gera os ítens no mesmo formato de dicionário de formatS3ObjectList.
+        '''
+        for index in range(len(self.paths)):
+            yield self.getItem(index)
+
+    def getItem(self, index):
+        '''
+        Retorna o ítem da posição index no formato de dicionário.
+        '''
+        if self.types[index] == TYPE_FOLDER:
+            return {'type': 'folder', 'path': self.paths[index]}
+        return {
+            'type': 'file',
+            'path': self.paths[index],
+            'etag': self.etags[index],
+            'size': str(self.sizes[index])
+        }
+
+    def toDict(self):
+        '''
+        Converte para o formato de retorno de getObjects.
+        '''
+        return {
+            'bucket': self.bucket,
+            'prefix': self.prefix,
+            'itemList': list(self)
+        }
+
+    def getTotalSize(self):
+        '''
+        Soma dos tamanhos de todos os arquivos, em bytes.
+        '''
+        return sum(self.sizes)
+
+    def getFileCount(self):
+        '''
+        Número de arquivos (ítens que não são pastas).
+        '''
+        return len(self.types) - self.types.count(TYPE_FOLDER)
+
+    def select(self, indexes):
+        '''
+        Gera nova listagem com os ítens das posições informadas, na ordem dada.
+        '''
+        result = S3ObjectColumns(self.bucket, self.prefix)
+        paths = self.paths
+        etags = self.etags
+        sizes = self.sizes
+        types = self.types
+        result.paths = [paths[index] for index in indexes]
+        result.etags = [etags[index] for index in indexes]
+        result.sizes = array(_INT64, [sizes[index] for index in indexes])
+        result.types = array('b', [types[index] for index in indexes])
+        return result
+
+    def filterBySize(self, minSize=None, maxSize=None):
+        '''
+        Filtra os arquivos com tamanho no intervalo [minSize, maxSize].
+        Pastas são descartadas.
+        '''
+        lower = minSize if minSize is not None else 0
+        upper = maxSize if maxSize is not None else float('inf')
+        types = self.types
+        return self.select([index for index, size in enumerate(self.sizes)
+                            if lower <= size <= upper and types[index] == TYPE_FILE])
+
+    def filterBySuffix(self, suffix):
+        '''
+        Filtra os ítens cujo caminho termina com suffix (ou um dos sufixos de
+        uma tupla).
+        '''
+        return self.select([index for index, path in enumerate(self.paths)
+                            if path.endswith(suffix)])
+
+    def sortBy(self, column='path', reverse=False):
+        '''
+        Gera nova listagem ordenada por 'path', 'size' ou 'etag'. Valores None
+        (ETag das pastas) são tratados como maiores que os demais.
+        '''
+        if column not in ('path', 'size', 'etag'):
+            raise ValueError('Coluna de ordenação inválida: %s' % column)
+        values = getattr(self, column + 's')
+        indexes = sorted(range(len(values)),
+                         key=lambda index: (values[index] is None, values[index]),
+                         reverse=reverse)
+        return self.select(indexes)
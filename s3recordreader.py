@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import sys
+import zlib
+
+
+# Tamanho dos blocos lidos do corpo do objeto
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Formatos de registro suportados
+RECORD_FORMATS = ('lines', 'csv', 'json')
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_PY2 = sys.version_info[0] == 2
+
+
+class S3RecordReader:
+    '''
+    Leitor de registros de objetos do S3 em fluxo contínuo.
+
+    O corpo do objeto é lido em blocos e quebrado em linhas, registros CSV ou
+    documentos JSON (um por linha) à medida que chega, com descompressão gzip
+    transparente. O consumo de memória fica limitado ao bloco corrente,
+    independente do tamanho do objeto.
+
+    Quando uma expressão SQL é informada, a filtragem é feita no próprio S3
+    (S3 Select) e apenas os registros selecionados trafegam pela rede.
+    '''
+
+    def __init__(self, client, chunkSize=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+        '''
+        Construtor
+
+        :param client: Cliente boto3 do S3
+        :param chunkSize: Tamanho dos blocos lidos do S3, em bytes
+        :param encoding: Codificação do texto do objeto
+        '''
+        self.client = client
+        self.chunkSize = chunkSize
+        self.encoding = encoding
+
+    def iterRecords(self, bucketName, key, recordFormat='lines', compression='auto',
+                    sqlExpression=None, csvDelimiter=',', csvHeader=False):
+        '''
+        Gera os registros de um objeto do S3.
+
+        :param bucketName: Bucket do objeto
+        :param key: Chave do objeto
+        :param recordFormat: 'lines' (texto), 'csv' (listas de campos) ou 'json'
+                             (um documento por linha)
+        :param compression: 'gzip', None, ou 'auto' (detecta pelo cabeçalho gzip)
+        :param sqlExpression: Expressão SQL para filtragem via S3 Select
+                              (somente formatos 'csv' e 'json')
+        :param csvDelimiter: Delimitador de campos CSV
+        :param csvHeader: Indica que a primeira linha do CSV é cabeçalho. Na leitura
+                          direta o cabeçalho é descartado; no S3 Select as colunas
+                          podem ser referenciadas pelo nome na expressão.
+
+        :return: Gerador de registros
+        '''
+        if recordFormat not in RECORD_FORMATS:
+            raise ValueError('Formato de registro inválido: %s' % recordFormat)
+
+        if sqlExpression:
+            chunks = self._iterSelectChunks(bucketName, key, recordFormat, compression,
+                                            sqlExpression, csvDelimiter, csvHeader)
+            skipHeader = False
+        else:
+            chunks = self._iterObjectChunks(bucketName, key, compression)
+            skipHeader = csvHeader
+
+        lines = self._iterLines(chunks)
+        if recordFormat == 'csv':
+            return self._iterCsv(lines, csvDelimiter, skipHeader)
+        if recordFormat == 'json':
+            return (json.loads(line.decode(self.encoding)) for line in lines if line.strip())
+        return (line.rstrip(b'\r\n').decode(self.encoding) for line in lines)
+
+    def _iterObjectChunks(self, bucketName, key, compression):
+        body = self.client.get_object(Bucket=bucketName, Key=key)['Body']
+        try:
+            decompressor = None
+            firstChunk = True
+            while True:
+                chunk = body.read(self.chunkSize)
+                if not chunk:
+                    break
+
+                if firstChunk:
+                    firstChunk = False
+                    if compression == 'gzip' or (compression == 'auto' and
+                                                 chunk[:2] == _GZIP_MAGIC):
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+                if decompressor is None:
+                    yield chunk
+                    continue
+
+                while chunk:
+                    data = decompressor.decompress(chunk)
+                    if data:
+                        yield data
+                    # Arquivos gzip podem conter vários membros concatenados
+                    chunk = decompressor.unused_data
+                    if chunk:
+                        data = decompressor.flush()
+                        if data:
+                            yield data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+            if decompressor is not None:
+                data = decompressor.flush()
+                if data:
+                    yield data
+        finally:
+            body.close()
+
+    def _iterSelectChunks(self, bucketName, key, recordFormat, compression, sqlExpression,
+                          csvDelimiter, csvHeader):
+        if recordFormat == 'csv':
+            inputSerialization = {'CSV': {'FileHeaderInfo': 'USE' if csvHeader else 'NONE',
+                                          'FieldDelimiter': csvDelimiter}}
+            outputSerialization = {'CSV': {'FieldDelimiter': csvDelimiter}}
+        elif recordFormat == 'json':
+            inputSerialization = {'JSON': {'Type': 'LINES'}}
+            outputSerialization = {'JSON': {'RecordDelimiter': '\n'}}
+        else:
+            raise ValueError('S3 Select requer formato csv ou json')
+
+        if compression == 'auto':
+            compression = 'gzip' if key.endswith('.gz') else None
+        inputSerialization['CompressionType'] = 'GZIP' if compression == 'gzip' else 'NONE'
+
+        response = self.client.select_object_content(Bucket=bucketName,
+                                                     Key=key,
+                                                     Expression=sqlExpression,
+                                                     ExpressionType='SQL',
+                                                     InputSerialization=inputSerialization,
+                                                     OutputSerialization=outputSerialization)
+        for event in response['Payload']:
+            if 'Records' in event:
+                yield event['Records']['Payload']
+
+    def _iterLines(self, chunks):
+        '''
+        Reagrupa blocos de bytes em linhas completas (com o terminador).
+        '''
+        pending = b''
+        for chunk in chunks:
+            pending += chunk
+            start = 0
+            while True:
+                end = pending.find(b'\n', start)
+                if end < 0:
+                    break
+                yield pending[start:end + 1]
+                start = end + 1
+            pending = pending[start:]
+        if pending:
+            yield pending
+
+    def _iterCsv(self, lines, csvDelimiter, skipHeader):
+        if _PY2:
+            # O módulo csv do Python 2 opera sobre bytes; os campos são
+            # decodificados depois da separação
+            reader = csv.reader(lines, delimiter=csvDelimiter.encode(self.encoding))
+            records = ([field.decode(self.encoding) for field in row] for row in reader)
+        else:
+            records = csv.reader((line.decode(self.encoding) for line in lines),
+                                 delimiter=csvDelimiter)
+
+        for row in records:
+            if skipHeader:
+                skipHeader = False
+                continue
+            yield row
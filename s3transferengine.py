@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+
+# Tamanho mínimo de parte aceito pelo S3 em uploads multipart (exceto a última)
+MIN_PART_SIZE = 5 * 1024 * 1024
+# Tamanho padrão das partes de upload e dos intervalos de download
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+# Tamanho dos blocos lidos do corpo da resposta em downloads
+READ_CHUNK_SIZE = 256 * 1024
+# Número máximo de partes de um upload multipart no S3
+MAX_PART_COUNT = 10000
+
+_MIB = 1024 * 1024
+
+
+def getPartSize(size, partSize=DEFAULT_PART_SIZE):
+    '''
+    Tamanho de parte efetivo de um upload multipart: partSize, aumentado (em
+    MiB inteiros) quando necessário para que o objeto caiba em MAX_PART_COUNT
+    partes.
+
+    :param size: Tamanho do objeto, em bytes
+    :param partSize: Tamanho de parte desejado, em bytes
+
+    :return: Tamanho de parte, em bytes
+    '''
+    minimumSize = (size + MAX_PART_COUNT - 1) // MAX_PART_COUNT
+    minimumSize = (minimumSize + _MIB - 1) // _MIB * _MIB
+    return max(partSize, minimumSize)
+
+
+class S3TransferEngine:
+    '''
+    Motor de transferência paralela de objetos do S3.
+
+    Uploads grandes são feitos em multipart com as partes enviadas em paralelo;
+    downloads são divididos em GETs por intervalo de bytes (Range) gravados
+    diretamente em um arquivo pré-alocado e mapeado em memória.
+
+    Cada parte é retentada individualmente. O progresso é salvo em um pequeno
+    arquivo de estado ao lado do arquivo local (.s3upload / .s3download), de
+    forma que uma transferência interrompida é retomada sem repetir as partes
+    já concluídas.
+    '''
+
+    def __init__(self, client, partSize=DEFAULT_PART_SIZE, maxWorkers=8, maxRetries=3,
+                 retryBackoff=0.5):
+        '''
+        Construtor
+
+        :param client: Cliente boto3 do S3
+        :param partSize: Tamanho de cada parte, em bytes (mínimo de 5 MB)
+        :param maxWorkers: Número de partes transferidas simultaneamente
+        :param maxRetries: Número de novas tentativas por parte
+        :param retryBackoff: Espera inicial entre tentativas, em segundos (dobra a cada falha)
+        '''
+        if partSize < MIN_PART_SIZE:
+            raise ValueError('O tamanho de parte deve ser de ao menos %d bytes' % MIN_PART_SIZE)
+        if maxWorkers < 1:
+            raise ValueError('maxWorkers deve ser ao menos 1')
+
+        self.client = client
+        self.partSize = partSize
+        self.maxWorkers = maxWorkers
+        self.maxRetries = maxRetries
+        self.retryBackoff = retryBackoff
+
+    def upload(self, localPath, bucketName, key, resume=True):
+        '''
+        Envia um arquivo local para o S3.
+
+        :param localPath: Caminho do arquivo a ser enviado
+        :param bucketName: Bucket de destino
+        :param key: Chave do objeto de destino
+        :param resume: Retoma upload interrompido, se houver arquivo de estado compatível
+
+        :return: ETag do objeto criado
+        '''
+        fileStat = os.stat(localPath)
+        fileSize = fileStat.st_size
+
+        if fileSize <= self.partSize:
+            with open(localPath, 'rb') as inFile:
+                response = self._retry(self.client.put_object,
+                                       Bucket=bucketName, Key=key, Body=inFile.read())
+            return response['ETag']
+
+        # O tamanho efetivo fica no estado: uma retomada usa as mesmas partes
+        partSize = getPartSize(fileSize, self.partSize)
+        statePath = localPath + '.s3upload'
+        identity = {
+            'bucket': bucketName,
+            'key': key,
+            'size': fileSize,
+            'mtime': fileStat.st_mtime,
+            'partSize': partSize
+        }
+        state = self._loadState(statePath, identity) if resume else None
+        if state is not None:
+            try:
+                state['parts'] = self._listUploadedParts(state)
+            except Exception:
+                # Upload expirado ou cancelado no S3: recomeça do zero
+                state = None
+        if state is None:
+            response = self.client.create_multipart_upload(Bucket=bucketName, Key=key)
+            state = dict(identity)
+            state['uploadId'] = response['UploadId']
+            state['parts'] = {}
+            self._saveState(statePath, state)
+
+        partCount = (fileSize + partSize - 1) // partSize
+        missingParts = [partNumber for partNumber in range(1, partCount + 1)
+                        if str(partNumber) not in state['parts']]
+        stateLock = threading.Lock()
+
+        def uploadPart(partNumber):
+            offset = (partNumber - 1) * partSize
+            with open(localPath, 'rb') as inFile:
+                inFile.seek(offset)
+                body = inFile.read(partSize)
+            response = self._retry(self.client.upload_part,
+                                   Bucket=bucketName, Key=key,
+                                   UploadId=state['uploadId'],
+                                   PartNumber=partNumber, Body=body)
+            with stateLock:
+                state['parts'][str(partNumber)] = response['ETag']
+                self._saveState(statePath, state)
+
+        self._runParallel(uploadPart, missingParts)
+
+        partList = [{'PartNumber': int(partNumber), 'ETag': etag}
+                    for partNumber, etag in state['parts'].items()]
+        partList.sort(key=lambda part: part['PartNumber'])
+        response = self._retry(self.client.complete_multipart_upload,
+                               Bucket=bucketName, Key=key,
+                               UploadId=state['uploadId'],
+                               MultipartUpload={'Parts': partList})
+        self._removeState(statePath)
+        return response['ETag']
+
+    def abortUpload(self, localPath):
+        '''
+        Cancela no S3 o upload multipart interrompido de um arquivo local e
+        remove seu arquivo de estado.
+
+        :param localPath: Caminho do arquivo cujo upload foi interrompido
+        '''
+        statePath = localPath + '.s3upload'
+        state = self._loadState(statePath)
+        if state is None:
+            return
+        self.client.abort_multipart_upload(Bucket=state['bucket'], Key=state['key'],
+                                           UploadId=state['uploadId'])
+        self._removeState(statePath)
+
+    def download(self, bucketName, key, localPath, resume=True):
+        '''
+        Baixa um objeto do S3 para um arquivo local.
+
+        O arquivo é pré-alocado com o tamanho do objeto e mapeado em memória;
+        cada intervalo é escrito diretamente na sua posição final.
+
+        :param bucketName: Bucket de origem
+        :param key: Chave do objeto
+        :param localPath: Caminho do arquivo local de destino
+        :param resume: Retoma download interrompido, se houver arquivo de estado compatível
+
+        :return: Número de bytes do objeto
+        '''
+        head = self._retry(self.client.head_object, Bucket=bucketName, Key=key)
+        objectSize = head['ContentLength']
+        etag = head['ETag']
+
+        if objectSize == 0:
+            open(localPath, 'wb').close()
+            return 0
+
+        statePath = localPath + '.s3download'
+        identity = {
+            'bucket': bucketName,
+            'key': key,
+            'etag': etag,
+            'size': objectSize,
+            'partSize': self.partSize
+        }
+        state = self._loadState(statePath, identity) if resume else None
+        if state is not None and (not os.path.exists(localPath) or
+                                  os.path.getsize(localPath) != objectSize):
+            state = None
+        if state is None:
+            state = dict(identity)
+            state['parts'] = []
+            with open(localPath, 'wb') as outFile:
+                outFile.truncate(objectSize)
+            self._saveState(statePath, state)
+
+        partCount = (objectSize + self.partSize - 1) // self.partSize
+        doneParts = set(state['parts'])
+        missingParts = [partNumber for partNumber in range(1, partCount + 1)
+                        if partNumber not in doneParts]
+        stateLock = threading.Lock()
+
+        with open(localPath, 'r+b') as outFile:
+            mappedFile = mmap.mmap(outFile.fileno(), objectSize)
+            try:
+                def downloadPart(partNumber):
+                    start = (partNumber - 1) * self.partSize
+                    end = min(start + self.partSize, objectSize) - 1
+                    self._retry(self._downloadRange, bucketName, key, etag,
+                                start, end, mappedFile)
+                    with stateLock:
+                        state['parts'].append(partNumber)
+                        self._saveState(statePath, state)
+
+                self._runParallel(downloadPart, missingParts)
+                mappedFile.flush()
+            finally:
+                mappedFile.close()
+
+        self._removeState(statePath)
+        return objectSize
+
+    def _downloadRange(self, bucketName, key, etag, start, end, mappedFile):
+        response = self.client.get_object(Bucket=bucketName, Key=key, IfMatch=etag,
+                                          Range='bytes=%d-%d' % (start, end))
+        body = response['Body']
+        position = start
+        try:
+            while position <= end:
+                chunk = body.read(min(READ_CHUNK_SIZE, end - position + 1))
+                if not chunk:
+                    raise IOError('Resposta incompleta do S3 para bytes %d-%d de %s'
+                                  % (start, end, key))
+                mappedFile[position:position + len(chunk)] = chunk
+                position += len(chunk)
+        finally:
+            body.close()
+
+    def _listUploadedParts(self, state):
+        '''
+        Confere no S3 as partes já recebidas de um upload em andamento.
+        '''
+        parts = {}
+        requestArgs = {
+            'Bucket': state['bucket'],
+            'Key': state['key'],
+            'UploadId': state['uploadId']
+        }
+        while True:
+            response = self.client.list_parts(**requestArgs)
+            for part in response.get('Parts', []):
+                parts[str(part['PartNumber'])] = part['ETag']
+            if not response.get('IsTruncated'):
+                return parts
+            requestArgs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def _runParallel(self, function, partNumbers):
+        if not partNumbers:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            futures = [executor.submit(function, partNumber) for partNumber in partNumbers]
+            errors = [future.exception() for future in futures]
+        finally:
+            executor.shutdown(wait=True)
+
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def _retry(self, function, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                if attempt >= self.maxRetries:
+                    raise
+                time.sleep(self.retryBackoff * (2 ** attempt))
+                attempt += 1
+
+    def _loadState(self, statePath, identity=None):
+        if not os.path.exists(statePath):
+            return None
+        try:
+            with open(statePath) as stateFile:
+                state = json.load(stateFile)
+        except ValueError:
+            return None
+
+        if identity is not None:
+            for name, value in identity.items():
+                if state.get(name) != value:
+                    return None
+        return state
+
+    def _saveState(self, statePath, state):
+        fileDescriptor, tempPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(statePath)))
+        with os.fdopen(fileDescriptor, 'w') as outFile:
+            json.dump(state, outFile)
+        os.rename(tempPath, statePath)
+
+    def _removeState(self, statePath):
+        if os.path.exists(statePath):
+            os.remove(statePath)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark do tempo de importação de cada wrapper da biblioteca.
+
+Cada medição roda em um interpretador novo, para que módulos já carregados
+não mascarem o custo real de inicialização. Uso:
+
+    python startup_benchmark.py [repetições]
+'''
+
+import os
+import subprocess
+import sys
+
+
+# Módulos medidos, na ordem do relatório
+benchmarkModules = [
+    'configuration',
+    'clientregistry',
+    'aws_s3',
+    'aws_emr',
+    'aws_ec2',
+    'aws_iam',
+    'aws_kinesis',
+    'aws_kinesis_firehose',
+    'aws_redshift',
+    'mail'
+]
+
+_measureScript = (
+    'import sys, time\n'
+    'sys.path.insert(0, %r)\n'
+    'start = time.time()\n'
+    'import %s\n'
+    'sys.stdout.write(repr(time.time() - start))\n'
+)
+
+
+def measureImportTime(moduleName, repetitions=5):
+    '''
+    Mede o tempo de importação de um módulo em interpretadores isolados.
+
+    :param moduleName: Nome do módulo a ser importado
+    :param repetitions: Número de execuções da medição
+
+    :return: Lista com os tempos medidos, em segundos
+    '''
+    currentLocation = os.path.dirname(os.path.realpath(__file__))
+    script = _measureScript % (currentLocation, moduleName)
+    timings = []
+    for _ in range(repetitions):
+        output = subprocess.check_output([sys.executable, '-c', script])
+        timings.append(float(output))
+    return timings
+
+
+def main(repetitions=5):
+    sys.stdout.write('%-24s %12s %12s\n' % ('modulo', 'min (ms)', 'mediana (ms)'))
+    for moduleName in benchmarkModules:
+        try:
+            timings = sorted(measureImportTime(moduleName, repetitions))
+        except subprocess.CalledProcessError:
+            sys.stdout.write('%-24s %12s\n' % (moduleName, 'falhou'))
+            continue
+        median = timings[len(timings) // 2]
+        sys.stdout.write('%-24s %12.2f %12.2f\n' % (moduleName, timings[0] * 1000, median * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Substitutos do S3 e do driver SQL usados nos testes, sem acesso à AWS nem ao
+Redshift.
+'''
+
+from redshiftpool import RedshiftConnectionPool
+from s3bulkoperations import BulkOperationReport
+
+import csv
+import gzip
+import io
+import sys
+import threading
+
+_PY2 = sys.version_info[0] == 2
+
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+
+
+def parseCsv(data):
+    '''
+    :return: Registros (listas de textos) de um CSV em UTF-8
+    '''
+    if _PY2:
+        return [[value.decode('utf-8') for value in row]
+                for row in csv.reader(io.BytesIO(data))]
+    return list(csv.reader(io.StringIO(data.decode('utf-8'))))
+
+
+class FakeS3Client(object):
+    '''
+    Cliente boto3 do S3 em memória (somente put_object e get_object).
+    '''
+
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self.lock:
+            self.objects[(Bucket, Key)] = Body
+        return {'ETag': '"etag"'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+class FakeS3(object):
+    '''
+    Substituto de AWSS3 com os métodos usados na carga e na exportação do Redshift.
+    '''
+
+    def __init__(self):
+        self.client = FakeS3Client()
+        self.deleted = []
+        # Chaves cujo envio falha
+        self.failingKeys = set()
+
+    def getKeys(self, bucketName, prefix=''):
+        with self.client.lock:
+            return sorted(key for bucket, key in self.client.objects
+                          if bucket == bucketName and key.startswith(prefix))
+
+    def getObject(self, bucketName, key):
+        with self.client.lock:
+            return self.client.objects[(bucketName, key)]
+
+    def upload(self, localPath, bucketName, key, resume=True, **kwargs):
+        if key in self.failingKeys:
+            raise IOError('Falha simulada no envio de %s' % key)
+        with open(localPath, 'rb') as inFile:
+            self.client.put_object(Bucket=bucketName, Key=key, Body=inFile.read())
+
+    def download(self, bucketName, key, localPath, resume=True, **kwargs):
+        with open(localPath, 'wb') as outFile:
+            outFile.write(self.getObject(bucketName, key))
+
+    def iterRecords(self, bucketName, key, recordFormat='lines', compression='auto', **kwargs):
+        data = self.getObject(bucketName, key)
+        if data[:2] == b'\x1f\x8b':
+            data = gunzip(data)
+        for row in parseCsv(data):
+            yield row
+
+    def deleteObjects(self, bucketName, items=None, **kwargs):
+        report = BulkOperationReport('delete')
+        with self.client.lock:
+            for key in items:
+                self.client.objects.pop((bucketName, key), None)
+                self.deleted.append(key)
+                report.addSuccess()
+        report.finish()
+        return report
+
+
+class FakeCursor(object):
+    '''
+    Cursor psycopg2 cujos resultados vêm do handler da conexão.
+    '''
+
+    def __init__(self, connection, name=None):
+        self.connection = connection
+        self.name = name
+        self.itersize = 2000
+        self.description = None
+        self.rowcount = -1
+        self.rows = []
+        self.fetchSizes = []
+
+    def execute(self, sql, parameters=None):
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8')
+        if parameters is not None:
+            sql = self.mogrify(sql, parameters).decode('utf-8')
+        self.connection.executed.append(sql)
+        result = self.connection.handler(self.connection, sql)
+        if result is None:
+            self.description, self.rows = None, []
+        else:
+            self.description, self.rows = result
+            self.rows = list(self.rows)
+        self.rowcount = len(self.rows)
+
+    def mogrify(self, sql, parameters=None):
+        values = []
+        for value in parameters or ():
+            if value is None:
+                values.append('NULL')
+            elif isinstance(value, (int, float)):
+                values.append(repr(value))
+            else:
+                if isinstance(value, bytes):
+                    value = value.decode('utf-8')
+                values.append("'%s'" % value.replace("'", "''"))
+        return (sql % tuple(values)).encode('utf-8')
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=None):
+        size = size or 1
+        self.fetchSizes.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def __iter__(self):
+        while self.rows:
+            yield self.rows.pop(0)
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+    '''
+    Conexão psycopg2 falsa. O handler recebe (conexão, sql) e devolve None ou a
+    tupla (description, registros) do comando; os comandos executados ficam em
+    executed.
+    '''
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda connection, sql: None)
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.autocommit = False
+        self.closed = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def createRedshift(connection):
+    '''
+    Instância de AWSRedshift cujo pool entrega sempre a conexão informada,
+    sem leitura de configuração nem cliente boto3.
+    '''
+    # Importação tardia: o módulo do Redshift só é carregado pelos testes que o usam
+    from aws_redshift import AWSRedshift
+
+    class FakeRedshift(AWSRedshift):
+        def __init__(self):
+            self.config = {'aws': {'redshift': {}}}
+            self.awsCredentials = ('AKIAFAKE', 'secret', 'us-east-1')
+            self.pool = RedshiftConnectionPool(lambda: connection, minSize=0, maxSize=1)
+
+    return FakeRedshift()
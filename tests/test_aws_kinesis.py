@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aws_kinesis import AWSKinesis
+from kinesismetrics import KinesisMetrics
+
+MAX_HASH_KEY = 2 ** 128 - 1
+
+
+class FakeKinesisClient(object):
+    '''
+    Cliente boto3 do Kinesis com shards configuráveis; put_record devolve o
+    ShardId informado em putShardId.
+    '''
+
+    def __init__(self, shardIds):
+        self.setShards(shardIds)
+        self.putShardId = shardIds[0]
+        self.listingError = None
+        self.listings = 0
+
+    def setShards(self, shardIds):
+        step = (MAX_HASH_KEY + 1) // len(shardIds)
+        self.shards = [{'ShardId': shardId,
+                        'HashKeyRange': {'StartingHashKey': str(index * step),
+                                         'EndingHashKey': str(MAX_HASH_KEY if index == len(shardIds) - 1
+                                                              else (index + 1) * step - 1)},
+                        'SequenceNumberRange': {'StartingSequenceNumber': '1'}}
+                       for index, shardId in enumerate(shardIds)]
+
+    def describe_stream(self, StreamName, **kwargs):
+        self.listings += 1
+        if self.listingError is not None:
+            raise self.listingError
+        return {'StreamDescription': {'Shards': list(self.shards), 'HasMoreShards': False}}
+
+    def put_record(self, **kwargs):
+        return {'ShardId': self.putShardId, 'SequenceNumber': '1'}
+
+
+def createKinesis(client):
+    class FakeKinesis(AWSKinesis):
+        def __init__(self):
+            self.config = {'aws': {'kinesis': {'stream_name': 'stream'}}}
+            self.partitioners = {}
+            self.metrics = KinesisMetrics()
+            self.client = client
+
+    return FakeKinesis()
+
+
+class PartitionerRefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeKinesisClient(['shard-0', 'shard-1'])
+        self.kinesis = createKinesis(self.client)
+        self.partitioner = self.kinesis.enablePartitioner('stream')
+
+    def testUnknownShardDoesNotFailPut(self):
+        # Reshard: o envio cai em um shard novo e a listagem dos shards falha
+        self.client.putShardId = 'shard-2'
+        self.client.listingError = RuntimeError('LimitExceededException')
+        listings = self.client.listings
+
+        response = self.kinesis.putRecord(b'dados', 'stream', 'chave')
+        self.assertEqual(response['ShardId'], 'shard-2')
+        # A recarga não acontece dentro do envio
+        self.assertEqual(self.client.listings, listings)
+        self.assertTrue(self.partitioner.stale)
+
+        # A recarga seguinte falha, mas o envio continua
+        response = self.kinesis.putRecord(b'dados', 'stream', 'chave')
+        self.assertEqual(response['ShardId'], 'shard-2')
+        self.assertEqual(self.client.listings, listings + 1)
+        self.assertTrue(self.partitioner.stale)
+
+        # Com a listagem de volta, o índice é recarregado
+        self.client.listingError = None
+        self.client.setShards(['shard-2', 'shard-3'])
+        self.partitioner.retryAfter = 0
+        self.kinesis.putRecord(b'dados', 'stream', 'chave')
+        self.assertFalse(self.partitioner.stale)
+        self.assertEqual([item['ShardId'] for item in self.partitioner.getShardStats()],
+                         ['shard-2', 'shard-3'])
+
+    def testUnknownShardInPutRecords(self):
+        self.client.put_records = lambda **kwargs: {
+            'FailedRecordCount': 0,
+            'Records': [{'ShardId': 'shard-9', 'SequenceNumber': '1'}] * len(kwargs['Records'])}
+        self.client.listingError = RuntimeError('LimitExceededException')
+
+        response = self.kinesis.putRecords([{'Data': b'a', 'PartitionKey': 'k'}], 'stream')
+        self.assertEqual(response['FailedRecordCount'], 0)
+        self.assertTrue(self.partitioner.stale)
+
+
+if __name__ == '__main__':
+    unittest.main()
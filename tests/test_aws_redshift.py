@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fakes import FakeConnection
+from tests.fakes import createRedshift
+
+
+class ExecuteBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.redshift = createRedshift(self.connection)
+
+    def getValueCounts(self):
+        return [sql.count('(') for sql in self.connection.executed]
+
+    def testSplitByPageSize(self):
+        rowCount = self.redshift.executeBatch('insert into t values %s',
+                                              [(index, 'a') for index in range(7)], pageSize=3)
+
+        self.assertEqual(rowCount, 7)
+        self.assertEqual(self.getValueCounts(), [3, 3, 1])
+        self.assertEqual(self.connection.executed[0],
+                         "insert into t values (0, 'a'),(1, 'a'),(2, 'a')")
+        self.assertEqual(self.connection.executed[2], "insert into t values (6, 'a')")
+        # Uma única transação, confirmada ao final
+        self.assertEqual(self.connection.commits, 1)
+
+    def testSplitByMaxBatchBytes(self):
+        # Prefixo de 21 bytes e registros de 17 bytes, separados por vírgula:
+        # cabem exatamente 3 registros em 74 bytes
+        parameterList = [(index, 'a' * 10) for index in range(7)]
+        rowCount = self.redshift.executeBatch('insert into t values %s', parameterList,
+                                              maxBatchBytes=74)
+
+        self.assertEqual(rowCount, 7)
+        self.assertEqual(self.getValueCounts(), [3, 3, 1])
+        self.assertEqual([len(sql.encode('utf-8')) for sql in self.connection.executed],
+                         [74, 74, 38])
+
+    def testOversizedRowIsSentAlone(self):
+        parameterList = [(1, 'a'), (2, 'b' * 100), (3, 'c')]
+        rowCount = self.redshift.executeBatch('insert into t values %s', parameterList,
+                                              maxBatchBytes=50)
+
+        self.assertEqual(rowCount, 3)
+        self.assertEqual(self.getValueCounts(), [1, 1, 1])
+
+    def testCommitPerBatch(self):
+        self.redshift.executeBatch('insert into t values %s', [(index,) for index in range(5)],
+                                   pageSize=2, commitPerBatch=True)
+
+        self.assertEqual(self.getValueCounts(), [2, 2, 1])
+        self.assertEqual(self.connection.commits, 4)
+
+    def testTemplateSuffixAndLiteralPercent(self):
+        self.redshift.executeBatch(
+            "insert into t select * from (values %s) v (a, b) where b not like 'x%%'",
+            [(1, u"d'é"), (2, None)], template='(%s, lower(%s))')
+
+        self.assertEqual(self.connection.executed, [
+            u"insert into t select * from (values (1, lower('d''é')),(2, lower(NULL))) v (a, b) "
+            u"where b not like 'x%'"])
+
+    def testEmptyParameterList(self):
+        self.assertEqual(self.redshift.executeBatch('insert into t values %s', []), 0)
+        self.assertEqual(self.connection.executed, [])
+
+    def testInvalidPlaceholders(self):
+        self.assertRaises(ValueError, self.redshift.executeBatch,
+                          'insert into t values (%s, %s)', [(1, 2)])
+        self.assertRaises(ValueError, self.redshift.executeBatch, 'insert into t', [(1,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kinesisconsumer import KinesisConsumer
+
+import shutil
+import tempfile
+
+
+class FakeKinesis(object):
+    '''
+    Substituto de AWSKinesis: lista os shards informados e devolve o tipo do
+    iterador solicitado no lugar do iterador.
+    '''
+
+    config = {'aws': {'kinesis': {'stream_name': 'stream'}}}
+
+    def __init__(self, shardList):
+        self.shardList = shardList
+
+    def getShardList(self, streamName=None, getOnlyOpenedShards=True):
+        return list(self.shardList)
+
+    def getShardIterator(self, shardId, shardIteratorType, sequenceNumber=None, streamName=None):
+        return shardIteratorType
+
+
+class KinesisConsumerPositionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.kinesis = FakeKinesis([{'ShardId': 'shard-0'}])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def createConsumer(self):
+        return KinesisConsumer(self.kinesis, lambda shardId, records: None, 'app',
+                               checkpointPath=os.path.join(self.tempDir, 'checkpoints.db'),
+                               initialPosition='LATEST')
+
+    def testChildShardsStartAtTrimHorizon(self):
+        consumer = self.createConsumer()
+        self.assertEqual(consumer._getReadyShards(), ['shard-0'])
+        self.assertEqual(consumer._getIterator('shard-0'), 'LATEST')
+
+        # Split: o pai é lido até o fim e os filhos passam a ser lidos
+        self.kinesis.shardList = [{'ShardId': 'shard-0'},
+                                  {'ShardId': 'shard-1', 'ParentShardId': 'shard-0'},
+                                  {'ShardId': 'shard-2', 'ParentShardId': 'shard-0'}]
+        self.assertEqual(consumer._getReadyShards(), ['shard-0'])
+        consumer.checkpoints.setCheckpoint('app', 'stream', 'shard-0', '10', finished=True)
+
+        self.assertEqual(consumer._getReadyShards(), ['shard-1', 'shard-2'])
+        self.assertEqual(consumer._getIterator('shard-1'), 'TRIM_HORIZON')
+        self.assertEqual(consumer._getIterator('shard-2'), 'TRIM_HORIZON')
+
+    def testChildOfFinishedParentOnRestart(self):
+        self.kinesis.shardList = [{'ShardId': 'shard-0'},
+                                  {'ShardId': 'shard-1', 'ParentShardId': 'shard-0'},
+                                  {'ShardId': 'shard-2'}]
+        consumer = self.createConsumer()
+        consumer.checkpoints.setCheckpoint('app', 'stream', 'shard-0', '10', finished=True)
+
+        self.assertEqual(consumer._getReadyShards(), ['shard-1', 'shard-2'])
+        self.assertEqual(consumer._getIterator('shard-1'), 'TRIM_HORIZON')
+        self.assertEqual(consumer._getIterator('shard-2'), 'LATEST')
+
+    def testCheckpointWins(self):
+        consumer = self.createConsumer()
+        consumer.checkpoints.setCheckpoint('app', 'stream', 'shard-0', '10')
+
+        self.assertEqual(consumer._getReadyShards(), ['shard-0'])
+        self.assertEqual(consumer._getIterator('shard-0'), 'AFTER_SEQUENCE_NUMBER')
+
+
+if __name__ == '__main__':
+    unittest.main()
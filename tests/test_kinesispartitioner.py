@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kinesisaggregation import getHashKey
+from kinesispartitioner import KinesisPartitioner
+from kinesispartitioner import MODE_HASH
+
+MAX_HASH_KEY = 2 ** 128 - 1
+
+
+class FakeKinesis(object):
+    '''
+    Substituto de AWSKinesis que lista shards com faixas (início, fim) fixas.
+    '''
+
+    def __init__(self, shardRanges):
+        self.shardRanges = shardRanges
+
+    def getShardList(self, streamName=None):
+        return [{'ShardId': shardId,
+                 'HashKeyRange': {'StartingHashKey': str(startKey),
+                                  'EndingHashKey': str(endKey)}}
+                for shardId, startKey, endKey in self.shardRanges]
+
+
+# Split desigual: shard-0 com 3/4 do espaço de hash
+SHARD_RANGES = [('shard-0', 0, MAX_HASH_KEY // 4 * 3), ('shard-1', MAX_HASH_KEY // 4 * 3 + 1,
+                                                         MAX_HASH_KEY)]
+
+
+class KinesisPartitionerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.partitioner = KinesisPartitioner(FakeKinesis(SHARD_RANGES), 'stream')
+
+    def getShard(self, partitionKey):
+        return self.partitioner.getShardId(int(self.partitioner.getExplicitHashKey(partitionKey)))
+
+    def testBalancedSpreadsKeysEvenly(self):
+        shards = [self.getShard('chave-%d' % index) for index in range(100)]
+
+        self.assertEqual(shards.count('shard-0'), 50)
+        self.assertEqual(shards.count('shard-1'), 50)
+
+    def testBalancedKeysStayPinned(self):
+        first = dict((key, self.getShard(key)) for key in ('a', 'b', 'c', 'd'))
+        self.partitioner.recordPut(first['a'], recordCount=1000)
+
+        self.assertEqual(dict((key, self.getShard(key)) for key in first), first)
+
+    def testNewKeysGoToLeastLoadedShard(self):
+        self.partitioner.recordPut('shard-0', recordCount=10)
+
+        self.assertEqual([self.getShard('k%d' % index) for index in range(3)], ['shard-1'] * 3)
+
+    def testAssignedKeysAreBounded(self):
+        partitioner = KinesisPartitioner(FakeKinesis(SHARD_RANGES), 'stream', maxAssignedKeys=2)
+        for key in ('a', 'b', 'a', 'c'):
+            partitioner.getExplicitHashKey(key)
+
+        self.assertEqual(list(partitioner.assignedKeys), ['a', 'c'])
+
+    def testKeylessRoundRobinAndPinnedKeys(self):
+        self.assertEqual([self.getShard(None) for _ in range(4)],
+                         ['shard-0', 'shard-1', 'shard-0', 'shard-1'])
+
+        self.partitioner.pinKey('fixa', 'shard-1')
+        self.partitioner.recordPut('shard-1', recordCount=1000)
+        self.assertEqual(self.getShard('fixa'), 'shard-1')
+
+    def testHashModeKeepsDefaultRouting(self):
+        partitioner = KinesisPartitioner(FakeKinesis(SHARD_RANGES), 'stream', mode=MODE_HASH)
+
+        self.assertIsNone(partitioner.getExplicitHashKey('chave'))
+        self.assertEqual(partitioner.getShardForKey('chave'),
+                         partitioner.getShardId(getHashKey('chave')))
+
+
+if __name__ == '__main__':
+    unittest.main()
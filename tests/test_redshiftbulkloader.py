@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redshiftbulkloader import DEFAULT_PART_COUNT
+from redshiftbulkloader import RedshiftBulkLoader
+from redshiftbulkloader import formatCsvRows
+from tests.fakes import FakeConnection
+from tests.fakes import FakeS3
+from tests.fakes import createRedshift
+from tests.fakes import gunzip
+from tests.fakes import parseCsv
+
+import datetime
+import decimal
+import json
+
+
+AUTHORIZATION = "IAM_ROLE 'arn:aws:iam::123:role/copy'"
+
+
+class CopyHandler(object):
+    '''
+    Executa os comandos do teste: número de slices e COPY (registrado, ou com
+    falha simulada).
+    '''
+
+    def __init__(self, sliceCount=2, failCopy=False):
+        self.sliceCount = sliceCount
+        self.failCopy = failCopy
+        self.copies = []
+
+    def __call__(self, connection, sql):
+        if 'stv_slices' in sql:
+            if self.sliceCount is None:
+                raise RuntimeError('Sem acesso a stv_slices')
+            return [('count', 20)], [(self.sliceCount,)]
+        if sql.startswith('COPY'):
+            if self.failCopy:
+                raise RuntimeError('Falha simulada no COPY')
+            self.copies.append(sql)
+        return None
+
+
+class FormatCsvRowsTest(unittest.TestCase):
+
+    def testNullMarkerAndQuoting(self):
+        data = formatCsvRows([(1, None, 'a,b'), (2, 'x"y', '')])
+        self.assertEqual(data, b'1,\\N,"a,b"\n2,"x""y",""\n')
+
+    def testLiteralNullMarkerIsQuoted(self):
+        data = formatCsvRows([(u'\\N', None)])
+        self.assertEqual(data, b'"\\N",\\N\n')
+
+    def testNumbersAreNotQuoted(self):
+        data = formatCsvRows([(1, 2.5, decimal.Decimal('3.10'), datetime.date(2020, 1, 2))])
+        self.assertEqual(data, b'1,2.5,3.10,"2020-01-02"\n')
+
+    def testUnicode(self):
+        data = formatCsvRows([(u'vé', u'ção')], delimiter='|')
+        self.assertEqual(data, u'"vé"|"ção"\n'.encode('utf-8'))
+
+
+class RedshiftBulkLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.s3 = FakeS3()
+        self.handler = CopyHandler()
+        self.connection = FakeConnection(self.handler)
+        self.redshift = createRedshift(self.connection)
+
+    def createLoader(self, **kwargs):
+        kwargs.setdefault('stagingPrefix', 'staging/')
+        kwargs.setdefault('authorization', AUTHORIZATION)
+        return RedshiftBulkLoader(self.redshift, self.s3, 'bucket', **kwargs)
+
+    def readParts(self, manifest):
+        rows = []
+        for entry in manifest['entries']:
+            key = entry['url'][len('s3://bucket/'):]
+            rows.extend(parseCsv(gunzip(self.s3.getObject('bucket', key))))
+        return rows
+
+    def testPartAndManifestLayout(self):
+        loader = self.createLoader(numParts=3, chunkRows=2, cleanup=False)
+        result = loader.load('vendas', [(index, 'x') for index in range(11)], ['id', 'valor'])
+
+        self.assertEqual(result['rows'], 11)
+        self.assertEqual(result['parts'], 3)
+        keys = self.s3.getKeys('bucket', 'staging/vendas/')
+        runPrefix = keys[0][:keys[0].rindex('/') + 1]
+        self.assertEqual(keys, [runPrefix + name for name in
+                                ('manifest', 'part_0000.csv.gz', 'part_0001.csv.gz',
+                                 'part_0002.csv.gz')])
+
+        manifest = json.loads(self.s3.getObject('bucket', runPrefix + 'manifest').decode('utf-8'))
+        self.assertEqual([entry['url'] for entry in manifest['entries']],
+                         ['s3://bucket/%s' % key for key in keys[1:]])
+        for entry, key in zip(manifest['entries'], keys[1:]):
+            self.assertTrue(entry['mandatory'])
+            self.assertEqual(entry['meta']['content_length'],
+                             len(self.s3.getObject('bucket', key)))
+
+        # Blocos de chunkRows registros distribuídos em rodízio entre as partes
+        self.assertEqual(parseCsv(gunzip(self.s3.getObject('bucket', keys[1]))),
+                         [['0', 'x'], ['1', 'x'], ['6', 'x'], ['7', 'x']])
+        self.assertEqual(sorted(int(row[0]) for row in self.readParts(manifest)),
+                         list(range(11)))
+
+    def testGzipCsvEncoding(self):
+        loader = self.createLoader(numParts=1, cleanup=False)
+        loader.load('t', [(1, None, u'vé,"ção"'), (2, u'', None)])
+
+        key = self.s3.getKeys('bucket', 'staging/t/')[1]
+        data = gunzip(self.s3.getObject('bucket', key))
+        self.assertEqual(data, u'1,\\N,"vé,""ção"""\n2,"",\\N\n'.encode('utf-8'))
+
+    def testCopySql(self):
+        loader = self.createLoader(numParts=2, cleanup=False)
+        loader.load('public.vendas', [(1, 2)], ['id', 'valor'], copyOptions='TRUNCATECOLUMNS')
+
+        manifestKey = [key for key in self.s3.getKeys('bucket') if key.endswith('manifest')][0]
+        self.assertEqual(self.handler.copies, [
+            "COPY public.vendas (id, valor) FROM 's3://bucket/%s' %s MANIFEST CSV GZIP "
+            "NULL AS '\\\\N' TIMEFORMAT 'auto' DATEFORMAT 'auto' TRUNCATECOLUMNS" %
+            (manifestKey, AUTHORIZATION)])
+        self.assertEqual(self.connection.commits, 1)
+
+    def testEmptyPartsAreSkipped(self):
+        loader = self.createLoader(numParts=4, chunkRows=10, cleanup=False)
+        result = loader.load('t', iter([(1,), (2,)]))
+
+        self.assertEqual(result['parts'], 1)
+        self.assertEqual(len(self.s3.getKeys('bucket')), 2)
+
+    def testChunksFillEveryPart(self):
+        loader = self.createLoader(numParts=16, cleanup=False)
+        result = loader.load('t', [(index,) for index in range(40)])
+
+        self.assertEqual(result['parts'], 16)
+        self.assertEqual(result['rows'], 40)
+
+    def testChunksWithUnknownRowCount(self):
+        loader = self.createLoader(numParts=4, cleanup=False)
+        result = loader.load('t', ((index,) for index in range(2000)))
+        self.assertEqual(result['parts'], 4)
+
+        self.s3 = FakeS3()
+        loader = self.createLoader(numParts=4, cleanup=False)
+        result = loader.load('t', ((index,) for index in range(2000)), expectedRows=100000)
+        self.assertEqual(result['parts'], 1)
+
+    def testNoRows(self):
+        result = self.createLoader(numParts=2).load('t', [])
+
+        self.assertEqual(result['rows'], 0)
+        self.assertEqual(self.handler.copies, [])
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+
+    def testPartCountFromSlices(self):
+        self.handler.sliceCount = 3
+        self.assertEqual(self.createLoader().load('t', [(1,)] * 10, [])['parts'], 3)
+        self.assertEqual(len(self.s3.deleted), 4)
+        self.assertEqual(self.createLoader()._getPartCount(), 3)
+
+        self.handler.sliceCount = None
+        self.assertEqual(self.createLoader()._getPartCount(), DEFAULT_PART_COUNT)
+
+    def testCleanupAfterCopy(self):
+        self.createLoader(numParts=2, chunkRows=1).load('t', [(1,), (2,)])
+
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+        self.assertEqual(len(self.s3.deleted), 3)
+
+    def testCleanupOnCopyFailure(self):
+        self.handler.failCopy = True
+        loader = self.createLoader(numParts=2, chunkRows=1)
+
+        self.assertRaises(RuntimeError, loader.load, 't', [(1,), (2,)])
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+        self.assertEqual(len(self.s3.deleted), 3)
+
+    def testCleanupOnUploadFailure(self):
+        loader = self.createLoader(numParts=3, chunkRows=1)
+        originalUpload = self.s3.upload
+
+        def upload(localPath, bucketName, key, **kwargs):
+            if key.endswith('part_0001.csv.gz'):
+                raise IOError('Falha simulada no envio')
+            originalUpload(localPath, bucketName, key, **kwargs)
+
+        self.s3.upload = upload
+        self.assertRaises(IOError, loader.load, 't', [(1,), (2,), (3,)])
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+        self.assertEqual(sorted(key.rsplit('/', 1)[1] for key in self.s3.deleted),
+                         ['part_0000.csv.gz', 'part_0002.csv.gz'])
+        self.assertEqual(self.handler.copies, [])
+
+    def testMissingAuthorization(self):
+        loader = self.createLoader(numParts=1, authorization=None)
+
+        self.assertRaises(ValueError, loader.load, 't', [(1,)])
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
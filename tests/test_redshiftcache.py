@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redshiftcache import RedshiftQueryCache
+from redshiftcache import SPILL_SUFFIX
+from redshiftcache import getReferencedNames
+from redshiftcache import getWrittenTables
+from redshiftcache import isCacheableQuery
+from redshiftcache import normalizeSql
+from tests.fakes import FakeConnection
+from tests.fakes import createRedshift
+
+import shutil
+import tempfile
+import threading
+
+
+class SqlParsingTest(unittest.TestCase):
+
+    def testNormalizeSql(self):
+        self.assertEqual(normalizeSql("SELECT  *\n FROM T\twhere b = 'Ab  C';"),
+                         "select * from t where b = 'Ab  C'")
+
+    def testWrittenTables(self):
+        self.assertEqual(getWrittenTables('INSERT INTO public."Vendas" (a) values (1)'),
+                         set(['vendas']))
+        self.assertEqual(getWrittenTables("update a set x = 1; delete from s.b where y = "
+                                          "'insert into c'"), set(['a', 'b']))
+        self.assertEqual(getWrittenTables('drop table if exists a, s.b'), set(['a', 'b']))
+        self.assertEqual(getWrittenTables('create temp table if not exists t (a int)'),
+                         set(['t']))
+        self.assertEqual(getWrittenTables("copy t from 's3://b/k' iam_role 'r'"), set(['t']))
+        self.assertEqual(getWrittenTables('truncate t; select count(*) from t'), set(['t']))
+        self.assertEqual(getWrittenTables('select 1'), set())
+
+    def testUnrecognizedWrite(self):
+        self.assertIsNone(getWrittenTables('grant select on t to u'))
+        self.assertIsNone(getWrittenTables('insert into a values (1); vacuum'))
+
+    def testCacheableQuery(self):
+        self.assertTrue(isCacheableQuery('SELECT 1'))
+        self.assertTrue(isCacheableQuery('(select a from t) union (select a from u)'))
+        self.assertTrue(isCacheableQuery("with x as (select 1) select * from x"))
+        self.assertTrue(isCacheableQuery("select 'insert into' from t"))
+        self.assertFalse(isCacheableQuery('with x as (select 1) insert into t select * from x'))
+        self.assertFalse(isCacheableQuery('select * into u from t'))
+        self.assertFalse(isCacheableQuery('select 1; select 2'))
+        self.assertFalse(isCacheableQuery('delete from t'))
+
+    def testReferencedNames(self):
+        names = getReferencedNames('select a.x from s.t1 a join "T2" b on a.id = b.id '
+                                   "where c = 't3'")
+        self.assertTrue(set(['s', 't1', 't2', 'x', 'id', 'c']) <= names)
+        self.assertNotIn('t3', names)
+        self.assertNotIn('select', names)
+
+
+class RedshiftQueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = RedshiftQueryCache(maxBytes=10 * 1024 * 1024, ttl=60.0)
+        self.loads = 0
+
+    def load(self, value):
+        def loader():
+            self.loads += 1
+            return value
+        return loader
+
+    def testHitAfterNormalization(self):
+        self.assertEqual(self.cache.getOrLoad('select * from t', None, self.load([(1,)])), [(1,)])
+        self.assertEqual(self.cache.getOrLoad('SELECT *\n  FROM t;', None, self.load([(2,)])),
+                         [(1,)])
+        self.assertEqual(self.cache.getOrLoad('select * from t', (1,), self.load([(3,)])),
+                         [(3,)])
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(self.cache.getStats()['hits'], 1)
+
+    def testInvalidateStatement(self):
+        self.cache.getOrLoad('select * from t join u using (id)', None, self.load([(1,)]))
+        self.cache.getOrLoad('select * from v', None, self.load([(2,)]))
+
+        self.assertEqual(self.cache.invalidateStatement('delete from public.u'), 1)
+        self.assertEqual(self.cache.getStats()['entries'], 1)
+        # Comando não reconhecido invalida todo o cache
+        self.assertEqual(self.cache.invalidateStatement('vacuum'), 1)
+        self.assertEqual(self.cache.getStats()['entries'], 0)
+
+    def testInvalidationDuringLoad(self):
+        started = threading.Event()
+        invalidated = threading.Event()
+
+        def loader():
+            started.set()
+            invalidated.wait(5)
+            return [(1,)]
+
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(self.cache.getOrLoad('select * from t', None, loader)))
+        thread.start()
+        started.wait(5)
+        self.cache.invalidateTables(['public.t'])
+        invalidated.set()
+        thread.join(5)
+
+        # O resultado lido antes da invalidação é devolvido, mas não armazenado
+        self.assertEqual(results, [[(1,)]])
+        self.assertEqual(self.cache.get(self.cache.getKey('select * from t')), (False, None))
+
+    def testClearDuringLoad(self):
+        def loader():
+            self.cache.clear()
+            return [(1,)]
+
+        self.cache.getOrLoad('select * from t', None, loader)
+        self.assertEqual(self.cache.getStats()['entries'], 0)
+
+    def testUnrelatedInvalidationDuringLoad(self):
+        def loader():
+            self.cache.invalidateTables(['u'])
+            return [(1,)]
+
+        self.cache.getOrLoad('select * from t', None, loader)
+        self.assertEqual(self.cache.getStats()['entries'], 1)
+
+    def testExpiration(self):
+        self.cache.ttl = -1
+        self.cache.getOrLoad('select 1', None, self.load([(1,)]))
+        self.cache.getOrLoad('select 1', None, self.load([(1,)]))
+
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(self.cache.getStats()['expirations'], 1)
+
+    def testSpillToDisk(self):
+        spillDir = tempfile.mkdtemp()
+        try:
+            cache = RedshiftQueryCache(maxBytes=1500, ttl=60.0, spillDir=spillDir)
+            for index in range(3):
+                cache.getOrLoad('select * from t where a = %d' % index, None,
+                                self.load([('x' * 500,)]))
+
+            stats = cache.getStats()
+            self.assertEqual(stats['spills'], 1)
+            self.assertEqual(len([name for name in os.listdir(spillDir)
+                                  if name.endswith(SPILL_SUFFIX)]), 1)
+            self.assertEqual(cache.getOrLoad('select * from t where a = 0', None,
+                                             self.load(None)), [('x' * 500,)])
+            self.assertEqual(cache.getStats()['diskHits'], 1)
+            self.assertEqual(self.loads, 3)
+
+            cache.clear()
+            self.assertEqual(os.listdir(spillDir), [])
+        finally:
+            shutil.rmtree(spillDir)
+
+
+class RedshiftQueryCacheIntegrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = FakeConnection(
+            lambda connection, sql: ([('a', 23)], [(1,), (2,)]) if sql.startswith('select') else None)
+        self.redshift = createRedshift(self.connection)
+        self.redshift.enableQueryCache()
+
+    def countQueries(self):
+        return len([sql for sql in self.connection.executed if sql.startswith('select')])
+
+    def testExecuteQueryUsesCache(self):
+        self.assertEqual(self.redshift.executeQuery('select a from t'), [(1,), (2,)])
+        self.assertEqual(self.redshift.executeQuery('SELECT a FROM t'), [(1,), (2,)])
+        self.assertEqual(self.redshift.executeQuery('select a from t', useCache=False), [(1,), (2,)])
+        self.assertEqual(self.countQueries(), 2)
+
+    def testWritesInvalidate(self):
+        self.redshift.executeQuery('select a from t')
+        self.redshift.executeCommand('insert into t values (3)')
+        self.redshift.executeQuery('select a from t')
+        self.assertEqual(self.countQueries(), 2)
+
+        self.redshift.executeBatch('insert into t values %s', [(4,)])
+        self.redshift.executeQuery('select a from t')
+        self.assertEqual(self.countQueries(), 3)
+
+        self.redshift.executeCommand('insert into u values (1)')
+        self.redshift.executeQuery('select a from t')
+        self.assertEqual(self.countQueries(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redshiftcolumnar import fetchColumnar
+from redshiftcolumnar import getColumnDtype
+from tests.fakes import FakeConnection
+
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class _FixedOffset(datetime.tzinfo):
+    def __init__(self, hours):
+        self.offset = datetime.timedelta(hours=hours)
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+
+DESCRIPTION = [('id', 23), ('valor', 701), ('ativo', 16), ('dia', 1082), ('nome', 1043)]
+ROWS = [(1, 1.5, True, datetime.date(2020, 1, 1), u'a'),
+        (2, None, False, datetime.date(2020, 1, 2), None),
+        (3, 3.5, None, None, u'ç')]
+
+
+def executeQuery(description, rows):
+    cursor = FakeConnection(lambda connection, sql: (description, rows)).cursor()
+    cursor.execute('select 1')
+    return cursor
+
+
+@unittest.skipIf(numpy is None, 'NumPy não instalado')
+class FetchColumnarTest(unittest.TestCase):
+
+    def testColumnTypes(self):
+        result = fetchColumnar(executeQuery(DESCRIPTION, ROWS))
+
+        self.assertEqual(result['id'].dtype, numpy.dtype('int32'))
+        self.assertEqual(result['valor'].dtype, numpy.dtype('float64'))
+        self.assertEqual(result['ativo'].dtype, numpy.dtype('bool'))
+        self.assertEqual(result['dia'].dtype, numpy.dtype('datetime64[D]'))
+        self.assertEqual(result['nome'].dtype, numpy.dtype('object'))
+        self.assertEqual(getColumnDtype(12345), 'object')
+
+    def testNullMasks(self):
+        result = fetchColumnar(executeQuery(DESCRIPTION, ROWS))
+
+        self.assertFalse(isinstance(result['id'], numpy.ma.MaskedArray))
+        self.assertEqual(result['id'].tolist(), [1, 2, 3])
+        self.assertEqual(result['valor'].mask.tolist(), [False, True, False])
+        self.assertEqual(result['valor'].filled(-1).tolist(), [1.5, -1, 3.5])
+        self.assertEqual(result['ativo'].mask.tolist(), [False, False, True])
+        self.assertEqual(result['dia'].mask.tolist(), [False, False, True])
+        self.assertEqual(result['nome'].mask.tolist(), [False, True, False])
+        self.assertEqual(result['nome'][2], u'ç')
+
+    def testBatchesAndGrowth(self):
+        rows = [(index,) for index in range(7)]
+        for expectedRows in (None, 3, 100):
+            cursor = executeQuery([('id', 20)], rows)
+            result = fetchColumnar(cursor, batchSize=2, expectedRows=expectedRows)
+
+            self.assertEqual(result['id'].tolist(), list(range(7)))
+            self.assertEqual(len(result['id']), 7)
+            self.assertEqual(set(cursor.fetchSizes), set([2]))
+
+    def testEmptyResult(self):
+        result = fetchColumnar(executeQuery([('id', 20), ('nome', 25)], []))
+
+        self.assertEqual(len(result['id']), 0)
+        self.assertEqual(len(result['nome']), 0)
+
+    def testTimestampTzConvertedToUtc(self):
+        value = datetime.datetime(2020, 1, 1, 12, 0, tzinfo=_FixedOffset(-3))
+        result = fetchColumnar(executeQuery([('momento', 1184)], [(value,), (None,)]))
+
+        self.assertEqual(result['momento'][0], numpy.datetime64('2020-01-01T15:00:00'))
+        self.assertEqual(result['momento'].mask.tolist(), [False, True])
+
+    def testStructured(self):
+        result = fetchColumnar(executeQuery(DESCRIPTION, ROWS), structured=True)
+
+        self.assertEqual(result.dtype.names, ('id', 'valor', 'ativo', 'dia', 'nome'))
+        self.assertEqual(result['id'].tolist(), [1, 2, 3])
+        self.assertEqual(result['valor'].mask.tolist(), [False, True, False])
+        self.assertEqual(result['id'].mask.tolist(), [False, False, False])
+
+    def testCommandWithoutResult(self):
+        cursor = FakeConnection().cursor()
+        cursor.execute('delete from t')
+
+        self.assertRaises(ValueError, fetchColumnar, cursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redshiftbulkloader import formatCsvRows
+from redshiftunloader import RedshiftUnloader
+from tests.fakes import FakeConnection
+from tests.fakes import FakeS3
+from tests.fakes import createRedshift
+
+import gzip
+import io
+import json
+import re
+import shutil
+import tempfile
+
+
+AUTHORIZATION = "IAM_ROLE 'arn:aws:iam::123:role/unload'"
+ROWS = [[u'%d' % index, None if index % 3 == 0 else u'vé,"%d"' % index] for index in range(10)]
+
+
+def gzipData(data):
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as outFile:
+        outFile.write(data)
+    return output.getvalue()
+
+
+class UnloadHandler(object):
+    '''
+    Simula o UNLOAD: distribui ROWS entre partCount arquivos CSV (com NULL como
+    \\N) sob o prefixo de destino e grava o manifesto.
+    '''
+
+    def __init__(self, s3, partCount=3):
+        self.s3 = s3
+        self.partCount = partCount
+        self.unloads = []
+
+    def __call__(self, connection, sql):
+        if not sql.startswith('UNLOAD'):
+            return None
+        self.unloads.append(sql)
+        bucketName, prefix = re.search(r" TO 's3://([^/]+)/(\S+)' ", sql).groups()
+        entries = []
+        for index in range(self.partCount):
+            rows = ROWS[index::self.partCount]
+            data = formatCsvRows(rows)
+            key = '%s%04d_part_00' % (prefix, index)
+            if ' GZIP' in sql:
+                data = gzipData(data)
+                key += '.gz'
+            self.s3.client.put_object(Bucket=bucketName, Key=key, Body=data)
+            meta = {'content_length': len(data)}
+            # record_count só é gravado no manifesto com MANIFEST VERBOSE
+            if ' MANIFEST VERBOSE ' in sql:
+                meta['record_count'] = len(rows)
+            entries.append({'url': 's3://%s/%s' % (bucketName, key), 'meta': meta})
+        self.s3.client.put_object(Bucket=bucketName, Key=prefix + 'manifest',
+                                  Body=json.dumps({'entries': entries}).encode('utf-8'))
+        return None
+
+
+class RedshiftUnloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.s3 = FakeS3()
+        self.handler = UnloadHandler(self.s3)
+        self.connection = FakeConnection(self.handler)
+        self.redshift = createRedshift(self.connection)
+        self.localDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.localDir)
+
+    def createUnloader(self, **kwargs):
+        kwargs.setdefault('stagingPrefix', 'staging/')
+        kwargs.setdefault('authorization', AUTHORIZATION)
+        return RedshiftUnloader(self.redshift, self.s3, 'bucket', **kwargs)
+
+    def testUnloadSql(self):
+        manifest = self.createUnloader().unload("select * from t where a = 'x\\y'",
+                                                unloadOptions='MAXFILESIZE 256 MB')
+
+        prefix = manifest['manifestKey'][:-len('manifest')]
+        self.assertTrue(re.match(r'^staging/unload/[0-9a-f]{32}/part_$', prefix))
+        self.assertEqual(self.handler.unloads, [
+            "UNLOAD ('select * from t where a = \\'x\\\\y\\'') TO 's3://bucket/%s' %s "
+            "MANIFEST VERBOSE PARALLEL ON FORMAT CSV NULL AS '\\\\N' GZIP MAXFILESIZE 256 MB" %
+            (prefix, AUTHORIZATION)])
+        self.assertEqual(len(manifest['entries']), 3)
+        self.assertEqual(self.connection.commits, 1)
+
+    def testUnloadSqlFormats(self):
+        unloader = self.createUnloader(cleanup=False)
+        unloader.unload('select 1', compression=None)
+        self.assertTrue(self.handler.unloads[-1].endswith("FORMAT CSV NULL AS '\\\\N'"))
+
+        self.handler.partCount = 0
+        unloader.unload('select 1', fileFormat='parquet')
+        self.assertTrue(self.handler.unloads[-1].endswith('PARALLEL ON FORMAT PARQUET'))
+
+    def testInvalidArguments(self):
+        unloader = self.createUnloader()
+        self.assertRaises(ValueError, unloader.unload, 'select 1', fileFormat='orc')
+        self.assertRaises(ValueError, unloader.unload, 'select 1', compression='bzip2')
+        self.assertRaises(ValueError, self.createUnloader(authorization=None).unload, 'select 1')
+        self.assertEqual(self.handler.unloads, [])
+
+    def testExportToFile(self):
+        localPath = os.path.join(self.localDir, 'saida.csv')
+        report = self.createUnloader(maxWorkers=2).exportToFile('select * from t', localPath)
+
+        with open(localPath, 'rb') as inFile:
+            data = inFile.read()
+        # Arquivos concatenados na ordem do manifesto, com NULL como \N
+        expected = b''.join(formatCsvRows(ROWS[index::3]) for index in range(3))
+        self.assertEqual(data, expected)
+        self.assertEqual(report['parts'], 3)
+        self.assertEqual(report['rows'], len(ROWS))
+        self.assertEqual(report['bytes'], len(expected))
+        # Sem arquivos temporários no diretório de destino nem no S3
+        self.assertEqual(os.listdir(self.localDir), ['saida.csv'])
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+        self.assertEqual(len(self.s3.deleted), 4)
+
+    def testExportToFileUncompressed(self):
+        localPath = os.path.join(self.localDir, 'saida.csv')
+        self.createUnloader(cleanup=False).exportToFile('select * from t', localPath,
+                                                        compression=None)
+
+        with open(localPath, 'rb') as inFile:
+            self.assertEqual(len(inFile.read().splitlines()), len(ROWS))
+        self.assertEqual(len(self.s3.getKeys('bucket')), 4)
+
+    def testIterRows(self):
+        rows = list(self.createUnloader(batchSize=2, maxWorkers=2).iterRows('select * from t'))
+
+        self.assertEqual(sorted(rows, key=lambda row: int(row[0])), ROWS)
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+
+    def testIterRowsClosedEarly(self):
+        rows = self.createUnloader(batchSize=1, queueSize=1).iterRows('select * from t')
+        self.assertEqual(len(next(rows)), 2)
+        rows.close()
+
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+
+    def testIterRowsPartFailure(self):
+        unloader = self.createUnloader()
+        originalIterRecords = self.s3.iterRecords
+
+        def iterRecords(bucketName, key, *args, **kwargs):
+            if '0001_part' in key:
+                raise IOError('Falha simulada na leitura')
+            return originalIterRecords(bucketName, key, *args, **kwargs)
+
+        self.s3.iterRecords = iterRecords
+        self.assertRaises(IOError, list, unloader.iterRows('select * from t'))
+        self.assertEqual(self.s3.getKeys('bucket'), [])
+
+    def testExportQuery(self):
+        rows = list(self.redshift.exportQuery('select * from t', bucketName='bucket',
+                                              stagingPrefix='staging/', iamRole='arn:role',
+                                              s3=self.s3))
+
+        self.assertEqual(len(rows), len(ROWS))
+        self.assertIn("IAM_ROLE 'arn:role'", self.handler.unloads[0])
+
+        # Sem IAM role, o UNLOAD usa as credenciais de acesso
+        localPath = os.path.join(self.localDir, 'saida.csv')
+        self.redshift.exportQuery('select * from t', localPath, bucketName='bucket', s3=self.s3)
+        self.assertIn("ACCESS_KEY_ID 'AKIAFAKE' SECRET_ACCESS_KEY 'secret'",
+                      self.handler.unloads[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3inventory import S3InventoryIndex
+
+
+class FakePagedClient(object):
+    '''
+    Cliente boto3 do S3 cuja listagem devolve as páginas informadas, em ordem.
+    '''
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def list_objects_v2(self, **kwargs):
+        index = int(kwargs.get('ContinuationToken', 0))
+        page = dict(self.pages[index])
+        page['IsTruncated'] = index < len(self.pages) - 1
+        if page['IsTruncated']:
+            page['NextContinuationToken'] = str(index + 1)
+        return page
+
+
+class FakeS3(object):
+    def __init__(self, pages):
+        self.client = FakePagedClient(pages)
+
+
+def objects(*keys):
+    return {'Contents': [{'Key': key, 'ETag': '"%s"' % key, 'Size': 1} for key in keys]}
+
+
+class S3InventoryIndexTest(unittest.TestCase):
+
+    def refresh(self, pages):
+        self.index.s3 = FakeS3(pages)
+        return self.index.refresh('bucket')
+
+    def setUp(self):
+        self.index = S3InventoryIndex(FakeS3([]), ':memory:')
+
+    def tearDown(self):
+        self.index.close()
+
+    def testTruncatedPageWithoutContents(self):
+        self.refresh([objects('a', 'b'), objects('c', 'd')])
+
+        summary = self.refresh([objects('a', 'b'), {'CommonPrefixes': [{'Prefix': 'x/'}]},
+                                objects('c', 'd')])
+        self.assertEqual((summary['added'], summary['removed'], summary['modified']), (0, 0, 0))
+        self.assertEqual(summary['pages'], 3)
+        self.assertEqual(summary['pagesChanged'], 0)
+        self.assertEqual(self.index.getPrefixStats('bucket')['count'], 4)
+
+    def testChangesAcrossPages(self):
+        self.refresh([objects('a', 'b'), objects('c', 'd')])
+
+        summary = self.refresh([objects('a'), {}, objects('c', 'e')])
+        self.assertEqual((summary['added'], summary['removed']), (1, 2))
+        self.assertEqual(self.index.getPrefixStats('bucket')['count'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
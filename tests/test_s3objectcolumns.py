@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3objectcolumns import S3ObjectColumns
+from s3objectcolumns import TYPE_FILE
+from s3objectcolumns import TYPE_FOLDER
+
+
+class S3ObjectColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = S3ObjectColumns('bucket', 'dados/')
+        self.columns.extend([
+            (TYPE_FILE, 'dados/b.csv', 20, 'bbb'),
+            (TYPE_FOLDER, 'dados/pasta/', 0, None),
+            (TYPE_FILE, 'dados/a.csv', 10, 'aaa'),
+        ])
+
+    def testSortByEtagWithFolders(self):
+        self.assertEqual(self.columns.sortBy('etag').paths,
+                         ['dados/a.csv', 'dados/b.csv', 'dados/pasta/'])
+        self.assertEqual(self.columns.sortBy('etag', reverse=True).paths,
+                         ['dados/pasta/', 'dados/b.csv', 'dados/a.csv'])
+
+    def testSortBySize(self):
+        result = self.columns.sortBy('size')
+        self.assertEqual(result.paths, ['dados/pasta/', 'dados/a.csv', 'dados/b.csv'])
+        self.assertEqual(list(result.sizes), [0, 10, 20])
+        self.assertEqual(result.etags, [None, 'aaa', 'bbb'])
+
+    def testSortByInvalidColumn(self):
+        self.assertRaises(ValueError, self.columns.sortBy, 'type')
+
+
+if __name__ == '__main__':
+    unittest.main()
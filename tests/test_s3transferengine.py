@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3transferengine import MIN_PART_SIZE
+from s3transferengine import S3TransferEngine
+from s3transferengine import getPartSize
+
+import json
+import shutil
+import tempfile
+import s3transferengine
+
+MIB = 1024 * 1024
+
+
+class FakeMultipartClient(object):
+    '''
+    Cliente boto3 do S3 que registra as partes enviadas; upload_part falha na
+    parte informada em failPart.
+    '''
+
+    def __init__(self):
+        self.parts = {}
+        self.failPart = None
+        self.completed = None
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.failPart:
+            raise IOError('Falha simulada na parte %d' % PartNumber)
+        self.parts[PartNumber] = len(Body)
+        return {'ETag': '"etag-%d"' % PartNumber}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload['Parts']
+        return {'ETag': '"final"'}
+
+
+class PartSizeTest(unittest.TestCase):
+
+    def testPartSizeKeptWhenUnderPartLimit(self):
+        self.assertEqual(getPartSize(10 * MIB, 8 * MIB), 8 * MIB)
+        self.assertEqual(getPartSize(10000 * 8 * MIB, 8 * MIB), 8 * MIB)
+
+    def testPartSizeGrowsToWholeMiB(self):
+        self.assertEqual(getPartSize(10000 * 8 * MIB + 1, 8 * MIB), 9 * MIB)
+        self.assertEqual(getPartSize(5 * 1024 ** 4, 8 * MIB), 525 * MIB)
+
+
+class S3TransferEngineUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.localPath = os.path.join(self.tempDir, 'arquivo.bin')
+        with open(self.localPath, 'wb') as outFile:
+            outFile.truncate(12 * MIB)
+        self.client = FakeMultipartClient()
+        self.maxPartCount = s3transferengine.MAX_PART_COUNT
+        s3transferengine.MAX_PART_COUNT = 2
+
+    def tearDown(self):
+        s3transferengine.MAX_PART_COUNT = self.maxPartCount
+        shutil.rmtree(self.tempDir)
+
+    def testUploadRespectsPartLimit(self):
+        engine = S3TransferEngine(self.client, partSize=MIN_PART_SIZE, retryBackoff=0)
+        engine.upload(self.localPath, 'bucket', 'chave')
+
+        self.assertEqual(self.client.parts, {1: 6 * MIB, 2: 6 * MIB})
+        self.assertEqual([part['PartNumber'] for part in self.client.completed], [1, 2])
+
+    def testResumeStateKeepsEffectivePartSize(self):
+        engine = S3TransferEngine(self.client, partSize=MIN_PART_SIZE, maxWorkers=1,
+                                  maxRetries=0, retryBackoff=0)
+        self.client.failPart = 2
+
+        self.assertRaises(IOError, engine.upload, self.localPath, 'bucket', 'chave')
+        with open(self.localPath + '.s3upload') as stateFile:
+            state = json.load(stateFile)
+        self.assertEqual(state['partSize'], 6 * MIB)
+        self.assertEqual(list(state['parts']), ['1'])
+
+
+if __name__ == '__main__':
+    unittest.main()